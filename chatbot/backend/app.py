@@ -1,15 +1,17 @@
 # Flask API
 # 実行: python app.py
 # Flask を採用: 軽量で最小構成に適しているため
+# 同じ API の ASGI 版は asgi.py（処理本体は handlers.py で共通）
 
 import logging
-from flask import Flask, request, jsonify
+from typing import Any, Dict
+
+from flask import Flask, Response, request
 from flask_cors import CORS
 
 from config import config
-from content_repo import content_repo, ContentValidationError
-from chat_engine import chat_engine
-from search import search_engine
+from models import dumps
+import handlers
 
 # ロギング設定
 logging.basicConfig(
@@ -26,125 +28,58 @@ app = Flask(__name__)
 CORS(app, origins=config.CORS_ORIGINS)
 
 
+def json_response(payload: Dict[str, Any], status: int = 200) -> Response:
+    """JSON レスポンス（orjson があれば使用。jsonify の再エンコードを避ける）"""
+    return Response(dumps(payload), status=status, mimetype="application/json")
+
+
 # === 起動時初期化 ===
 
-def initialize():
-    """アプリケーション初期化"""
-    try:
-        content_repo.load()
-        search_engine.initialize()
-        logger.info("Application initialized successfully")
-    except ContentValidationError as e:
-        logger.error(f"Content validation failed: {e}")
-        raise
+initialize = handlers.initialize
 
 
 # === API エンドポイント ===
 
 @app.route(f"{config.API_PREFIX}/start", methods=["POST"])
 def start_chat():
-    """
-    チャットセッション開始
-    
-    Request:
-        {"screen_id": "yield_personal"}
-    
-    Response:
-        ChatResponse (see models.py)
-    """
-    try:
-        data = request.get_json() or {}
-        screen_id = data.get("screen_id", "global")
-        
-        response = chat_engine.start_session(screen_id)
-        return jsonify(response.to_dict())
-    
-    except Exception as e:
-        logger.exception("Error in start_chat")
-        return jsonify({
-            "success": False,
-            "error": {
-                "code": "INTERNAL_ERROR",
-                "message": content_repo.get_system_message("error") or "エラーが発生しました"
-            }
-        }), 500
+    """チャットセッション開始（handlers.handle_start）"""
+    payload, status = handlers.handle_start(request.get_json(silent=True) or {})
+    return json_response(payload, status)
 
 
 @app.route(f"{config.API_PREFIX}/step", methods=["POST"])
 def step_chat():
-    """
-    状態遷移
-    
-    Request:
-        {
-            "session_id": "uuid",
-            "action": "navigate|show_content|back|reset|search|free_text",
-            "target": "state_id or content_id",
-            "query": "search query (for action=search or free_text)"
-        }
-    
-    Response:
-        ChatResponse (see models.py)
-    """
-    try:
-        data = request.get_json() or {}
-        
-        session_id = data.get("session_id", "")
-        action = data.get("action", "")
-        target = data.get("target", "")
-        query = data.get("query", "")
-        
-        if not session_id:
-            return jsonify({
-                "success": False,
-                "error": {
-                    "code": "MISSING_SESSION_ID",
-                    "message": "session_id is required"
-                }
-            }), 400
-        
-        if not action:
-            return jsonify({
-                "success": False,
-                "error": {
-                    "code": "MISSING_ACTION",
-                    "message": "action is required"
-                }
-            }), 400
-        
-        response = chat_engine.step(session_id, action, target, query)
-        
-        # セッション切れの場合は 410 を返す
-        if not response.success and "SESSION" in response.message:
-            return jsonify(response.to_dict()), 410
-        
-        return jsonify(response.to_dict())
-    
-    except Exception as e:
-        logger.exception("Error in step_chat")
-        return jsonify({
-            "success": False,
-            "error": {
-                "code": "INTERNAL_ERROR",
-                "message": content_repo.get_system_message("error") or "エラーが発生しました"
-            }
-        }), 500
+    """状態遷移（handlers.handle_step）"""
+    payload, status = handlers.handle_step(request.get_json(silent=True) or {})
+    return json_response(payload, status)
+
+
+@app.route(f"{config.API_PREFIX}/step/batch", methods=["POST"])
+def step_batch():
+    """複数アクションの一括遷移（handlers.handle_step_batch）"""
+    payload, status = handlers.handle_step_batch(request.get_json(silent=True) or {})
+    return json_response(payload, status)
+
+
+@app.route(f"{config.API_PREFIX}/graph", methods=["GET"])
+def graph():
+    """画面内の遷移グラフ（handlers.handle_graph。ETag / Cache-Control 付き）"""
+    body, status, headers = handlers.handle_graph(request.args, request.headers.get("If-None-Match", ""))
+    return Response(body, status=status, headers=headers, mimetype="application/json")
 
 
 @app.route(f"{config.API_PREFIX}/health", methods=["GET"])
 def health_check():
     """ヘルスチェック"""
-    return jsonify({
-        "status": "ok",
-        "version": content_repo._data.get("meta", {}).get("version", "unknown")
-    })
+    payload, status = handlers.handle_health()
+    return json_response(payload, status)
 
 
 # === メイン ===
 
 if __name__ == "__main__":
     initialize()
-    
+
     # 開発サーバー起動
     # 本番では gunicorn などを使用すること
     app.run(
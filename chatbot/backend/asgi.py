@@ -0,0 +1,130 @@
+# ASGI API（Starlette）
+# 実行: uvicorn asgi:app --host 0.0.0.0 --port 5001
+# app.py（Flask）と同じ /start・/step・/step/batch・/graph・/health を提供する（処理本体は handlers.py）
+# 1 プロセスで多数のウィジェット接続を保持する用途向け
+# /step・/step/batch は検索（BM25F のスコア計算）・トークン署名・JSON エンコードを伴い
+# CPU を使うため、セッションストアによらず常にスレッドプールで実行する
+
+import contextlib
+import json
+import logging
+from typing import Tuple
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from config import config
+from models import dumps
+import handlers
+
+# ロギング設定
+logging.basicConfig(
+    level=getattr(logging, config.LOG_LEVEL),
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# ChatEngine は同期処理。/start は I/O を伴うセッションストア（redis）の場合のみ
+# スレッドプールで実行し、イベントループを塞がないようにする
+# （/step 系は常にスレッドプール。_step_response を参照）
+_OFFLOAD = config.SESSION_BACKEND.lower() == "redis"
+
+
+def json_response(payload, status: int = 200) -> Response:
+    """JSON レスポンス（orjson があれば使用）"""
+    return Response(dumps(payload), status_code=status, media_type="application/json")
+
+
+async def _read_json(request: Request) -> dict:
+    try:
+        data = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def _call(func, *args):
+    if _OFFLOAD:
+        return await run_in_threadpool(func, *args)
+    return func(*args)
+
+
+def _encode(func, data: dict) -> Tuple[bytes, int]:
+    """ハンドラの実行と JSON エンコード（スレッドプールで呼ぶ）"""
+    payload, status = func(data)
+    return dumps(payload), status
+
+
+async def _step_response(func, request: Request) -> Response:
+    """
+    /step 系のハンドラをスレッドプールで実行
+
+    検索などの重い処理が 1 件あっても他の接続を止めないよう、memory / token
+    バックエンドでもイベントループでは実行しない（スレッド切り替えの分、
+    軽い遷移では数十 µs 遅くなる）。
+    """
+    body, status = await run_in_threadpool(_encode, func, await _read_json(request))
+    return Response(body, status_code=status, media_type="application/json")
+
+
+# === API エンドポイント ===
+
+async def start_chat(request: Request) -> Response:
+    """チャットセッション開始（handlers.handle_start）"""
+    payload, status = await _call(handlers.handle_start, await _read_json(request))
+    return json_response(payload, status)
+
+
+async def step_chat(request: Request) -> Response:
+    """状態遷移（handlers.handle_step）"""
+    return await _step_response(handlers.handle_step, request)
+
+
+async def step_batch(request: Request) -> Response:
+    """複数アクションの一括遷移（handlers.handle_step_batch）"""
+    return await _step_response(handlers.handle_step_batch, request)
+
+
+async def graph(request: Request) -> Response:
+    """画面内の遷移グラフ（handlers.handle_graph。ETag / Cache-Control 付き）"""
+    body, status, headers = handlers.handle_graph(
+        request.query_params, request.headers.get("if-none-match", "")
+    )
+    return Response(body, status_code=status, headers=headers, media_type="application/json")
+
+
+async def health_check(request: Request) -> Response:
+    """ヘルスチェック"""
+    payload, status = handlers.handle_health()
+    return json_response(payload, status)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """起動時初期化"""
+    handlers.initialize()
+    yield
+
+
+# CORS設定
+# TODO: 本番環境では CORS_ORIGINS を適切なドメインに制限すること
+_origins = [o.strip() for o in config.CORS_ORIGINS.split(",") if o.strip()]
+
+app = Starlette(
+    routes=[
+        Route(f"{config.API_PREFIX}/start", start_chat, methods=["POST"]),
+        Route(f"{config.API_PREFIX}/step", step_chat, methods=["POST"]),
+        Route(f"{config.API_PREFIX}/step/batch", step_batch, methods=["POST"]),
+        Route(f"{config.API_PREFIX}/graph", graph, methods=["GET"]),
+        Route(f"{config.API_PREFIX}/health", health_check, methods=["GET"]),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=_origins, allow_methods=["*"], allow_headers=["*"]),
+    ],
+    lifespan=lifespan,
+)
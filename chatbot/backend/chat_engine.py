@@ -2,15 +2,23 @@
 # 状態遷移（state machine）とルール処理
 # 重要: 生成禁止 - 必ず content_items / system_messages の固定文言のみ返す
 
+import hashlib
 import logging
-from typing import Optional, List, Tuple
+from collections import deque
+from threading import Lock
+from typing import Any, Callable, Optional, List, Dict, Tuple
 
+from config import config
 from models import (
-    OptionItem, ContentDetail, StateInfo, InputMode, ChatResponse
+    OptionItem, ContentDetail, StateInfo, InputMode, ChatResponse, ResponseTemplate, dumps
 )
 from session_store import Session, session_store
-from content_repo import content_repo
-from search import search_engine
+from states import (
+    state_tables, StateDescriptor, KIND_COUNT, parse_state,
+    KIND_UNKNOWN, KIND_HOME, KIND_MENU, KIND_CAT, KIND_ANS, KIND_SEARCH, KIND_NF,
+)
+from content_repo import content_repo, content_registry, ContentRepository, ContentSnapshot
+from search import search_engine, SearchEngine
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +33,44 @@ class ChatEngine:
     # ans:{content_id} - コンテンツ表示
     # search:{screen_id} - 検索入力待ち
     # nf:{screen_id} - 該当なし（検索誘導）
+    # 状態は states.state_tables の現行世代（セッションごとに保持）の ID で扱い、振り分けは種別ごとの配列引き（_STATE_BUILDERS）
+    
+    # ContentSnapshot.derived のキー
+    DERIVED_KEY = "templates"
+    
+    def __init__(self, repo: ContentRepository = None, search: SearchEngine = None):
+        # テナントごとに 1 インスタンス（既定は content_repo / search_engine）
+        self._repo = repo or content_repo
+        self._search = search or search_engine
+        self.tenant_id = self._repo.tenant_id
+        # リロード時は公開前の新スナップショットに対して状態登録・テンプレート構築を行う
+        self._repo.add_reload_hook(state_tables.intern_snapshot)
+        self._repo.add_reload_hook(self.compile_templates)
+        # 事前構築していない状態（未登録の画面の home など）のテンプレート。
+        # 公開済みのスナップショットの derived は書き換えないため別に持ち、
+        # 公開中のスナップショットの分だけを残す
+        self._lazy_lock = Lock()
+        self._lazy_snapshot: Optional[ContentSnapshot] = None
+        self._lazy_templates: Dict[str, ResponseTemplate] = {}
+        # /graph の応答（画面 ID → (ETag, 本文)）。同じく公開中のスナップショットの分だけ
+        self._graph_snapshot: Optional[ContentSnapshot] = None
+        self._graphs: Dict[str, Tuple[str, bytes]] = {}
+    
+    @property
+    def search(self) -> SearchEngine:
+        return self._search
+    
+    def initialize(self) -> None:
+        """
+        現在のスナップショットの状態を登録（バンドル読み込み時はフックが走らないため）
+
+        エンジンより先に読み込まれたスナップショットにはテンプレートもないため、
+        リクエストを受ける前にここで構築する。
+        """
+        snapshot = self._repo.snapshot
+        state_tables.intern_snapshot(snapshot)
+        if self.DERIVED_KEY not in snapshot.derived:
+            self.compile_templates(snapshot)
     
     def start_session(self, screen_id: str) -> ChatResponse:
         """
@@ -37,10 +83,10 @@ class ChatEngine:
             初期状態のレスポンス
         """
         # screen_id 検証（不明なら global にフォールバック）
-        valid_screen_id = content_repo.resolve_screen_id(screen_id)
+        valid_screen_id = self._repo.resolve_screen_id(screen_id)
         
         # セッション作成
-        session = session_store.create(valid_screen_id)
+        session = session_store.create(valid_screen_id, self.tenant_id)
         
         # ホームメニューを取得
         return self._build_home_response(session, valid_screen_id)
@@ -67,32 +113,116 @@ class ChatEngine:
         # セッション取得
         session = session_store.get(session_id)
         if not session:
-            return self._error_response(session_id, "SESSION_NOT_FOUND", 
-                content_repo.get_system_message("error_session_expired"))
+            return self.session_not_found(session_id)
+        return self.step_session(session, action, target, query)
+    
+    def session_not_found(self, session_id: str) -> ChatResponse:
+        """セッション切れ・不明のレスポンス"""
+        return self._error_response(session_id, "SESSION_NOT_FOUND", 
+            self._repo.get_system_message("error_session_expired"))
+    
+    def step_session(
+        self, 
+        session: Session, 
+        action: str, 
+        target: str = "",
+        query: str = ""
+    ) -> ChatResponse:
+        """取得済みセッションの状態遷移（ChatEngineRegistry.step から呼ぶ）"""
+        response = self._apply(session, action, target, query)
+        if response is None:
+            return self._error_response(session.session_id, "INVALID_ACTION",
+                self._repo.get_system_message("error"))
+        
+        # 変更したセッションを書き戻す（外部ストア用）
+        session_store.save(session)
+        # token バックエンドでは save() で session_id が更新される
+        response.session_id = session.session_id
+        return response
+    
+    def step_batch_session(
+        self, 
+        session: Session, 
+        actions: List[Dict[str, Any]],
+        final_only: bool = False
+    ) -> List[ChatResponse]:
+        """
+        複数アクションを順に適用（ページ遷移後の会話復元など）
+        
+        セッションの取得・書き戻しは 1 回ずつ。不正なアクションがあればそこで打ち切り、
+        それまでの遷移は書き戻す（最後の要素がエラーレスポンスになる）。
+        
+        Args:
+            session: 取得済みセッション
+            actions: {"action", "target", "query"} の並び
+            final_only: True なら最後のレスポンスだけを返す
         
-        # アクション処理
+        Returns:
+            レスポンスの並び（session_id はすべて書き戻し後の値）
+        """
+        responses = []
+        for step in actions:
+            response = self._apply(
+                session, step.get("action", ""), step.get("target", ""), step.get("query", "")
+            )
+            if response is None:
+                responses.append(self._error_response(session.session_id, "INVALID_ACTION",
+                    self._repo.get_system_message("error")))
+                break
+            responses.append(response)
+        
+        session_store.save(session)
+        if final_only:
+            responses = responses[-1:]
+        for response in responses:
+            response.session_id = session.session_id
+        return responses
+    
+    def _apply(
+        self, 
+        session: Session, 
+        action: str, 
+        target: str,
+        query: str
+    ) -> Optional[ChatResponse]:
+        """アクションを 1 つ適用（書き戻しはしない。不正なアクションは None）"""
+        # 状態テーブルの世代が切り替わっていれば、セッションの ID を現行世代に移す
+        session.adopt(state_tables.current)
         if action == "navigate":
-            return self._handle_navigate(session, target)
+            response = self._handle_navigate(session, target)
         elif action == "show_content":
-            return self._handle_show_content(session, target)
+            response = self._handle_show_content(session, target)
         elif action == "back":
-            return self._handle_back(session)
+            response = self._handle_back(session)
         elif action == "reset":
-            return self._handle_reset(session)
+            response = self._handle_reset(session)
         elif action == "search":
-            return self._handle_search(session, query)
+            response = self._handle_search(session, query)
         elif action == "free_text":
-            return self._handle_free_text(session, query)
+            response = self._handle_free_text(session, query)
         else:
-            return self._error_response(session.session_id, "INVALID_ACTION",
-                content_repo.get_system_message("error"))
+            return None
+        return response
     
     # === アクションハンドラ ===
     
+    def _resolve_state(self, session: Session, state_id: str) -> Optional[int]:
+        """リクエスト由来の状態の ID（セッションの世代。登録できなければ None）"""
+        sid = session.table.lookup(state_id)
+        if sid is None:
+            # バンドルのリロード直後・世代の切り替え後などで未登録の可能性
+            # → 現スナップショットを登録してから引く
+            session.adopt(state_tables.intern_snapshot(self._repo.snapshot))
+            sid = session.table.resolve(state_id)
+        return sid
+    
     def _handle_navigate(self, session: Session, target: str) -> ChatResponse:
         """遷移処理"""
-        session.push_state(target)
-        return self._build_state_response(session, target)
+        sid = self._resolve_state(session, target)
+        if sid is None:
+            return self._unknown_state_response(session, target)
+        session.push_id(sid)
+        return self._build_state_response(session, sid)
     
     def _handle_show_content(self, session: Session, target: str) -> ChatResponse:
         """コンテンツ表示"""
@@ -102,14 +232,16 @@ class ChatEngine:
         else:
             content_id = target
         
-        state_id = f"ans:{content_id}"
-        session.push_state(state_id)
+        sid = self._resolve_state(session, f"ans:{content_id}")
+        if sid is None:
+            return self._build_not_found_response(session)
+        session.push_id(sid)
         return self._build_content_response(session, content_id)
     
     def _handle_back(self, session: Session) -> ChatResponse:
         """戻る処理"""
-        prev_state = session.pop_state()
-        if prev_state:
+        prev_state = session.pop_id()
+        if prev_state is not None:
             return self._build_state_response(session, prev_state)
         else:
             # 履歴がない場合はホームへ
@@ -127,10 +259,10 @@ class ChatEngine:
             state_id = f"search:{session.screen_id}"
             session.push_state(state_id)
             return self._build_search_prompt_response(session, 
-                content_repo.get_system_message("search_too_short"))
+                self._repo.get_system_message("search_too_short"))
         
         # 検索実行
-        results = search_engine.search(query, session.screen_id)
+        results = self._search.search(query, session.screen_id)
         
         if not results:
             # 該当なし
@@ -144,21 +276,19 @@ class ChatEngine:
         自由入力処理
         重要: search:{screen_id} 状態のみ受け付ける
         """
-        current = session.current_state
-        
         # 検索状態の場合のみ処理
-        if current.startswith("search:"):
+        if session.table.descriptors[session.current_id].kind == KIND_SEARCH:
             return self._handle_search(session, query)
         
         # それ以外は誘導メッセージ
         # 生成禁止: 必ず固定文言を返す
-        message = content_repo.get_system_message("select_from_options")
+        message = self._repo.get_system_message("select_from_options")
         options = self._get_current_options(session)
         
         return ChatResponse(
             success=True,
             session_id=session.session_id,
-            state=StateInfo(session.current_state, list(session.history)),
+            state=self._state_info(session),
             message=message,
             options=options,
             input_mode=InputMode(free_text=False)
@@ -168,86 +298,67 @@ class ChatEngine:
     
     def _build_home_response(self, session: Session, screen_id: str) -> ChatResponse:
         """ホーム画面レスポンス"""
-        menu = content_repo.get_home_menu(screen_id)
-        if not menu:
-            # フォールバック: global ホーム
-            menu = content_repo.get_home_menu("global")
-        
-        message = menu.get("message", content_repo.get_system_message("welcome"))
-        options = self._menu_to_options(menu)
-        
-        screen_info = content_repo.get_screen(screen_id)
-        
-        return ChatResponse(
-            success=True,
-            session_id=session.session_id,
-            state=StateInfo(session.current_state, list(session.history)),
-            message=message,
-            options=options,
-            input_mode=InputMode(free_text=False),
-            screen_info={"name": screen_info.get("name", screen_id)} if screen_info else None
+        template = self._get_or_build_template(
+            f"home:{screen_id}", lambda snapshot: self._home_template(snapshot, screen_id)
         )
+        return self._from_template(session, template)
     
-    def _build_state_response(self, session: Session, state_id: str) -> ChatResponse:
-        """状態に応じたレスポンス"""
-        if state_id.startswith("home:"):
-            screen_id = state_id[5:]
-            return self._build_home_response(session, screen_id)
-        
-        elif state_id.startswith("menu:"):
-            menu_id = state_id
-            return self._build_menu_response(session, menu_id)
-        
-        elif state_id.startswith("cat:"):
-            # cat:{category}:{screen_id}
-            parts = state_id.split(":")
-            if len(parts) >= 3:
-                category, screen_id = parts[1], parts[2]
-                return self._build_category_response(session, category, screen_id)
-        
-        elif state_id.startswith("ans:"):
-            content_id = state_id[4:]
-            return self._build_content_response(session, content_id)
-        
-        elif state_id.startswith("search:"):
-            return self._build_search_prompt_response(session,
-                content_repo.get_system_message("search_prompt"))
-        
-        elif state_id.startswith("nf:"):
-            return self._build_not_found_response(session)
-        
-        # 不明な状態 → ホームへ
+    def _build_state_response(self, session: Session, sid: int) -> ChatResponse:
+        """状態に応じたレスポンス（状態 ID → 記述子 → 種別ごとのビルダー）"""
+        desc = session.table.descriptors[sid]
+        return self._STATE_BUILDERS[desc.kind](self, session, desc)
+    
+    def _state_home(self, session: Session, desc: StateDescriptor) -> ChatResponse:
+        return self._build_home_response(session, desc.arg)
+    
+    def _state_menu(self, session: Session, desc: StateDescriptor) -> ChatResponse:
+        return self._build_menu_response(session, desc.arg)
+    
+    def _state_category(self, session: Session, desc: StateDescriptor) -> ChatResponse:
+        return self._build_category_response(session, desc.arg, desc.screen_id)
+    
+    def _state_content(self, session: Session, desc: StateDescriptor) -> ChatResponse:
+        return self._build_content_response(session, desc.arg)
+    
+    def _state_search(self, session: Session, desc: StateDescriptor) -> ChatResponse:
+        return self._build_search_prompt_response(session,
+            self._repo.get_system_message("search_prompt"))
+    
+    def _state_not_found(self, session: Session, desc: StateDescriptor) -> ChatResponse:
+        return self._build_not_found_response(session)
+    
+    def _state_unknown(self, session: Session, desc: StateDescriptor) -> ChatResponse:
+        return self._unknown_state_response(session, desc.state_id)
+    
+    # 種別（states.KIND_*）→ ビルダー
+    _STATE_BUILDERS = [None] * KIND_COUNT
+    _STATE_BUILDERS[KIND_UNKNOWN] = _state_unknown
+    _STATE_BUILDERS[KIND_HOME] = _state_home
+    _STATE_BUILDERS[KIND_MENU] = _state_menu
+    _STATE_BUILDERS[KIND_CAT] = _state_category
+    _STATE_BUILDERS[KIND_ANS] = _state_content
+    _STATE_BUILDERS[KIND_SEARCH] = _state_search
+    _STATE_BUILDERS[KIND_NF] = _state_not_found
+    _STATE_BUILDERS = tuple(_STATE_BUILDERS)
+    
+    def _unknown_state_response(self, session: Session, state_id: str) -> ChatResponse:
+        """不明な状態 → ホームへ"""
         logger.warning(f"Unknown state: {state_id}")
         session.reset_to_home()
         return self._build_home_response(session, session.screen_id)
     
     def _build_menu_response(self, session: Session, menu_id: str) -> ChatResponse:
         """メニュー表示レスポンス"""
-        menu = content_repo.get_menu(menu_id)
-        if not menu:
-            # 見つからない場合はホームへ
-            session.reset_to_home()
-            return self._build_home_response(session, session.screen_id)
-        
-        message = menu.get("message", "")
-        options = self._menu_to_options(menu)
-        
-        # 戻る選択肢を追加
-        options.append(OptionItem(
-            id="opt_back",
-            label="戻る",
-            action="back",
-            target=""
-        ))
-        
-        return ChatResponse(
-            success=True,
-            session_id=session.session_id,
-            state=StateInfo(session.current_state, list(session.history)),
-            message=message,
-            options=options,
-            input_mode=InputMode(free_text=False)
-        )
+        template = self._get_template(menu_id)
+        if not template:
+            menu = self._repo.get_menu(menu_id)
+            if not menu:
+                # 見つからない場合はホームへ
+                session.reset_to_home()
+                return self._build_home_response(session, session.screen_id)
+            template = self._menu_template(menu)
+        
+        return self._from_template(session, template)
     
     def _build_category_response(
         self, 
@@ -256,84 +367,26 @@ class ChatEngine:
         screen_id: str
     ) -> ChatResponse:
         """カテゴリ内コンテンツ一覧"""
-        menu_id = f"cat:{category}:{screen_id}"
-        menu = content_repo.get_menu(menu_id)
-        
-        if menu:
-            message = menu.get("message", "")
-            options = self._menu_to_options(menu)
-        else:
-            message = content_repo.get_system_message("category_empty")
-            options = []
-        
-        # 検索誘導と戻る
-        options.append(OptionItem(
-            id="opt_search",
-            label="探しているものがない → 検索",
-            action="navigate",
-            target=f"search:{screen_id}"
-        ))
-        options.append(OptionItem(
-            id="opt_back",
-            label="戻る",
-            action="back",
-            target=""
-        ))
-        
-        return ChatResponse(
-            success=True,
-            session_id=session.session_id,
-            state=StateInfo(session.current_state, list(session.history)),
-            message=message,
-            options=options,
-            input_mode=InputMode(free_text=False)
+        template = self._get_or_build_template(
+            f"cat:{category}:{screen_id}",
+            lambda snapshot: self._category_template(snapshot, category, screen_id)
         )
+        return self._from_template(session, template)
     
     def _build_content_response(self, session: Session, content_id: str) -> ChatResponse:
         """コンテンツ詳細レスポンス"""
-        item = content_repo.get_content(content_id)
+        entry = self._repo.get_entry(content_id)
         
-        if not item:
+        if not entry:
             # コンテンツが見つからない
             return self._build_not_found_response(session)
         
-        content = ContentDetail(
-            id=content_id,
-            title=item["title"],
-            body=item["body"],
-            links=item.get("links", [])
-        )
-        
-        # 関連コンテンツがあれば選択肢に
-        options = []
-        for related_id in item.get("related", [])[:3]:
-            related = content_repo.get_content(related_id)
-            if related:
-                options.append(OptionItem(
-                    id=f"opt_{related_id}",
-                    label=f"関連: {related['title']}",
-                    action="show_content",
-                    target=f"ans:{related_id}"
-                ))
-        
-        # 戻ると最初に戻る
-        options.append(OptionItem(
-            id="opt_back",
-            label="戻る",
-            action="back",
-            target=""
-        ))
-        options.append(OptionItem(
-            id="opt_reset",
-            label="最初に戻る",
-            action="reset",
-            target=""
-        ))
+        content, options = self._content_parts(self._repo.snapshot, entry)
         
         return ChatResponse(
             success=True,
             session_id=session.session_id,
-            state=StateInfo(session.current_state, list(session.history)),
+            state=self._state_info(session),
             message="",  # コンテンツ表示時はメッセージなし
             options=options,
             content=content,
@@ -346,9 +399,9 @@ class ChatEngine:
         message: str
     ) -> ChatResponse:
         """検索入力待ちレスポンス"""
-        state_id = f"search:{session.screen_id}"
-        if session.current_state != state_id:
-            session.push_state(state_id)
+        sid = session.intern_state(f"search:{session.screen_id}")
+        if sid is not None and session.current_id != sid:
+            session.push_id(sid)
         
         options = [
             OptionItem(
@@ -362,7 +415,7 @@ class ChatEngine:
         return ChatResponse(
             success=True,
             session_id=session.session_id,
-            state=StateInfo(session.current_state, list(session.history)),
+            state=self._state_info(session),
             message=message,
             options=options,
             input_mode=InputMode(
@@ -378,7 +431,7 @@ class ChatEngine:
         results: List[dict]
     ) -> ChatResponse:
         """検索結果レスポンス"""
-        message = content_repo.get_system_message("search_results").format(query=query, count=len(results))
+        message = self._repo.get_system_message("search_results").format(query=query, count=len(results))
         
         options = []
         for r in results:
@@ -406,7 +459,7 @@ class ChatEngine:
         return ChatResponse(
             success=True,
             session_id=session.session_id,
-            state=StateInfo(session.current_state, list(session.history)),
+            state=self._state_info(session),
             message=message,
             options=options,
             input_mode=InputMode(free_text=False)
@@ -414,7 +467,7 @@ class ChatEngine:
     
     def _build_no_result_response(self, session: Session, query: str) -> ChatResponse:
         """検索結果なしレスポンス"""
-        message = content_repo.get_system_message("search_no_result").format(query=query)
+        message = self._repo.get_system_message("search_no_result").format(query=query)
         
         options = [
             OptionItem(
@@ -434,7 +487,7 @@ class ChatEngine:
         return ChatResponse(
             success=True,
             session_id=session.session_id,
-            state=StateInfo(session.current_state, list(session.history)),
+            state=self._state_info(session),
             message=message,
             options=options,
             input_mode=InputMode(free_text=True, placeholder="別のキーワード...")
@@ -445,7 +498,7 @@ class ChatEngine:
         state_id = f"nf:{session.screen_id}"
         session.push_state(state_id)
         
-        message = content_repo.get_system_message("not_found")
+        message = self._repo.get_system_message("not_found")
         
         options = [
             OptionItem(
@@ -465,7 +518,7 @@ class ChatEngine:
         return ChatResponse(
             success=True,
             session_id=session.session_id,
-            state=StateInfo(session.current_state, list(session.history)),
+            state=self._state_info(session),
             message=message,
             options=options,
             input_mode=InputMode(free_text=False)
@@ -487,6 +540,264 @@ class ChatEngine:
             input_mode=InputMode(free_text=False)
         )
     
+    # === 静的状態のテンプレート ===
+    
+    # 事前構築していないテンプレートを残す上限（リクエスト由来の状態で増え続けないように）
+    LAZY_TEMPLATE_LIMIT = 4096
+    
+    def _templates(self, snapshot: ContentSnapshot) -> Dict[str, ResponseTemplate]:
+        """事前構築済みテンプレート（initialize 前のスナップショットなら空）"""
+        return snapshot.derived.get(self.DERIVED_KEY) or {}
+    
+    def _get_template(self, state_id: str) -> Optional[ResponseTemplate]:
+        """事前構築済みテンプレートを取得"""
+        return self._templates(self._repo.snapshot).get(state_id)
+    
+    def _get_or_build_template(
+        self, state_id: str, build: Callable[[ContentSnapshot], ResponseTemplate]
+    ) -> ResponseTemplate:
+        """
+        事前構築済みテンプレートを取得（なければ構築して _lazy_templates に追加）
+
+        未登録の画面の home など、事前構築していない状態も 2 回目からは再構築しない。
+        残すのは公開中のスナップショットの分だけで、件数は LAZY_TEMPLATE_LIMIT まで。
+        """
+        snapshot = self._repo.snapshot
+        template = self._templates(snapshot).get(state_id)
+        if template is not None:
+            return template
+        with self._lazy_lock:
+            if self._lazy_snapshot is snapshot:
+                template = self._lazy_templates.get(state_id)
+        if template is None:
+            template = build(snapshot)
+            with self._lazy_lock:
+                current = self._repo.snapshot
+                if self._lazy_snapshot is not current:
+                    # リロード後は旧スナップショットの分を捨てる
+                    self._lazy_snapshot = current
+                    self._lazy_templates = {}
+                if snapshot is current and len(self._lazy_templates) < self.LAZY_TEMPLATE_LIMIT:
+                    self._lazy_templates[state_id] = template
+        return template
+    
+    def compile_templates(self, snapshot: ContentSnapshot) -> Dict[str, ResponseTemplate]:
+        """home / menu / cat 状態のレスポンス断片を一括構築"""
+        templates: Dict[str, ResponseTemplate] = {}
+        screen_ids = snapshot.get_screen_ids()
+        # 未登録の画面 ID は global にフォールバックするため、登録がなくても構築する
+        if "global" not in screen_ids and snapshot.get_menu("home:global"):
+            screen_ids.append("global")
+        for screen_id in screen_ids:
+            templates[f"home:{screen_id}"] = self._home_template(snapshot, screen_id)
+        for menu_id, menu in snapshot.get_menus().items():
+            if menu_id.startswith("menu:"):
+                templates[menu_id] = self._menu_template(menu)
+            elif menu_id.startswith("cat:"):
+                parts = menu_id.split(":")
+                if len(parts) == 3:
+                    templates[menu_id] = self._category_template(snapshot, parts[1], parts[2])
+        snapshot.derived[self.DERIVED_KEY] = templates
+        logger.info(f"Compiled {len(templates)} response templates")
+        return templates
+    
+    def _home_template(self, snapshot: ContentSnapshot, screen_id: str) -> ResponseTemplate:
+        menu = snapshot.get_menu(f"home:{screen_id}")
+        if not menu:
+            # フォールバック: global ホーム
+            menu = snapshot.get_menu("home:global")
+        
+        message = menu.get("message", snapshot.get_system_message("welcome"))
+        options = self._menu_to_options(menu)
+        
+        screen_info = snapshot.get_screen(screen_id)
+        
+        return ResponseTemplate.build(
+            message,
+            options,
+            screen_info={"name": screen_info.get("name", screen_id)} if screen_info else None
+        )
+    
+    def _menu_template(self, menu: dict) -> ResponseTemplate:
+        options = self._menu_to_options(menu)
+        
+        # 戻る選択肢を追加
+        options.append(OptionItem(
+            id="opt_back",
+            label="戻る",
+            action="back",
+            target=""
+        ))
+        
+        return ResponseTemplate.build(menu.get("message", ""), options)
+    
+    def _category_template(
+        self, snapshot: ContentSnapshot, category: str, screen_id: str
+    ) -> ResponseTemplate:
+        menu = snapshot.get_menu(f"cat:{category}:{screen_id}")
+        
+        if menu:
+            message = menu.get("message", "")
+            options = self._menu_to_options(menu)
+        else:
+            message = snapshot.get_system_message("category_empty")
+            options = []
+        
+        # 検索誘導と戻る
+        options.append(OptionItem(
+            id="opt_search",
+            label="探しているものがない → 検索",
+            action="navigate",
+            target=f"search:{screen_id}"
+        ))
+        options.append(OptionItem(
+            id="opt_back",
+            label="戻る",
+            action="back",
+            target=""
+        ))
+        
+        return ResponseTemplate.build(message, options)
+    
+    def _state_info(self, session: Session) -> StateInfo:
+        return StateInfo(session.current_state, session.history_states())
+    
+    def _from_template(self, session: Session, template: ResponseTemplate) -> ChatResponse:
+        """テンプレートにセッション固有の値（session_id / state）を差し込む"""
+        return ChatResponse(
+            success=True,
+            session_id=session.session_id,
+            state=self._state_info(session),
+            message=template.message,
+            options=list(template.options),
+            input_mode=InputMode(free_text=False),
+            screen_info=template.screen_info,
+            options_payload=template.options_payload
+        )
+    
+    def _content_parts(self, snapshot: ContentSnapshot, entry) -> Tuple[ContentDetail, List[OptionItem]]:
+        """コンテンツ表示の本文と選択肢"""
+        content = ContentDetail(
+            id=entry.id,
+            title=entry.title,
+            body=entry.body,
+            links=[dict(link) for link in entry.links]
+        )
+        
+        # 関連コンテンツがあれば選択肢に
+        options = []
+        for related_id in entry.related[:3]:
+            related = snapshot.by_id.get(related_id)
+            if related:
+                options.append(OptionItem(
+                    id=f"opt_{related_id}",
+                    label=f"関連: {related.title}",
+                    action="show_content",
+                    target=f"ans:{related_id}"
+                ))
+        
+        # 戻ると最初に戻る
+        options.append(OptionItem(
+            id="opt_back",
+            label="戻る",
+            action="back",
+            target=""
+        ))
+        options.append(OptionItem(
+            id="opt_reset",
+            label="最初に戻る",
+            action="reset",
+            target=""
+        ))
+        return content, options
+    
+    # === 画面内の遷移グラフ（ウィジェットのローカル遷移用） ===
+    
+    def export_graph(self, screen_id: str) -> Tuple[str, bytes]:
+        """
+        画面のホームから選択肢で辿れる静的な状態（home / menu / cat / ans）の
+        レスポンスをまとめた JSON と、その ETag を返す（公開中のスナップショットの分をキャッシュ）
+        
+        search / nf などサーバー処理が必要な状態は含めない。ウィジェットはグラフにない
+        遷移だけをサーバーに送り、それまでのローカル遷移は /step/batch で再生する。
+        """
+        screen_id = self._repo.resolve_screen_id(screen_id)
+        snapshot = self._repo.snapshot
+        cached = None
+        with self._lazy_lock:
+            if self._graph_snapshot is snapshot:
+                cached = self._graphs.get(screen_id)
+        if cached is None:
+            body = dumps(self._build_graph(snapshot, screen_id))
+            etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            cached = (etag, body)
+            with self._lazy_lock:
+                current = self._repo.snapshot
+                if self._graph_snapshot is not current:
+                    # リロード後は旧スナップショットの分を捨てる
+                    self._graph_snapshot = current
+                    self._graphs = {}
+                # 画面 ID は登録済みか global に解決済みのため、件数は画面数まで
+                if snapshot is current:
+                    self._graphs[screen_id] = cached
+        return cached
+    
+    def _build_graph(self, snapshot: ContentSnapshot, screen_id: str) -> Dict[str, Any]:
+        home = f"home:{screen_id}"
+        states: Dict[str, Dict[str, Any]] = {}
+        seen = {home}
+        queue = deque([home])
+        while queue:
+            state_id = queue.popleft()
+            node = self._graph_node(snapshot, state_id)
+            if node is None:
+                continue
+            states[state_id] = node
+            for opt in node["options"]:
+                target = opt["target"]
+                if opt["action"] in ("navigate", "show_content") and target not in seen:
+                    seen.add(target)
+                    queue.append(target)
+        return {
+            "version": snapshot.version,
+            "screen_id": screen_id,
+            "home": home,
+            # ローカル遷移でサーバーと同じ履歴を再現するための上限
+            "max_history": config.MAX_HISTORY,
+            "max_actions": config.STEP_BATCH_MAX_ACTIONS,
+            "states": states,
+        }
+    
+    def _graph_node(self, snapshot: ContentSnapshot, state_id: str) -> Optional[Dict[str, Any]]:
+        """状態 1 つ分のレスポンス（message / options / screen_info / content）。対象外は None"""
+        desc = parse_state(state_id)
+        template = self._templates(snapshot).get(state_id)
+        if template is None:
+            if desc.kind == KIND_HOME:
+                template = self._home_template(snapshot, desc.arg)
+            elif desc.kind == KIND_MENU:
+                menu = snapshot.get_menu(desc.arg)
+                # 見つからないメニューはサーバー側でホームに戻す
+                template = self._menu_template(menu) if menu else None
+            elif desc.kind == KIND_CAT:
+                template = self._category_template(snapshot, desc.arg, desc.screen_id)
+            elif desc.kind == KIND_ANS:
+                entry = snapshot.by_id.get(desc.arg)
+                if entry is None:
+                    return None
+                content, options = self._content_parts(snapshot, entry)
+                return {
+                    "message": "",
+                    "options": [o.to_dict() for o in options],
+                    "content": content.to_dict(),
+                }
+        if template is None:
+            return None
+        node = {"message": template.message, "options": template.options_payload}
+        if template.screen_info:
+            node["screen_info"] = template.screen_info
+        return node
+    
     # === ヘルパー ===
     
     def _menu_to_options(self, menu: dict) -> List[OptionItem]:
@@ -512,20 +823,85 @@ class ChatEngine:
     
     def _get_current_options(self, session: Session) -> List[OptionItem]:
         """現在の状態の選択肢を取得"""
-        state = session.current_state
+        desc = session.table.descriptors[session.current_id]
         
-        if state.startswith("home:"):
-            menu = content_repo.get_home_menu(state[5:])
+        if desc.kind == KIND_HOME:
+            menu = self._repo.get_home_menu(desc.arg)
             if menu:
                 return self._menu_to_options(menu)
         
-        elif state.startswith("menu:"):
-            menu = content_repo.get_menu(state)
+        elif desc.kind == KIND_MENU:
+            menu = self._repo.get_menu(desc.arg)
             if menu:
                 return self._menu_to_options(menu)
         
         return []
 
 
+class ChatEngineRegistry:
+    """
+    テナント ID → ChatEngine
+
+    content_registry に登録されたテナントごとに ChatEngine / SearchEngine を作る。
+    /step はセッションに記録されたテナントのエンジンに振り分ける。
+    """
+    
+    def __init__(self, default: ChatEngine):
+        self._default = default
+        self._engines: Dict[str, ChatEngine] = {default.tenant_id: default}
+        self._lock = Lock()
+    
+    def get(self, tenant_id: str) -> Optional[ChatEngine]:
+        """テナントのエンジン（未登録のテナントは None）"""
+        engine = self._engines.get(tenant_id)
+        if engine is not None:
+            return engine
+        repo = content_registry.get(tenant_id)
+        if repo is None:
+            return None
+        with self._lock:
+            engine = self._engines.get(tenant_id)
+            if engine is None:
+                engine = ChatEngine(repo, SearchEngine(repo))
+                self._engines[tenant_id] = engine
+        return engine
+    
+    def engines(self) -> List[ChatEngine]:
+        """作成済みのエンジン"""
+        return list(self._engines.values())
+    
+    def prepare_all(self) -> List[ChatEngine]:
+        """全テナントのエンジンを作成（読み込み前に呼ぶとリロードフックが登録される）"""
+        return [self.get(tenant_id) for tenant_id in content_registry.tenant_ids()]
+    
+    def step(
+        self, 
+        session_id: str, 
+        action: str, 
+        target: str = "",
+        query: str = ""
+    ) -> ChatResponse:
+        """セッションのテナントに振り分けて状態遷移"""
+        session = session_store.get(session_id)
+        engine = self.get(session.tenant_id) if session else None
+        if engine is None:
+            return self._default.session_not_found(session_id)
+        return engine.step_session(session, action, target, query)
+    
+    def step_batch(
+        self, 
+        session_id: str, 
+        actions: List[Dict[str, Any]],
+        final_only: bool = False
+    ) -> List[ChatResponse]:
+        """セッションのテナントに振り分けて複数アクションを適用"""
+        session = session_store.get(session_id)
+        engine = self.get(session.tenant_id) if session else None
+        if engine is None:
+            return [self._default.session_not_found(session_id)]
+        return engine.step_batch_session(session, actions, final_only)
+
+
 # シングルトンインスタンス
 chat_engine = ChatEngine()
+chat_engines = ChatEngineRegistry(chat_engine)
@@ -12,16 +12,34 @@ class Config:
     BASE_DIR = Path(__file__).parent.parent
     CONTENT_PATH = os.getenv("CONTENT_PATH", str(BASE_DIR / "contents" / "contents.json"))
     SCHEMA_PATH = os.getenv("SCHEMA_PATH", str(BASE_DIR / "contents" / "contents.schema.json"))
-    CONTENT_SOURCE = os.getenv("CONTENT_SOURCE", "json")  # "json" or "csv"
+    CONTENT_SOURCE = os.getenv("CONTENT_SOURCE", "json")  # "json" / "csv" / "bundle"
     CONTENT_CSV_DIR = os.getenv("CONTENT_CSV_DIR", str(BASE_DIR / "contents" / "csv"))
+    # compile_csv_to_json.py --bundle の出力（CONTENT_SOURCE=bundle で使用）
+    CONTENT_BUNDLE_PATH = os.getenv("CONTENT_BUNDLE_PATH", str(BASE_DIR / "contents" / "contents.bundle"))
+    # ソース更新の監視間隔（秒、0 で無効）。更新時は再起動なしで差し替える
+    CONTENT_RELOAD_INTERVAL = float(os.getenv("CONTENT_RELOAD_INTERVAL", "0"))
+    
+    # マルチテナント設定
+    # TENANTS_PATH: テナント ID → コンテンツの読み込み元を定義した JSON（空なら既定テナントのみ）
+    TENANTS_PATH = os.getenv("TENANTS_PATH", "")
+    DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")
+    TENANT_LOAD_WORKERS = int(os.getenv("TENANT_LOAD_WORKERS", "4"))  # 起動時の並行読み込み数
     
     # セッション設定
     SESSION_TTL = int(os.getenv("SESSION_TTL", "1800"))  # 30分
     MAX_HISTORY = int(os.getenv("MAX_HISTORY", "10"))
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # "memory" / "redis" / "token"
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "helpchat:session:")
+    SESSION_SECRET = os.getenv("SESSION_SECRET", "")  # token バックエンドの署名鍵
+    SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "100000"))  # memory: 上限超過は LRU 追い出し
+    SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))  # memory: 期限切れ掃除の間隔（秒）
+    SESSION_SHARDS = int(os.getenv("SESSION_SHARDS", "16"))  # memory: ロックを分ける区画数
     
     # 検索設定
     SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "5"))
     SEARCH_MIN_QUERY_LEN = int(os.getenv("SEARCH_MIN_QUERY_LEN", "2"))
+    SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))  # テナントごとの検索結果キャッシュ件数（0 で無効）
     
     # ログ設定
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -32,6 +50,8 @@ class Config:
     
     # API設定
     API_PREFIX = "/api/v1/helpchat"
+    STEP_BATCH_MAX_ACTIONS = int(os.getenv("STEP_BATCH_MAX_ACTIONS", "50"))  # /step/batch 1 回の上限
+    GRAPH_CACHE_MAX_AGE = int(os.getenv("GRAPH_CACHE_MAX_AGE", "300"))  # /graph の Cache-Control max-age（秒）
 
 
 config = Config()
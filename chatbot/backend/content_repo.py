@@ -1,269 +1,869 @@
 # コンテンツリポジトリ
 # contents.json の読み込みと参照整合性チェック
 
+import copyreg
 import csv
+import hashlib
+import heapq
+import io
 import json
 import logging
+import pickle
+import re
+import struct
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from threading import Event, Lock, Thread
+from types import MappingProxyType
+from typing import Callable, Dict, List, Optional, Any, Mapping, Tuple
 
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# 検索スニペットの文字数
+SNIPPET_LENGTH = 80
+
+# CSV ソースを構成するファイル（content_links / content_related は任意）
+CSV_FILES = (
+    "meta.csv",
+    "system_messages.csv",
+    "screens.csv",
+    "menus.csv",
+    "content_items.csv",
+    "content_links.csv",
+    "content_related.csv",
+)
+OPTIONAL_CSV_FILES = frozenset({"content_links.csv", "content_related.csv"})
+
+DEFAULT_SEARCH_CONFIG = {
+    "enabled": True,
+    "min_query_length": 2,
+    "max_results": 5,
+    "synonyms": {},
+    "stopwords": []
+}
+
+# バイナリバンドル（compile_csv_to_json.py --bundle で生成）
+# 先頭にマジック・形式番号・構築時の設定（JSON）の長さを置き、設定に続けて
+# 派生データ込みのスナップショットを pickle する
+BUNDLE_MAGIC = b"HCBUNDLE"
+# ContentSnapshot / 検索インデックスの構造を変えたら上げる
+BUNDLE_FORMAT = 4
+_BUNDLE_HEADER = struct.Struct("<8sHI")
+# 派生データの構築結果を左右する設定（派生データを作るモジュールが import 時に登録する）。
+# バンドルに記録し、読み込み時に今の設定と違えば派生データを捨ててリロードフックで作り直す
+BUNDLE_CONFIG: Dict[str, Any] = {}
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# ContentSnapshot.screen_docs で画面指定のないコンテンツ（全画面共通）を表すキー
+SHARED_SCREEN = ""
+
+
+def normalize_text(text: str) -> str:
+    """テキスト正規化（小文字化、空白統一）"""
+    return _WHITESPACE_RE.sub(" ", text.lower().strip())
+
 
 class ContentValidationError(Exception):
     """コンテンツ検証エラー"""
     pass
 
 
+@dataclass(frozen=True)
+class ContentEntry:
+    """読み込み時に正規化済みのコンテンツ（検索・表示で共有、不変）"""
+    id: str
+    title: str
+    body: str
+    category: str
+    screens: frozenset
+    links: Tuple[Mapping[str, str], ...]
+    related: Tuple[str, ...]
+    priority: int
+    # 検索用（正規化済み）
+    title_norm: str
+    body_norm: str
+    keywords_norm: Tuple[str, ...]
+    keyword_set: frozenset
+    snippet: str
+    priority_boost: float
+
+
+@dataclass(frozen=True)
+class ContentSnapshot:
+    """
+    load() 1 回分の不変スナップショット
+
+    data は検証済みの生データ（読み取り専用として扱う）。
+    derived は検索インデックス等の派生データ置き場で、公開前の
+    リロードフックで埋める（公開後は読み取りのみ）。
+    """
+    version: str
+    data: Mapping[str, Any]
+    entries: Tuple[ContentEntry, ...]
+    by_id: Mapping[str, ContentEntry]
+    # 画面 ID → その画面を指定したコンテンツの番号（entries の添字・昇順）
+    # SHARED_SCREEN は画面指定のないコンテンツ（検索インデックスの区画もこの単位）
+    screen_docs: Mapping[str, Tuple[int, ...]]
+    derived: Dict[str, Any] = field(default_factory=dict, compare=False)
+
+    def get_screen(self, screen_id: str) -> Optional[Dict[str, Any]]:
+        return self.data.get("screen_registry", {}).get(screen_id)
+
+    def get_screen_ids(self) -> List[str]:
+        return list(self.data.get("screen_registry", {}).keys())
+
+    def get_menu(self, menu_id: str) -> Optional[Dict[str, Any]]:
+        return self.data.get("menus", {}).get(menu_id)
+
+    def get_menus(self) -> Dict[str, Dict[str, Any]]:
+        return self.data.get("menus", {})
+
+    def get_system_message(self, key: str) -> str:
+        return self.data.get("system_messages", {}).get(key, "")
+
+    def get_search_config(self) -> Dict[str, Any]:
+        return self.data.get("search_config", DEFAULT_SEARCH_CONFIG)
+
+    @classmethod
+    def build(cls, data: Dict[str, Any]) -> "ContentSnapshot":
+        """検証済みデータから構築（文字列処理はここで一度だけ行う）"""
+        entries = []
+        for item_id, item in data.get("content_items", {}).items():
+            body = item.get("body", "")
+            keywords = tuple(k for k in (normalize_text(k) for k in item.get("keywords", [])) if k)
+            priority = item.get("priority", 50)
+            entries.append(ContentEntry(
+                id=item_id,
+                title=item.get("title", ""),
+                body=body,
+                category=item.get("category", ""),
+                screens=frozenset(item.get("screens", [])),
+                links=tuple(MappingProxyType(dict(link)) for link in item.get("links", [])),
+                related=tuple(item.get("related", [])),
+                priority=priority,
+                title_norm=normalize_text(item.get("title", "")),
+                body_norm=normalize_text(body),
+                keywords_norm=keywords,
+                keyword_set=frozenset(keywords),
+                snippet=body[:SNIPPET_LENGTH] + "..." if len(body) > SNIPPET_LENGTH else body,
+                priority_boost=priority / 100.0,
+            ))
+        screen_docs: Dict[str, List[int]] = {SHARED_SCREEN: []}
+        for doc, entry in enumerate(entries):
+            for screen_id in entry.screens or (SHARED_SCREEN,):
+                screen_docs.setdefault(screen_id, []).append(doc)
+        return cls(
+            version=str(data.get("meta", {}).get("version", "unknown")),
+            data=data,
+            entries=tuple(entries),
+            by_id=MappingProxyType({e.id: e for e in entries}),
+            screen_docs=MappingProxyType({k: tuple(v) for k, v in screen_docs.items()}),
+        )
+
+
+# リロードフック: 公開前の新スナップショットを受け取り derived を構築する
+ReloadHook = Callable[[ContentSnapshot], None]
+
+
+def _readonly(mapping: Dict[str, Any]) -> Mapping[str, Any]:
+    return MappingProxyType(mapping)
+
+
+# MappingProxyType はそのままでは pickle できないため、辞書に戻して保存する
+copyreg.pickle(MappingProxyType, lambda m: (_readonly, (dict(m),)))
+
+
+def write_bundle(snapshot: ContentSnapshot, path: Path) -> int:
+    """
+    スナップショット（derived 込み）をバンドルとして書き出す
+
+    監視スレッドが書きかけを読まないよう、一時ファイル経由で置き換える。
+    
+    Returns:
+        書き出したバイト数
+    """
+    built_with = json.dumps(BUNDLE_CONFIG, sort_keys=True).encode("utf-8")
+    payload = (
+        _BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_FORMAT, len(built_with))
+        + built_with
+        + pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+    )
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(payload)
+    tmp_path.replace(path)
+    return len(payload)
+
+
+def read_bundle(path: Path) -> ContentSnapshot:
+    """
+    バンドルを 1 回の読み込みで復元する（パース・検証・インデックス構築なし）
+
+    構築時の設定（BUNDLE_CONFIG）が今と違えば、派生データは捨てて返す
+    （公開前のリロードフックで作り直される）。
+    pickle を使うため、自分で生成したバンドル以外は読み込まないこと。
+    """
+    path = Path(path)
+    if not path.exists():
+        raise ContentValidationError(f"Content bundle not found: {path}")
+    raw = path.read_bytes()
+    try:
+        magic, fmt, config_size = _BUNDLE_HEADER.unpack_from(raw)
+    except struct.error:
+        magic, fmt, config_size = b"", None, 0
+    if magic != BUNDLE_MAGIC:
+        raise ContentValidationError(f"Not a content bundle: {path}")
+    if fmt != BUNDLE_FORMAT:
+        raise ContentValidationError(
+            f"Content bundle format {fmt} is not supported (expected {BUNDLE_FORMAT}); "
+            f"recompile with compile_csv_to_json.py --bundle: {path}"
+        )
+    body = _BUNDLE_HEADER.size + config_size
+    try:
+        built_with = json.loads(raw[_BUNDLE_HEADER.size:body].decode("utf-8"))
+        snapshot = pickle.loads(memoryview(raw)[body:])
+    except Exception as e:
+        raise ContentValidationError(f"Broken content bundle: {path}: {e}") from e
+    if not isinstance(snapshot, ContentSnapshot):
+        raise ContentValidationError(f"Broken content bundle: {path}")
+    if built_with != BUNDLE_CONFIG:
+        changed = sorted(k for k in built_with.keys() | BUNDLE_CONFIG.keys()
+                         if built_with.get(k) != BUNDLE_CONFIG.get(k))
+        logger.warning(f"Content bundle was built with different settings ({', '.join(changed)}); "
+                       f"rebuilding derived data: {path}")
+        snapshot.derived.clear()
+    return snapshot
+
+
+# === CSV ソース ===
+# CSV はファイル単位で「断片」にパースし、assemble_csv_fragments で 1 つのデータにまとめる
+# （compile_csv_to_json.py --incremental は変更のないファイルの断片を再利用する）
+
+def _split_list(value: str) -> List[str]:
+    if not value:
+        return []
+    return [v.strip() for v in value.split("|") if v.strip()]
+
+
+def _parse_order(value: Optional[str]) -> int:
+    value = (value or "").strip()
+    try:
+        return int(value) if value else 0
+    except ValueError:
+        return 0
+
+
+def _parse_meta(rows: List[Dict[str, str]]) -> Dict[str, str]:
+    meta = {}
+    for row in rows:
+        key = (row.get("key") or "").strip()
+        val = (row.get("value") or "").strip()
+        if key:
+            meta[key] = val
+    return meta
+
+
+def _parse_system_messages(rows: List[Dict[str, str]]) -> Dict[str, str]:
+    system_messages = {}
+    for row in rows:
+        key = (row.get("key") or "").strip()
+        val = row.get("value") or ""
+        if key:
+            system_messages[key] = val
+    return system_messages
+
+
+def _parse_screens(rows: List[Dict[str, str]]) -> Dict[str, Dict[str, Any]]:
+    screen_registry = {}
+    for row in rows:
+        screen_id = (row.get("screen_id") or "").strip()
+        if not screen_id:
+            continue
+        screen_registry[screen_id] = {
+            "name": row.get("name") or "",
+            "routes": _split_list(row.get("routes") or ""),
+            "group": (row.get("group") or "").strip()
+        }
+    return screen_registry
+
+
+def _parse_menus(rows: List[Dict[str, str]]) -> Dict[str, Dict[str, Any]]:
+    menus = {}
+    temp_options = {}
+    for row in rows:
+        menu_id = (row.get("menu_id") or "").strip()
+        if not menu_id:
+            continue
+        message = row.get("message") or ""
+        option_label = (row.get("option_label") or "").strip()
+        option_next = (row.get("option_next_state") or "").strip()
+        order = _parse_order(row.get("option_order"))
+
+        menu = menus.setdefault(menu_id, {"message": "", "options": []})
+        if message and not menu.get("message"):
+            menu["message"] = message
+
+        if option_label and option_next:
+            temp_options.setdefault(menu_id, []).append((order, {
+                "label": option_label,
+                "next_state": option_next
+            }))
+
+    for menu_id, opts in temp_options.items():
+        opts_sorted = sorted(opts, key=lambda x: x[0])
+        menus[menu_id]["options"] = [opt for _, opt in opts_sorted]
+    return menus
+
+
+def _parse_content_items(rows: List[Dict[str, str]]) -> Dict[str, Dict[str, Any]]:
+    content_items = {}
+    for row in rows:
+        item_id = (row.get("id") or "").strip()
+        if not item_id:
+            continue
+        content_items[item_id] = {
+            "title": row.get("title") or "",
+            "body": row.get("body") or "",
+            "category": (row.get("category") or "").strip(),
+            "screens": _split_list(row.get("screens") or ""),
+            "keywords": _split_list(row.get("keywords") or ""),
+            "links": [],
+            "related": [],
+            "priority": _parse_order(row.get("priority"))
+        }
+    return content_items
+
+
+def _parse_content_links(rows: List[Dict[str, str]]) -> List[Tuple[str, int, Dict[str, str]]]:
+    links = []
+    for row in rows:
+        content_id = (row.get("content_id") or "").strip()
+        label = row.get("label") or ""
+        url = row.get("url") or ""
+        if content_id and label and url:
+            links.append((content_id, _parse_order(row.get("order")), {
+                "label": label,
+                "url": url
+            }))
+    return links
+
+
+def _parse_content_related(rows: List[Dict[str, str]]) -> List[Tuple[str, int, str]]:
+    related = []
+    for row in rows:
+        content_id = (row.get("content_id") or "").strip()
+        related_id = (row.get("related_id") or "").strip()
+        if content_id and related_id:
+            related.append((content_id, _parse_order(row.get("order")), related_id))
+    return related
+
+
+_CSV_PARSERS: Dict[str, Callable[[List[Dict[str, str]]], Any]] = {
+    "meta.csv": _parse_meta,
+    "system_messages.csv": _parse_system_messages,
+    "screens.csv": _parse_screens,
+    "menus.csv": _parse_menus,
+    "content_items.csv": _parse_content_items,
+    "content_links.csv": _parse_content_links,
+    "content_related.csv": _parse_content_related,
+}
+
+# 出力セクション → 依存する CSV（この順で contents.json に並ぶ）
+CSV_SECTION_SOURCES: Dict[str, Tuple[str, ...]] = {
+    "meta": ("meta.csv",),
+    "screen_registry": ("screens.csv",),
+    "system_messages": ("system_messages.csv",),
+    "menus": ("menus.csv",),
+    "content_items": ("content_items.csv", "content_links.csv", "content_related.csv"),
+}
+
+
+def parse_csv_fragment(filename: str, raw: bytes) -> Any:
+    """CSV ファイル 1 つ分（UTF-8 / BOM 可）を断片にパース"""
+    text = raw.decode("utf-8-sig")
+    return _CSV_PARSERS[filename](list(csv.DictReader(io.StringIO(text, newline=""))))
+
+
+def _build_content_items(fragments: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """content_items に links / related を埋める（断片は変更せず複製する）"""
+    content_items = {
+        item_id: dict(item, links=[], related=[])
+        for item_id, item in fragments["content_items.csv"].items()
+    }
+
+    links: Dict[str, List[Tuple[int, Dict[str, str]]]] = {}
+    for content_id, order, link in fragments.get("content_links.csv", ()):
+        if content_id in content_items:
+            links.setdefault(content_id, []).append((order, link))
+    for content_id, ordered in links.items():
+        content_items[content_id]["links"] = [l for _, l in sorted(ordered, key=lambda x: x[0])]
+
+    related: Dict[str, List[Tuple[int, str]]] = {}
+    for content_id, order, related_id in fragments.get("content_related.csv", ()):
+        if content_id in content_items:
+            related.setdefault(content_id, []).append((order, related_id))
+    for content_id, ordered in related.items():
+        content_items[content_id]["related"] = [rid for _, rid in sorted(ordered, key=lambda x: x[0])]
+
+    return content_items
+
+
+def build_csv_section(key: str, fragments: Dict[str, Any]) -> Any:
+    """
+    1 セクション分を断片から組み立てる
+
+    fragments には CSV_SECTION_SOURCES[key] の断片だけあればよい
+    （任意ファイルの断片はなくてもよい）。
+    """
+    if key == "content_items":
+        return _build_content_items(fragments)
+    return fragments[CSV_SECTION_SOURCES[key][0]]
+
+
+def assemble_csv_fragments(fragments: Dict[str, Any]) -> Dict[str, Any]:
+    """断片からコンテンツデータを組み立てる（断片はキャッシュで使い回すため変更しない）"""
+    return {key: build_csv_section(key, fragments) for key in CSV_SECTION_SOURCES}
+
+
+# === 参照整合性・到達可能性 ===
+
+@dataclass
+class ValidationReport:
+    """
+    コンテンツの状態遷移グラフの検証結果
+
+    状態はメニュー（menus のキー）とコンテンツ（ans:{content_id}）。
+    辺はメニューの選択肢と、コンテンツの related。
+    """
+    errors: List[str] = field(default_factory=list)
+    # 存在しない related の参照（表示時に読み飛ばされる）
+    warnings: List[str] = field(default_factory=list)
+    # どの画面のホームからも辿れないメニュー
+    unreachable_menus: List[str] = field(default_factory=list)
+    # メニュー・related から辿れないコンテンツ（検索でのみ到達）
+    unreachable_contents: List[str] = field(default_factory=list)
+    # 選択肢のないメニュー（戻るしかできない）
+    dead_ends: List[str] = field(default_factory=list)
+    # メニュー間の循環（ホームへ戻る選択肢は除く）
+    cycles: List[List[str]] = field(default_factory=list)
+    states: int = 0
+    edges: int = 0
+
+
+def _preview(values: List[str], limit: int = 10) -> str:
+    head = ", ".join(values[:limit])
+    return head + (f", ... (+{len(values) - limit})" if len(values) > limit else "")
+
+
+def _strongly_connected(adjacency: List[List[int]]) -> List[List[int]]:
+    """強連結成分（Tarjan 法、再帰なし）"""
+    n = len(adjacency)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack: List[int] = []
+    components: List[List[int]] = []
+    counter = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, 0)]
+        while work:
+            v, i = work[-1]
+            if i < len(adjacency[v]):
+                work[-1] = (v, i + 1)
+                w = adjacency[v][i]
+                if index[w] == -1:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, 0))
+                elif on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                if low[v] < low[parent]:
+                    low[parent] = low[v]
+            if low[v] == index[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component.append(w)
+                    if w == v:
+                        break
+                components.append(component)
+    return components
+
+
+def analyze_content_graph(data: Dict[str, Any]) -> ValidationReport:
+    """
+    参照整合性・到達可能性・行き止まり・循環を 1 回のグラフ走査で調べる（O(V+E)）
+
+    起点は各画面のホーム（home:{screen_id}、なければ home:global）。
+    cat: の参照先メニューがない場合は「カテゴリ空」表示になるためエラーにしない。
+    """
+    report = ValidationReport()
+
+    # 必須セクションチェック
+    required = ["screen_registry", "menus", "content_items", "system_messages"]
+    for key in required:
+        if key not in data:
+            report.errors.append(f"Missing required section: {key}")
+    if report.errors:
+        return report
+
+    screens = data["screen_registry"]
+    menus = data["menus"]
+    items = data["content_items"]
+    valid_screens = set(screens)
+    valid_screens.add("global")  # フォールバック用
+
+    # 状態に番号を振る（メニューが 0..menu_count-1、コンテンツがその後ろ）
+    menu_count = len(menus)
+    node_of = {menu_id: i for i, menu_id in enumerate(menus)}
+    item_node = {item_id: menu_count + i for i, item_id in enumerate(items)}
+    adjacency: List[List[int]] = [[] for _ in range(menu_count + len(items))]
+    # 循環検出用（メニュー → メニュー、ホームへの遷移を除く）
+    menu_adjacency: List[List[int]] = [[] for _ in range(menu_count)]
+    home_global = node_of.get("home:global")
+
+    for v, (menu_id, menu) in enumerate(menus.items()):
+        options = menu.get("options", [])
+        if not options:
+            report.dead_ends.append(menu_id)
+        for opt in options:
+            next_state = opt.get("next_state", "")
+            kind, _, rest = next_state.partition(":")
+            target = None
+            if kind == "home":
+                screen = rest.split(":")[0]
+                if screen not in valid_screens:
+                    report.errors.append(f"Menu '{menu_id}' references unknown screen: {screen}")
+                    continue
+                # ホームメニューがない画面は global ホームを表示する
+                target = node_of.get(next_state, home_global)
+            elif kind == "menu":
+                target = node_of.get(next_state)
+                if target is None:
+                    target = node_of.get(rest)
+                if target is None or target >= menu_count:
+                    report.errors.append(f"Menu '{menu_id}' references unknown menu: {next_state}")
+                    continue
+            elif kind == "ans":
+                target = item_node.get(rest)
+                if target is None:
+                    report.errors.append(f"Menu '{menu_id}' references unknown content: {rest}")
+                    continue
+            elif kind == "cat":
+                target = node_of.get(next_state)
+            if target is None:
+                continue
+            adjacency[v].append(target)
+            if target < menu_count and kind != "home":
+                menu_adjacency[v].append(target)
+
+    for v, (item_id, item) in enumerate(items.items(), menu_count):
+        if not item.get("title"):
+            report.errors.append(f"Content '{item_id}' missing title")
+        if not item.get("body"):
+            report.errors.append(f"Content '{item_id}' missing body")
+        for related_id in item.get("related", ()):
+            target = item_node.get(related_id)
+            if target is None:
+                report.warnings.append(f"{item_id} -> {related_id}")
+                continue
+            adjacency[v].append(target)
+
+    report.states = len(adjacency)
+    report.edges = sum(len(targets) for targets in adjacency)
+
+    # 到達可能性（幅優先）
+    roots = {node_of.get(f"home:{screen_id}", home_global) for screen_id in screens}
+    roots.add(home_global)
+    roots.discard(None)
+    reached = [False] * len(adjacency)
+    queue = deque(roots)
+    for root in roots:
+        reached[root] = True
+    while queue:
+        v = queue.popleft()
+        for w in adjacency[v]:
+            if not reached[w]:
+                reached[w] = True
+                queue.append(w)
+    report.unreachable_menus = [m for m, ok in zip(menus, reached) if not ok]
+    report.unreachable_contents = [c for c, ok in zip(items, reached[menu_count:]) if not ok]
+
+    # 循環
+    menu_ids = list(menus)
+    for component in _strongly_connected(menu_adjacency):
+        v = component[0]
+        if len(component) > 1 or v in menu_adjacency[v]:
+            report.cycles.append([menu_ids[i] for i in reversed(component)])
+
+    return report
+
+
 class ContentRepository:
-    """コンテンツリポジトリ"""
+    """
+    コンテンツリポジトリ
+
+    読み込み結果は 1 つの ContentSnapshot にまとめ、属性 1 回の代入で公開する。
+    リロード時は新スナップショットの検証・派生データ構築（リロードフック）を
+    すべて終えてから差し替えるため、処理中のリクエストが読み込み途中の
+    データを見ることはない。
+    """
     
-    def __init__(self, content_path: str = None):
-        self.content_path = Path(content_path or config.CONTENT_PATH)
-        self._data: Dict[str, Any] = {}
+    def __init__(
+        self,
+        content_path: str = None,
+        source: str = None,
+        csv_dir: str = None,
+        bundle_path: str = None,
+        tenant_id: str = None,
+        shared: "SharedContentPool" = None
+    ):
+        self.tenant_id = tenant_id or config.DEFAULT_TENANT
+        self.set_source(content_path, source, csv_dir, bundle_path)
+        # テナント間で同一内容のセクションを共有する（ContentRegistry が設定）
+        self.shared = shared
+        self._snapshot = ContentSnapshot.build({})
         self._loaded = False
+        self._hooks: List[ReloadHook] = []
+        self._reload_lock = Lock()
+        self._source_signature: Optional[Tuple] = None
+        self._watcher: Optional[Thread] = None
+        self._watcher_stop = Event()
+    
+    def set_source(
+        self,
+        content_path: str = None,
+        source: str = None,
+        csv_dir: str = None,
+        bundle_path: str = None
+    ) -> None:
+        """読み込み元を設定（省略した項目は config の値。次回の load から有効）"""
+        self.content_path = Path(content_path or config.CONTENT_PATH)
+        self.source = (source or config.CONTENT_SOURCE).lower()
+        self.csv_dir = Path(csv_dir or config.CONTENT_CSV_DIR)
+        self.bundle_path = Path(bundle_path or config.CONTENT_BUNDLE_PATH)
     
     def load(self) -> None:
         """コンテンツを読み込み、検証する"""
-        if config.CONTENT_SOURCE.lower() == "csv":
-            self._data = self._load_from_csv()
-        else:
-            if not self.content_path.exists():
-                raise ContentValidationError(f"Content file not found: {self.content_path}")
-            with open(self.content_path, "r", encoding="utf-8") as f:
-                self._data = json.load(f)
+        with self._reload_lock:
+            signature = self._compute_signature()
+            self._publish(self._build_snapshot(), signature)
+        logger.info(f"Loaded contents from {self._source_label()}")
+    
+    def reload_if_changed(self) -> bool:
+        """
+        ソースが更新されていれば読み込み直して差し替える
+        
+        検証・派生データの構築（リロードフック）に失敗した場合は現行スナップショットを
+        維持し、失敗した署名を記録してソースが再び変わるまで再試行しない。
         
-        self._validate()
+        Returns:
+            差し替えたら True
+        """
+        with self._reload_lock:
+            signature = self._compute_signature()
+            if signature == self._source_signature:
+                return False
+            previous = self._snapshot.version
+            try:
+                snapshot = self._build_snapshot()
+                self._publish(snapshot, signature)
+            except (ContentValidationError, ValueError, OSError) as e:
+                # 同じ内容で再試行し続けないよう署名は記録する
+                self._source_signature = signature
+                logger.error(f"Content reload failed, keeping version {previous}: {e}")
+                return False
+            except Exception:
+                # リロードフック等の想定外の例外も、同じ内容ではトレースバックを 1 回だけ出す
+                self._source_signature = signature
+                logger.exception(f"Content reload failed, keeping version {previous}")
+                return False
+        logger.info(f"Reloaded contents from {self._source_label()} "
+                    f"({previous} -> {snapshot.version})")
+        return True
+    
+    def add_reload_hook(self, hook: ReloadHook) -> None:
+        """公開前のスナップショットに対して呼ぶフックを登録"""
+        if hook not in self._hooks:
+            self._hooks.append(hook)
+    
+    def start_watcher(self, interval: float = None) -> None:
+        """ソースの更新を監視するスレッドを開始（mtime ポーリング）"""
+        if self._watcher and self._watcher.is_alive():
+            return
+        interval = interval or config.CONTENT_RELOAD_INTERVAL
+        self._watcher_stop.clear()
+        self._watcher = Thread(
+            target=self._watch_loop, args=(interval,),
+            name=f"content-watcher-{self.tenant_id}", daemon=True
+        )
+        self._watcher.start()
+    
+    def stop_watcher(self) -> None:
+        """監視スレッドを停止"""
+        self._watcher_stop.set()
+        if self._watcher:
+            self._watcher.join()
+            self._watcher = None
+    
+    def _watch_loop(self, interval: float) -> None:
+        while not self._watcher_stop.wait(interval):
+            try:
+                self.reload_if_changed()
+            except Exception:
+                logger.exception("Content watch failed")
+    
+    def _build_snapshot(self) -> ContentSnapshot:
+        """読み込み → 検証 → スナップショット構築 → 派生データ構築"""
+        if self.source == "bundle":
+            # コンパイル時に検証・検索インデックス構築済み。状態の登録・テンプレートなど
+            # バンドルにない派生データは、公開前にリロードフックで構築する
+            snapshot = read_bundle(self.bundle_path)
+            if self.shared is not None:
+                self.shared.share_data(snapshot.data)
+            for hook in self._hooks:
+                hook(snapshot)
+            return snapshot
+        data = self._read_source()
+        report = self._validate(data)
+        if self.shared is not None:
+            self.shared.share_data(data)
+        snapshot = ContentSnapshot.build(data)
+        snapshot.derived["validation"] = report
+        for hook in self._hooks:
+            hook(snapshot)
+        return snapshot
+    
+    def _publish(self, snapshot: ContentSnapshot, signature: Optional[Tuple]) -> None:
+        # 参照の代入 1 回で差し替える（アトミック）
+        self._snapshot = snapshot
+        self._source_signature = signature
         self._loaded = True
-        logger.info(f"Loaded contents from {self.content_path}")
+    
+    def _uses_csv(self) -> bool:
+        return self.source == "csv"
+    
+    def _source_label(self) -> str:
+        if self._uses_csv():
+            path = str(self.csv_dir)
+        elif self.source == "bundle":
+            path = str(self.bundle_path)
+        else:
+            path = str(self.content_path)
+        return f"{path} (tenant {self.tenant_id})"
+    
+    def _source_paths(self) -> List[Path]:
+        if self._uses_csv():
+            return [self.csv_dir / name for name in CSV_FILES]
+        if self.source == "bundle":
+            return [self.bundle_path]
+        return [self.content_path]
+    
+    def _compute_signature(self) -> Tuple:
+        """ソースファイルの (パス, mtime, サイズ) 一覧（更新検知用）"""
+        signature = []
+        for path in self._source_paths():
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                signature.append((str(path), None, None))
+                continue
+            signature.append((str(path), st.st_mtime_ns, st.st_size))
+        return tuple(signature)
+    
+    def _read_source(self) -> Dict[str, Any]:
+        """設定されたソース（JSON / CSV）から生データを読み込む（バンドルは read_bundle）"""
+        if self._uses_csv():
+            return self._load_from_csv()
+        if not self.content_path.exists():
+            raise ContentValidationError(f"Content file not found: {self.content_path}")
+        with open(self.content_path, "r", encoding="utf-8") as f:
+            return json.load(f)
 
     def _load_from_csv(self) -> Dict[str, Any]:
         """CSV からコンテンツを読み込む"""
-        base_dir = Path(config.CONTENT_CSV_DIR)
+        base_dir = self.csv_dir
         if not base_dir.exists():
             raise ContentValidationError(f"CSV directory not found: {base_dir}")
 
-        def read_rows(filename: str) -> List[Dict[str, str]]:
+        fragments = {}
+        for filename in CSV_FILES:
             path = base_dir / filename
             if not path.exists():
+                if filename in OPTIONAL_CSV_FILES:
+                    continue
                 raise ContentValidationError(f"CSV file not found: {path}")
-            with open(path, "r", encoding="utf-8-sig", newline="") as f:
-                return list(csv.DictReader(f))
-
-        def split_list(value: str) -> List[str]:
-            if not value:
-                return []
-            return [v.strip() for v in value.split("|") if v.strip()]
-
-        # meta
-        meta_rows = read_rows("meta.csv")
-        meta = {}
-        for row in meta_rows:
-            key = (row.get("key") or "").strip()
-            val = (row.get("value") or "").strip()
-            if key:
-                meta[key] = val
-
-        # system_messages
-        sys_rows = read_rows("system_messages.csv")
-        system_messages = {}
-        for row in sys_rows:
-            key = (row.get("key") or "").strip()
-            val = row.get("value") or ""
-            if key:
-                system_messages[key] = val
-
-        # screen_registry
-        screen_rows = read_rows("screens.csv")
-        screen_registry = {}
-        for row in screen_rows:
-            screen_id = (row.get("screen_id") or "").strip()
-            if not screen_id:
-                continue
-            name = row.get("name") or ""
-            routes = split_list(row.get("routes") or "")
-            group = (row.get("group") or "").strip()
-            screen_registry[screen_id] = {
-                "name": name,
-                "routes": routes,
-                "group": group
-            }
-
-        # menus + options
-        menu_rows = read_rows("menus.csv")
-        menus = {}
-        temp_options = {}
-        for row in menu_rows:
-            menu_id = (row.get("menu_id") or "").strip()
-            if not menu_id:
-                continue
-            message = row.get("message") or ""
-            option_label = (row.get("option_label") or "").strip()
-            option_next = (row.get("option_next_state") or "").strip()
-            order_raw = (row.get("option_order") or "").strip()
-            try:
-                order = int(order_raw) if order_raw else 0
-            except ValueError:
-                order = 0
-
-            menu = menus.setdefault(menu_id, {"message": "", "options": []})
-            if message and not menu.get("message"):
-                menu["message"] = message
-
-            if option_label and option_next:
-                temp_options.setdefault(menu_id, []).append((order, {
-                    "label": option_label,
-                    "next_state": option_next
-                }))
-
-        for menu_id, opts in temp_options.items():
-            opts_sorted = sorted(opts, key=lambda x: x[0])
-            menus[menu_id]["options"] = [opt for _, opt in opts_sorted]
-
-        # content_items
-        content_rows = read_rows("content_items.csv")
-        content_items = {}
-        for row in content_rows:
-            item_id = (row.get("id") or "").strip()
-            if not item_id:
-                continue
-            title = row.get("title") or ""
-            body = row.get("body") or ""
-            category = (row.get("category") or "").strip()
-            screens = split_list(row.get("screens") or "")
-            keywords = split_list(row.get("keywords") or "")
-            priority_raw = (row.get("priority") or "").strip()
-            try:
-                priority = int(priority_raw) if priority_raw else 0
-            except ValueError:
-                priority = 0
-
-            content_items[item_id] = {
-                "title": title,
-                "body": body,
-                "category": category,
-                "screens": screens,
-                "keywords": keywords,
-                "links": [],
-                "related": [],
-                "priority": priority
-            }
-
-        # content_links (optional)
-        links_path = base_dir / "content_links.csv"
-        if links_path.exists():
-            link_rows = read_rows("content_links.csv")
-            for row in link_rows:
-                content_id = (row.get("content_id") or "").strip()
-                label = row.get("label") or ""
-                url = row.get("url") or ""
-                order_raw = (row.get("order") or "").strip()
-                try:
-                    order = int(order_raw) if order_raw else 0
-                except ValueError:
-                    order = 0
-                if content_id in content_items and label and url:
-                    content_items[content_id]["links"].append((order, {
-                        "label": label,
-                        "url": url
-                    }))
-            for item in content_items.values():
-                item["links"] = [l for _, l in sorted(item["links"], key=lambda x: x[0])]
-
-        # content_related (optional)
-        related_path = base_dir / "content_related.csv"
-        if related_path.exists():
-            related_rows = read_rows("content_related.csv")
-            for row in related_rows:
-                content_id = (row.get("content_id") or "").strip()
-                related_id = (row.get("related_id") or "").strip()
-                order_raw = (row.get("order") or "").strip()
-                try:
-                    order = int(order_raw) if order_raw else 0
-                except ValueError:
-                    order = 0
-                if content_id in content_items and related_id:
-                    content_items[content_id]["related"].append((order, related_id))
-            for item in content_items.values():
-                item["related"] = [rid for _, rid in sorted(item["related"], key=lambda x: x[0])]
-
-        return {
-            "meta": meta,
-            "screen_registry": screen_registry,
-            "system_messages": system_messages,
-            "menus": menus,
-            "content_items": content_items
-        }
+            fragments[filename] = parse_csv_fragment(filename, path.read_bytes())
+        return assemble_csv_fragments(fragments)
     
-    def _validate(self) -> None:
-        """参照整合性チェック"""
-        errors = []
-        
-        # 必須セクションチェック
-        required = ["screen_registry", "menus", "content_items", "system_messages"]
-        for key in required:
-            if key not in self._data:
-                errors.append(f"Missing required section: {key}")
-        
-        if errors:
-            raise ContentValidationError("\n".join(errors))
-        
-        # screen_registry の検証
-        valid_screens = set(self._data["screen_registry"].keys())
-        valid_screens.add("global")  # フォールバック用
-        
-        # menus の参照検証
-        valid_menus = set(self._data["menus"].keys())
-        for menu_id, menu in self._data["menus"].items():
-            for opt in menu.get("options", []):
-                next_state = opt.get("next_state", "")
-                if next_state.startswith("home:"):
-                    screen = next_state.split(":")[1]
-                    if screen not in valid_screens:
-                        errors.append(f"Menu '{menu_id}' references unknown screen: {screen}")
-                elif next_state.startswith("menu:"):
-                    ref_menu = next_state[5:]  # "menu:" を除去
-                    if f"menu:{ref_menu}" not in valid_menus and ref_menu not in valid_menus:
-                        errors.append(f"Menu '{menu_id}' references unknown menu: {next_state}")
-                elif next_state.startswith("ans:"):
-                    content_id = next_state[4:]  # "ans:" を除去
-                    if content_id not in self._data["content_items"]:
-                        errors.append(f"Menu '{menu_id}' references unknown content: {content_id}")
-        
-        # content_items の検証
-        for item_id, item in self._data["content_items"].items():
-            if not item.get("title"):
-                errors.append(f"Content '{item_id}' missing title")
-            if not item.get("body"):
-                errors.append(f"Content '{item_id}' missing body")
-        
-        if errors:
-            raise ContentValidationError("Validation errors:\n" + "\n".join(errors))
+    def _validate(self, data: Dict[str, Any]) -> "ValidationReport":
+        """参照整合性チェック（エラーがあれば ContentValidationError、警告はログのみ）"""
+        report = analyze_content_graph(data)
+        if report.errors:
+            raise ContentValidationError("Validation errors:\n" + "\n".join(report.errors))
         
-        logger.info("Content validation passed")
+        for label, values in (
+            ("Unknown related content", report.warnings),
+            ("Unreachable menus", report.unreachable_menus),
+            ("Dead-end menus (no options)", report.dead_ends),
+            ("Menu cycles", [" -> ".join(cycle) for cycle in report.cycles]),
+        ):
+            if values:
+                logger.warning(f"{label} ({len(values)}): {_preview(values)}")
+        if report.unreachable_contents:
+            logger.info(f"Contents reachable only by search ({len(report.unreachable_contents)}): "
+                        f"{_preview(report.unreachable_contents)}")
+        logger.info(f"Content validation passed ({report.states} states, {report.edges} edges)")
+        return report
     
     def _ensure_loaded(self) -> None:
         if not self._loaded:
             self.load()
     
+    # === Snapshot ===
+
+    @property
+    def snapshot(self) -> ContentSnapshot:
+        """正規化済みスナップショット（検索・チャットエンジンのホットパス用）"""
+        self._ensure_loaded()
+        return self._snapshot
+
+    def get_entry(self, content_id: str) -> Optional[ContentEntry]:
+        """正規化済みコンテンツを取得"""
+        return self.snapshot.by_id.get(content_id)
+
     # === Screen Registry ===
     
     def get_screen(self, screen_id: str) -> Optional[Dict[str, Any]]:
         """画面情報を取得"""
-        self._ensure_loaded()
-        return self._data["screen_registry"].get(screen_id)
+        return self.snapshot.get_screen(screen_id)
     
     def get_valid_screens(self) -> List[str]:
         """有効な画面ID一覧"""
-        self._ensure_loaded()
-        return list(self._data["screen_registry"].keys())
+        return self.snapshot.get_screen_ids()
     
     def resolve_screen_id(self, screen_id: str) -> str:
         """screen_id を検証し、不明なら global にフォールバック"""
-        self._ensure_loaded()
-        if screen_id in self._data["screen_registry"]:
+        if self.snapshot.get_screen(screen_id) is not None:
             return screen_id
         logger.warning(f"Unknown screen_id: {screen_id}, falling back to 'global'")
         return "global"
@@ -272,57 +872,193 @@ class ContentRepository:
     
     def get_menu(self, menu_id: str) -> Optional[Dict[str, Any]]:
         """メニューを取得"""
-        self._ensure_loaded()
-        return self._data["menus"].get(menu_id)
+        return self.snapshot.get_menu(menu_id)
+    
+    def get_all_menus(self) -> Dict[str, Dict[str, Any]]:
+        """全メニューを取得"""
+        return self.snapshot.get_menus()
     
     def get_home_menu(self, screen_id: str) -> Optional[Dict[str, Any]]:
         """画面のホームメニューを取得"""
-        self._ensure_loaded()
-        home_key = f"home:{screen_id}"
-        return self._data["menus"].get(home_key)
+        return self.snapshot.get_menu(f"home:{screen_id}")
     
     # === Content Items ===
     
     def get_content(self, content_id: str) -> Optional[Dict[str, Any]]:
         """コンテンツを取得"""
-        self._ensure_loaded()
-        return self._data["content_items"].get(content_id)
+        return self.snapshot.data["content_items"].get(content_id)
     
     def get_contents_by_screen(self, screen_id: str) -> List[Dict[str, Any]]:
-        """画面に関連するコンテンツ一覧"""
-        self._ensure_loaded()
-        result = []
-        for item_id, item in self._data["content_items"].items():
-            screens = item.get("screens", [])
-            if not screens or screen_id in screens:
-                result.append({"id": item_id, **item})
-        return result
+        """画面に関連するコンテンツ一覧（画面指定のないものを含む・定義順）"""
+        snapshot = self.snapshot
+        items = snapshot.data["content_items"]
+        shared = snapshot.screen_docs[SHARED_SCREEN]
+        docs = (
+            heapq.merge(snapshot.screen_docs.get(screen_id, ()), shared)
+            if screen_id != SHARED_SCREEN else shared
+        )
+        entries = snapshot.entries
+        return [{"id": entries[doc].id, **items[entries[doc].id]} for doc in docs]
     
     def get_all_contents(self) -> Dict[str, Dict[str, Any]]:
         """全コンテンツを取得"""
-        self._ensure_loaded()
-        return self._data["content_items"]
+        return self.snapshot.data["content_items"]
     
     # === System Messages ===
     
     def get_system_message(self, key: str) -> str:
         """システムメッセージを取得"""
-        self._ensure_loaded()
-        return self._data["system_messages"].get(key, "")
+        return self.snapshot.get_system_message(key)
     
     # === Search Config ===
     
     def get_search_config(self) -> Dict[str, Any]:
         """検索設定を取得"""
-        self._ensure_loaded()
-        return self._data.get("search_config", {
-            "enabled": True,
-            "min_query_length": 2,
-            "max_results": 5,
-            "synonyms": {},
-            "stopwords": []
-        })
+        return self.snapshot.get_search_config()
+
+
+
+# === マルチテナント ===
+
+class SharedContentPool:
+    """
+    テナント間で同一内容のオブジェクトを 1 つに共有する（読み取り専用として扱うこと）
+
+    system_messages や検索のシノニムは製品間でほぼ共通のため、
+    内容が一致すれば最初に読み込んだテナントのオブジェクトを使い回す。
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._objects: Dict[Tuple[str, bytes], Any] = {}
+
+    def share(self, kind: str, value: Any) -> Any:
+        """同じ内容のオブジェクトが登録済みならそれを、なければ value を登録して返す"""
+        try:
+            digest = hashlib.blake2b(
+                pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), digest_size=16
+            ).digest()
+        except (pickle.PicklingError, TypeError):
+            return value
+        with self._lock:
+            existing = self._objects.setdefault((kind, digest), value)
+        # 念のため内容も比較（ダイジェストの衝突・集合の順序違い）
+        return existing if existing is value or existing == value else value
+
+    def share_data(self, data: Dict[str, Any]) -> None:
+        """コンテンツデータの共有可能なセクションを置き換える（data を直接変更）"""
+        messages = data.get("system_messages")
+        if isinstance(messages, dict):
+            # 一部だけ異なる場合も文言の文字列は共有する
+            data["system_messages"] = self.share(
+                "system_messages", {
+                    sys.intern(k): sys.intern(v) if isinstance(v, str) else v
+                    for k, v in messages.items()
+                }
+            )
+        search_config = data.get("search_config")
+        if isinstance(search_config, dict):
+            for key in ("synonyms", "stopwords"):
+                if key in search_config:
+                    search_config[key] = self.share(key, search_config[key])
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+
+class ContentRegistry:
+    """
+    テナント ID → ContentRepository
+
+    既定テナント（config.DEFAULT_TENANT）は content_repo。それ以外は
+    config.TENANTS_PATH の JSON で定義する（キーがテナント ID）:
+
+        {"product_a": {"content_path": "a/contents.json"},
+         "product_b": {"source": "csv", "csv_dir": "b/csv"}}
+
+    相対パスは JSON ファイルの場所が基準。項目は ContentRepository の引数と同じ。
+    """
+
+    TENANT_KEYS = ("content_path", "source", "csv_dir", "bundle_path")
+
+    def __init__(self, default: ContentRepository):
+        self.shared = SharedContentPool()
+        default.shared = self.shared
+        self._default = default
+        self._repos: Dict[str, ContentRepository] = {default.tenant_id: default}
+
+    @property
+    def default(self) -> ContentRepository:
+        return self._default
+
+    def register(self, repo: ContentRepository) -> ContentRepository:
+        """リポジトリを登録（既存の同じテナント ID は置き換える）"""
+        repo.shared = self.shared
+        self._repos[repo.tenant_id] = repo
+        return repo
+
+    def configure(self, path: str) -> None:
+        """テナント定義の JSON を読み込んで登録"""
+        path = Path(path)
+        with open(path, "r", encoding="utf-8") as f:
+            tenants = json.load(f)
+        if not isinstance(tenants, dict):
+            raise ContentValidationError(f"Tenant config must be an object: {path}")
+        for tenant_id, spec in tenants.items():
+            unknown = set(spec) - set(self.TENANT_KEYS)
+            if unknown:
+                raise ContentValidationError(
+                    f"Tenant '{tenant_id}' has unknown keys: {', '.join(sorted(unknown))}"
+                )
+            kwargs = {
+                key: str(path.parent / spec[key]) if key != "source" else spec[key]
+                for key in self.TENANT_KEYS if spec.get(key)
+            }
+            if tenant_id == self._default.tenant_id:
+                # 既定テナントの読み込み元を上書き
+                self._default.set_source(**kwargs)
+                continue
+            self.register(ContentRepository(tenant_id=tenant_id, **kwargs))
+        logger.info(f"Configured {len(self._repos)} tenants from {path}")
+
+    def get(self, tenant_id: str) -> Optional[ContentRepository]:
+        return self._repos.get(tenant_id)
+
+    def tenant_ids(self) -> List[str]:
+        return list(self._repos)
+
+    def repositories(self) -> List[ContentRepository]:
+        return list(self._repos.values())
+
+    def load_all(self, workers: int = None) -> None:
+        """
+        全テナントを並行して読み込む（スレッドプール）
+
+        1 テナントでも失敗したら、失敗したテナントをまとめて ContentValidationError にする。
+        """
+        repos = self.repositories()
+        workers = max(1, min(workers or config.TENANT_LOAD_WORKERS, len(repos)))
+        errors = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="content-load") as pool:
+            futures = {pool.submit(repo.load): repo for repo in repos}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except (ContentValidationError, ValueError, OSError) as e:
+                    errors.append(f"[{futures[future].tenant_id}] {e}")
+        if errors:
+            raise ContentValidationError("Tenant load failed:\n" + "\n".join(errors))
+        logger.info(f"Loaded {len(repos)} tenants ({len(self.shared)} shared sections)")
+
+    def start_watchers(self, interval: float = None) -> None:
+        for repo in self.repositories():
+            repo.start_watcher(interval)
+
+    def stop_watchers(self) -> None:
+        for repo in self.repositories():
+            repo.stop_watcher()
 
 
 # シングルトンインスタンス
 content_repo = ContentRepository()
+content_registry = ContentRegistry(content_repo)
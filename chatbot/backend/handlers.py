@@ -0,0 +1,239 @@
+# API ハンドラ（フレームワーク非依存）
+# Flask（app.py）と ASGI（asgi.py）の両方から呼ぶ
+# 戻り値は (レスポンス辞書, HTTP ステータス)
+
+import logging
+from typing import Any, Dict, Mapping, Tuple
+
+from content_repo import content_repo, content_registry, ContentValidationError
+from chat_engine import chat_engines
+from session_store import session_store
+from config import config
+from models import dumps
+
+logger = logging.getLogger(__name__)
+
+Result = Tuple[Dict[str, Any], int]
+# 本文をエンコード済みで返すハンドラ用（JSON バイト列, HTTP ステータス, 追加ヘッダ）
+RawResult = Tuple[bytes, int, Dict[str, str]]
+
+
+def initialize() -> None:
+    """アプリケーション初期化"""
+    try:
+        if config.TENANTS_PATH:
+            content_registry.configure(config.TENANTS_PATH)
+        # 先にエンジンを作ってリロードフックを登録し、検索インデックス等も並行読み込みの中で構築する
+        engines = chat_engines.prepare_all()
+        content_registry.load_all()
+        for engine in engines:
+            engine.initialize()
+            engine.search.initialize()
+        session_store.start_sweeper()
+        if config.CONTENT_RELOAD_INTERVAL > 0:
+            content_registry.start_watchers(config.CONTENT_RELOAD_INTERVAL)
+        logger.info("Application initialized successfully")
+    except ContentValidationError as e:
+        logger.error(f"Content validation failed: {e}")
+        raise
+
+
+def error_result(code: str, message: str, status: int) -> Result:
+    """エラーレスポンス"""
+    return {
+        "success": False,
+        "error": {
+            "code": code,
+            "message": message
+        }
+    }, status
+
+
+def internal_error() -> Result:
+    """500 エラー（固定文言）"""
+    return error_result(
+        "INTERNAL_ERROR",
+        content_repo.get_system_message("error") or "エラーが発生しました",
+        500
+    )
+
+
+def handle_start(data: Dict[str, Any]) -> Result:
+    """
+    チャットセッション開始
+
+    Request:
+        {"screen_id": "yield_personal", "tenant_id": "product_a"}
+        （tenant_id 省略時は既定テナント）
+
+    Response:
+        ChatResponse (see models.py)
+    """
+    try:
+        screen_id = data.get("screen_id", "global")
+        tenant_id = data.get("tenant_id") or config.DEFAULT_TENANT
+
+        engine = chat_engines.get(tenant_id)
+        if engine is None:
+            return error_result("UNKNOWN_TENANT", f"unknown tenant: {tenant_id}", 404)
+
+        response = engine.start_session(screen_id)
+        return response.to_dict(), 200
+
+    except Exception:
+        logger.exception("Error in start_chat")
+        return internal_error()
+
+
+def handle_step(data: Dict[str, Any]) -> Result:
+    """
+    状態遷移
+
+    Request:
+        {
+            "session_id": "uuid",
+            "action": "navigate|show_content|back|reset|search|free_text",
+            "target": "state_id or content_id",
+            "query": "search query (for action=search or free_text)"
+        }
+
+    Response:
+        ChatResponse (see models.py)
+    """
+    try:
+        session_id = data.get("session_id", "")
+        action = data.get("action", "")
+        target = data.get("target", "")
+        query = data.get("query", "")
+
+        if not session_id:
+            return error_result("MISSING_SESSION_ID", "session_id is required", 400)
+
+        if not action:
+            return error_result("MISSING_ACTION", "action is required", 400)
+
+        # セッションを開始したテナントのエンジンで処理
+        response = chat_engines.step(session_id, action, target, query)
+
+        # セッション切れの場合は 410 を返す
+        if not response.success and "SESSION" in response.message:
+            return response.to_dict(), 410
+
+        return response.to_dict(), 200
+
+    except Exception:
+        logger.exception("Error in step_chat")
+        return internal_error()
+
+
+def handle_step_batch(data: Dict[str, Any]) -> Result:
+    """
+    複数アクションの一括遷移（ページ遷移後の会話復元など）
+
+    Request:
+        {
+            "session_id": "uuid",
+            "actions": [{"action": "navigate", "target": "..."}, {"action": "back"}, ...],
+            "final_only": false
+        }
+
+    Response:
+        {"success": bool, "session_id": "...", "responses": [ChatResponse, ...]}
+        （final_only なら responses は最後の 1 件のみ）
+    """
+    try:
+        session_id = data.get("session_id", "")
+        actions = data.get("actions")
+        final_only = bool(data.get("final_only", False))
+
+        if not session_id:
+            return error_result("MISSING_SESSION_ID", "session_id is required", 400)
+
+        if not isinstance(actions, list) or not actions:
+            return error_result("MISSING_ACTIONS", "actions must be a non-empty list", 400)
+
+        if len(actions) > config.STEP_BATCH_MAX_ACTIONS:
+            return error_result(
+                "TOO_MANY_ACTIONS",
+                f"actions must not exceed {config.STEP_BATCH_MAX_ACTIONS}",
+                400
+            )
+
+        for i, step in enumerate(actions):
+            if not isinstance(step, dict) or not step.get("action"):
+                return error_result("MISSING_ACTION", f"actions[{i}].action is required", 400)
+
+        responses = chat_engines.step_batch(session_id, actions, final_only)
+        last = responses[-1]
+
+        # セッション切れの場合は 410 を返す（/step と同じ判定）
+        if not last.success and "SESSION" in last.message:
+            return last.to_dict(), 410
+
+        return {
+            "success": all(r.success for r in responses),
+            "session_id": last.session_id,
+            "responses": [r.to_dict() for r in responses],
+        }, 200
+
+    except Exception:
+        logger.exception("Error in step_batch")
+        return internal_error()
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match（カンマ区切り・弱い比較）に etag が含まれるか"""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def handle_graph(args: Mapping[str, str], if_none_match: str = "") -> RawResult:
+    """
+    画面内の遷移グラフ（ウィジェットのローカル遷移用）
+
+    Query:
+        screen_id, tenant_id（省略時は global / 既定テナント）
+
+    Response:
+        {"version", "screen_id", "home", "max_history", "max_actions", "states": {state_id: {...}}}
+        ETag はグラフ本文のハッシュ。If-None-Match が一致すれば 304（本文なし）
+    """
+    try:
+        tenant_id = args.get("tenant_id") or config.DEFAULT_TENANT
+
+        engine = chat_engines.get(tenant_id)
+        if engine is None:
+            payload, status = error_result("UNKNOWN_TENANT", f"unknown tenant: {tenant_id}", 404)
+            return dumps(payload), status, {}
+
+        etag, body = engine.export_graph(args.get("screen_id") or "global")
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={config.GRAPH_CACHE_MAX_AGE}",
+        }
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return b"", 304, headers
+        return body, 200, headers
+
+    except Exception:
+        logger.exception("Error in graph")
+        payload, status = internal_error()
+        return dumps(payload), status, {}
+
+
+def handle_health() -> Result:
+    """ヘルスチェック"""
+    return {
+        "status": "ok",
+        "version": content_repo.snapshot.version,
+        "tenants": {
+            repo.tenant_id: repo.snapshot.version for repo in content_registry.repositories()
+        },
+        "search_cache": {
+            engine.tenant_id: engine.search.cache.stats()
+            for engine in chat_engines.engines() if engine.search.cache is not None
+        }
+    }, 200
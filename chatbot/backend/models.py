@@ -1,10 +1,24 @@
 # API入出力の型定義
 # dataclassを使用（Flask向け）
+# レスポンス系は __slots__ 付きで、to_dict は asdict を使わず手書き（再帰コピーを避ける）
 
-from dataclasses import dataclass, field, asdict
-from typing import Optional, List, Dict, Any
+import json
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Tuple
 from enum import Enum
 
+try:
+    import orjson  # 任意依存: あれば JSON エンコードを高速化
+except ImportError:
+    orjson = None
+
+
+def dumps(payload: Any) -> bytes:
+    """レスポンス用 JSON エンコード（UTF-8 バイト列）"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 
 class ActionType(Enum):
     """選択肢のアクション種別"""
@@ -15,7 +29,7 @@ class ActionType(Enum):
     EXTERNAL = "external"
 
 
-@dataclass
+@dataclass(slots=True)
 class OptionItem:
     """選択肢アイテム"""
     id: str
@@ -24,10 +38,15 @@ class OptionItem:
     target: str
     
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+        return {
+            "id": self.id,
+            "label": self.label,
+            "action": self.action,
+            "target": self.target,
+        }
 
 
-@dataclass
+@dataclass(slots=True)
 class ContentDetail:
     """コンテンツ詳細"""
     id: str
@@ -36,30 +55,35 @@ class ContentDetail:
     links: List[Dict[str, str]] = field(default_factory=list)
     
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+        return {
+            "id": self.id,
+            "title": self.title,
+            "body": self.body,
+            "links": self.links,
+        }
 
 
-@dataclass
+@dataclass(slots=True)
 class StateInfo:
     """状態情報"""
     state_id: str
     history: List[str] = field(default_factory=list)
     
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+        return {"state_id": self.state_id, "history": self.history}
 
 
-@dataclass
+@dataclass(slots=True)
 class InputMode:
     """入力モード"""
     free_text: bool = False
     placeholder: str = ""
     
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+        return {"free_text": self.free_text, "placeholder": self.placeholder}
 
 
-@dataclass
+@dataclass(slots=True)
 class ChatResponse:
     """チャットAPIレスポンス"""
     success: bool
@@ -70,14 +94,20 @@ class ChatResponse:
     content: Optional[ContentDetail] = None
     input_mode: InputMode = field(default_factory=InputMode)
     screen_info: Optional[Dict[str, str]] = None
+    # 事前シリアライズ済みの options（ResponseTemplate 由来。読み取り専用で共有）
+    options_payload: Optional[List[Dict[str, Any]]] = None
     
     def to_dict(self) -> Dict[str, Any]:
+        if self.options_payload is not None:
+            options = self.options_payload
+        else:
+            options = [o.to_dict() for o in self.options]
         result = {
             "success": self.success,
             "session_id": self.session_id,
             "state": self.state.to_dict(),
             "message": self.message,
-            "options": [o.to_dict() for o in self.options],
+            "options": options,
             "input_mode": self.input_mode.to_dict(),
         }
         if self.content:
@@ -85,6 +115,38 @@ class ChatResponse:
         if self.screen_info:
             result["screen_info"] = self.screen_info
         return result
+    
+    def to_json(self) -> bytes:
+        """JSON バイト列に直接変換"""
+        return dumps(self.to_dict())
+
+
+@dataclass(frozen=True, slots=True)
+class ResponseTemplate:
+    """
+    静的な状態（home / menu / cat）のレスポンス断片
+    
+    コンテンツ読み込み後に一度だけ構築し、リクエストごとには
+    session_id と state だけを差し込む。
+    """
+    message: str
+    options: Tuple[OptionItem, ...]
+    options_payload: List[Dict[str, Any]]
+    screen_info: Optional[Dict[str, str]] = None
+    
+    @classmethod
+    def build(
+        cls,
+        message: str,
+        options: List[OptionItem],
+        screen_info: Optional[Dict[str, str]] = None
+    ) -> "ResponseTemplate":
+        return cls(
+            message=message,
+            options=tuple(options),
+            options_payload=[o.to_dict() for o in options],
+            screen_info=screen_info
+        )
 
 
 @dataclass 
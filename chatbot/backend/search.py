@@ -1,143 +1,712 @@
 # 検索機能
 # キーワードによる候補提示（生成禁止確保）
 
-import re
+import heapq
 import logging
-from typing import List, Dict, Any, Tuple
+import math
+from itertools import chain, count
+from array import array
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Dict, Any, Tuple, Iterable, Optional
 
-from content_repo import content_repo
+from content_repo import (
+    content_repo, normalize_text, ContentEntry, ContentRepository, ContentSnapshot, SHARED_SCREEN,
+    BUNDLE_CONFIG,
+)
 from config import config
 
 logger = logging.getLogger(__name__)
 
 
+# フィールド種別（posting の値はビットマスク）
+FIELD_TITLE = 1
+FIELD_KEYWORDS = 2
+FIELD_BODY = 4
+
+# トークナイザ種別（search_config.tokenizer） → 索引する n-gram の最大長
+TOKENIZER_GRAMS = {
+    "whitespace": 2,  # 空白区切り（bigram 索引で候補を絞り部分一致確認）
+    "bigram": 2,      # 文字 bigram（日本語の分かち書きなしクエリ向け）
+    "trigram": 3,     # 文字 trigram（bigram より語の区別が強い）
+}
+DEFAULT_TOKENIZER = "whitespace"
+
+# フィールドごとの加点（タイトル > キーワード > 本文）
+FIELD_WEIGHTS: Tuple[Tuple[int, float], ...] = (
+    (FIELD_TITLE, 3.0),
+    (FIELD_KEYWORDS, 2.0),
+    (FIELD_BODY, 1.0),
+)
+
+# ランキング方式（search_config.ranking）
+#   bm25f:    フィールド別の語頻度・文書長で正規化した BM25F（既定）
+#   weighted: 一致したフィールドの固定加点（FIELD_WEIGHTS）
+RANKINGS = ("bm25f", "weighted")
+DEFAULT_RANKING = "bm25f"
+
+# 検索インデックス・オートマトンの構築に使う設定（違うバンドルは読み込み時に作り直す）
+BUNDLE_CONFIG.update(
+    SEARCH_MIN_QUERY_LEN=config.SEARCH_MIN_QUERY_LEN,
+    DEFAULT_TOKENIZER=DEFAULT_TOKENIZER,
+    DEFAULT_RANKING=DEFAULT_RANKING,
+)
+
+# BM25F のパラメータ
+BM25_K1 = 1.2
+# フィールドごとの長さ正規化の強さ b（短いフィールドほど弱く）。重みは FIELD_WEIGHTS
+BM25_B = {FIELD_TITLE: 0.5, FIELD_KEYWORDS: 0.3, FIELD_BODY: 0.75}
+
+# weighted で 1 語が文書に加えうる最大（全フィールドで一致）
+WEIGHTED_MAX_SCORE = sum(weight for _, weight in FIELD_WEIGHTS)
+
+
+def _grams(text: str, n: int) -> Iterable[str]:
+    """文字 n-gram を列挙（n 未満の文字列はそのまま）"""
+    if len(text) <= n:
+        return (text,) if text else ()
+    return (text[i:i + n] for i in range(len(text) - n + 1))
+
+
+class SynonymAutomaton:
+    """
+    シノニムの見出し語・ストップワードの Aho-Corasick オートマトン
+
+    正規化済みクエリを 1 回走査して、トークン分割・ストップワード除去・
+    シノニム展開をまとめて行う。見出し語は空白で区切られたトークンの中に
+    埋め込まれていても見つける（分かち書きしない日本語クエリ向け）。ただし
+    トークンの一部としての一致は min_length 文字以上の見出し語に限る
+    （短い見出し語はトークン全体が一致した場合のみ）。
+    遷移はトークンの区切り（空白）で根に戻す。
+    """
+
+    def __init__(self, synonyms: Dict[str, List[str]], stopwords: Iterable[str], min_length: int = 2):
+        self.min_length = min_length
+        # ノードごとの遷移・失敗遷移・出力（パターン番号。失敗遷移先の出力を含む）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        # ノードごとの出力のうち、トークンの一部としても一致させる見出し語
+        self._embedded: List[Tuple[int, ...]] = []
+        # パターン番号 → 長さ / 展開語（見出し語自身を含む。ストップワードは None）
+        self._lengths: List[int] = []
+        self._expansions: List[Any] = []
+
+        for key, values in synonyms.items():
+            if key:
+                expansions = [key]
+                expansions.extend(v for v in (normalize_text(s) for s in values) if v not in expansions)
+                self._add(key, tuple(expansions))
+        for word in stopwords:
+            if word:
+                self._add(word, None)
+        self._link()
+
+    def _add(self, pattern: str, expansions) -> None:
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] += (len(self._lengths),)
+        self._lengths.append(len(pattern))
+        self._expansions.append(expansions)
+
+    def _link(self) -> None:
+        """失敗遷移を幅優先で設定し、出力を失敗遷移先と合併"""
+        goto, fail, out = self._goto, self._fail, self._out
+        # 根の子の失敗遷移は根
+        queue = list(goto[0].values())
+        for node in queue:
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] += out[fail[nxt]]
+        self._embedded = [
+            tuple(
+                pid for pid in pids
+                if self._expansions[pid] is not None and self._lengths[pid] >= self.min_length
+            )
+            for pids in out
+        ]
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def expand(self, text: str) -> List[str]:
+        """
+        正規化済みテキスト → 検索トークン（出現順・重複なし）
+
+        - 空白区切りのトークン（2 文字以上、トークン全体がストップワードなら除外）
+        - トークン全体に一致した見出し語、トークン内に現れた min_length 文字以上の
+          見出し語と、その展開語（ストップワードのトークンは展開しない）
+        """
+        goto, fail, embedded = self._goto, self._fail, self._embedded
+        lengths, expansions = self._lengths, self._expansions
+        result: Dict[str, None] = {}
+        found: List[int] = []
+
+        for token in text.split():
+            if len(token) < 2:
+                continue
+            node = 0
+            found.clear()
+            for ch in token:
+                while node and ch not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(ch, 0)
+                found.extend(embedded[node])
+            # 末尾で終わる一致のうちトークン全体と同じ長さのもの
+            whole = [pid for pid in self._out[node] if lengths[pid] == len(token)]
+            if any(expansions[pid] is None for pid in whole):
+                continue
+            result[token] = None
+            found.extend(whole)
+            for pid in found:
+                for word in expansions[pid]:
+                    result[word] = None
+
+        return list(result)
+
+
+class PostingPartition:
+    """
+    転置インデックスの 1 区画（1 画面分、または画面指定のないコンテンツ）
+
+    文書番号は ContentSnapshot.entries の添字のまま。複数の画面を指定した
+    コンテンツは、それぞれの画面の区画に入る。
+    """
+
+    __slots__ = ("size", "postings", "keyword_docs", "keyword_lengths")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.postings: Dict[str, Dict[int, int]] = {}
+        # キーワード完全一致（「キーワードがトークンに含まれる」判定用）
+        self.keyword_docs: Dict[str, List[int]] = {}
+        self.keyword_lengths: List[int] = []
+
+    def add(self, doc: int, grams: Dict[str, int], keywords: Iterable[str]) -> None:
+        postings = self.postings
+        for gram, mask in grams.items():
+            posting = postings.get(gram)
+            if posting is None:
+                postings[gram] = {doc: mask}
+            else:
+                posting[doc] = mask
+        for kw in keywords:
+            self.keyword_docs.setdefault(kw, []).append(doc)
+
+
+class SearchIndex:
+    """
+    転置インデックス
+
+    文字 n-gram（2〜gram 文字）→ {文書番号: フィールドビットマスク} の
+    posting を持つ。クエリトークンは bigram の posting を積集合で絞り込み、
+    候補文書に対してのみ部分一致を確認する。n-gram モードのクエリ語は
+    posting を直接引くだけで一致が確定する。
+
+    posting は画面ごとの区画（ContentSnapshot.screen_docs と同じ単位）に分け、
+    画面を指定した検索はその画面と画面指定なしの区画だけを辿る。
+    """
+
+    GRAM = 2
+
+    def __init__(self, snapshot: ContentSnapshot, gram: int = GRAM):
+        self.gram = max(gram, self.GRAM)
+        self.snapshot = snapshot
+        self.entries = snapshot.entries
+        self.partitions: Dict[str, PostingPartition] = {
+            screen_id: PostingPartition(len(docs)) for screen_id, docs in snapshot.screen_docs.items()
+        }
+
+        for doc, entry in enumerate(self.entries):
+            grams = self._doc_grams(entry)
+            for screen_id in entry.screens or (SHARED_SCREEN,):
+                self.partitions[screen_id].add(doc, grams, entry.keyword_set)
+        for part in self.partitions.values():
+            part.keyword_lengths = sorted({len(k) for k in part.keyword_docs})
+        self._all_partitions = list(self.partitions.values())
+        self._build_field_norms()
+        # 枝刈りで新しい文書が得うるスコアの上限に使う
+        self.max_priority_boost = max((e.priority_boost for e in self.entries), default=0.0)
+
+    def _build_field_norms(self) -> None:
+        """
+        BM25F の文書長正規化を事前計算
+
+        field_norms[field_bit][doc] = 重み / (1 - b + b * フィールド長 / 平均長)
+        （フィールド長は正規化後の文字数。キーワードは全キーワードの合計）
+        """
+        # キーワードの出現回数を 1 回の count で数えるための連結（区切りはトークンに現れない文字）
+        self.keywords_text: List[str] = ["\n".join(e.keywords_norm) for e in self.entries]
+        lengths = {
+            FIELD_TITLE: [len(e.title_norm) for e in self.entries],
+            FIELD_KEYWORDS: [sum(len(k) for k in e.keywords_norm) for e in self.entries],
+            FIELD_BODY: [len(e.body_norm) for e in self.entries],
+        }
+        self.field_norms: Dict[int, array] = {}
+        for field_bit, weight in FIELD_WEIGHTS:
+            field_lengths = lengths[field_bit]
+            avg = sum(field_lengths) / len(field_lengths) if field_lengths else 0.0
+            b = BM25_B[field_bit] if avg else 0.0
+            self.field_norms[field_bit] = array(
+                "d", (weight / (1.0 - b + b * length / (avg or 1.0)) for length in field_lengths)
+            )
+
+    def _doc_grams(self, entry: ContentEntry) -> Dict[str, int]:
+        """文書の n-gram → フィールドビットマスク"""
+        grams: Dict[str, int] = {}
+        fields = [(FIELD_TITLE, entry.title_norm), (FIELD_BODY, entry.body_norm)]
+        fields.extend((FIELD_KEYWORDS, kw) for kw in entry.keywords_norm)
+        for field_bit, text in fields:
+            for n in range(self.GRAM, self.gram + 1):
+                for gram in _grams(text, n):
+                    grams[gram] = grams.get(gram, 0) | field_bit
+        return grams
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def gram_count(self) -> int:
+        """全区画の posting 数（ログ用）"""
+        return sum(len(part.postings) for part in self._all_partitions)
+
+    def partitions_for(self, screen_id: str = None) -> List[PostingPartition]:
+        """
+        検索で辿る区画
+
+        画面指定ありはその画面と画面指定なしの区画（互いに素）、
+        指定なしは全区画（複数画面のコンテンツが重複する）。
+        """
+        if not screen_id:
+            return self._all_partitions
+        return [
+            part for part in (self.partitions.get(screen_id), self.partitions.get(SHARED_SCREEN))
+            if part is not None
+        ]
+
+    def match(self, token: str, part: PostingPartition) -> Dict[int, int]:
+        """区画内でトークンに一致する {文書番号: フィールドビットマスク} を返す"""
+        matched: Dict[int, int] = {}
+
+        # トークンがフィールドに含まれる: bigram posting の積集合 → 部分一致確認
+        postings = []
+        for gram in set(_grams(token, self.GRAM)):
+            posting = part.postings.get(gram)
+            if posting is None:
+                postings = []
+                break
+            postings.append(posting)
+
+        if postings:
+            postings.sort(key=len)
+            exact = len(token) <= self.GRAM
+            for doc, mask in postings[0].items():
+                for posting in postings[1:]:
+                    mask &= posting.get(doc, 0)
+                    if not mask:
+                        break
+                if not mask:
+                    continue
+                if not exact:
+                    mask = self._verify(doc, token, mask)
+                if mask:
+                    matched[doc] = mask
+
+        # キーワードがトークンに含まれる: トークンの部分文字列をキーワード辞書で引く
+        for length in part.keyword_lengths:
+            if length > len(token):
+                break
+            for i in range(len(token) - length + 1):
+                docs = part.keyword_docs.get(token[i:i + length])
+                if docs:
+                    for doc in docs:
+                        matched[doc] = matched.get(doc, 0) | FIELD_KEYWORDS
+
+        return matched
+
+    def idf(self, doc_freq: int, n: int) -> float:
+        """BM25 の IDF（常に正。n は検索対象の文書数）"""
+        return math.log(1.0 + (n - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def bm25f_tf(self, doc: int, term: str, mask: int) -> float:
+        """一致したフィールドでの出現回数を重み・文書長で正規化して合算（BM25F の擬似語頻度）"""
+        entry = self.entries[doc]
+        tf = 0.0
+        if mask & FIELD_TITLE:
+            tf += entry.title_norm.count(term) * self.field_norms[FIELD_TITLE][doc]
+        if mask & FIELD_BODY:
+            tf += entry.body_norm.count(term) * self.field_norms[FIELD_BODY][doc]
+        if mask & FIELD_KEYWORDS:
+            # キーワードがトークンに含まれる場合（count では数えられない）も 1 回とみなす
+            tf += (self.keywords_text[doc].count(term) or 1) * self.field_norms[FIELD_KEYWORDS][doc]
+        return tf
+
+    def match_gram(self, gram: str, part: PostingPartition) -> Dict[int, int]:
+        """区画内の n-gram 語の posting（gram 文字以下なら部分一致と等価）"""
+        return part.postings.get(gram, {})
+
+    def _verify(self, doc: int, token: str, mask: int) -> int:
+        """bigram 共起だけでは部分一致を保証しないため、候補文書のみ確認"""
+        entry = self.entries[doc]
+        if mask & FIELD_TITLE and token not in entry.title_norm:
+            mask &= ~FIELD_TITLE
+        if mask & FIELD_BODY and token not in entry.body_norm:
+            mask &= ~FIELD_BODY
+        if mask & FIELD_KEYWORDS and not any(token in kw for kw in entry.keywords_norm):
+            mask &= ~FIELD_KEYWORDS
+        return mask
+
+
+# SearchState.generation の採番（プロセス内で単調増加）
+_GENERATIONS = count()
+
+
+class SearchState:
+    """
+    1 スナップショット分の検索設定とインデックス
+
+    ContentSnapshot.derived に格納し、コンテンツのリロード時は
+    公開前に新しいスナップショット用を構築する。
+    generation は構築（バンドルからの復元を含む）順の通し番号で、
+    新しい状態ほど大きい（QueryCache が古い状態を見分けるのに使う）。
+    """
+
+    __slots__ = ("snapshot", "synonyms", "stopwords", "automaton", "tokenizer", "ranking", "index",
+                 "generation")
+
+    def __init__(self, snapshot: ContentSnapshot):
+        search_config = snapshot.get_search_config()
+        self.generation = next(_GENERATIONS)
+        self.snapshot = snapshot
+        self.synonyms: Dict[str, List[str]] = {
+            normalize_text(k): v for k, v in search_config.get("synonyms", {}).items()
+        }
+        self.stopwords: set = set(search_config.get("stopwords", []))
+        self.automaton = SynonymAutomaton(self.synonyms, self.stopwords, config.SEARCH_MIN_QUERY_LEN)
+        tokenizer = search_config.get("tokenizer", DEFAULT_TOKENIZER)
+        if tokenizer not in TOKENIZER_GRAMS:
+            logger.warning(f"Unknown tokenizer: {tokenizer}, falling back to '{DEFAULT_TOKENIZER}'")
+            tokenizer = DEFAULT_TOKENIZER
+        self.tokenizer = tokenizer
+        ranking = search_config.get("ranking", DEFAULT_RANKING)
+        if ranking not in RANKINGS:
+            logger.warning(f"Unknown ranking: {ranking}, falling back to '{DEFAULT_RANKING}'")
+            ranking = DEFAULT_RANKING
+        self.ranking = ranking
+        self.index = SearchIndex(snapshot, TOKENIZER_GRAMS[tokenizer])
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # generation はプロセス内でのみ意味を持つため、バンドルには保存しない
+        return {name: getattr(self, name) for name in self.__slots__ if name != "generation"}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.generation = next(_GENERATIONS)
+
+
+class QueryCache:
+    """
+    検索結果の LRU キャッシュ（キー: (正規化済みクエリ, screen_id, max_results)）
+
+    結果は計算に使った SearchState（スナップショット）に紐づけ、より新しい状態
+    （generation が大きい）で引かれたら（meta.version の更新を伴うリロード・
+    同じ版での再読み込みとも）全件を捨ててその状態に移る。リロードをまたいだ
+    リクエストが古い状態で引いた場合は、キャッシュに触れずにミスとする。
+    古い状態で計算した結果は格納しない。
+    呼び出し側が結果を書き換えても影響しないよう、格納時・取得時とも複製する。
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, Optional[str], int], Tuple[Dict[str, Any], ...]]" = OrderedDict()
+        self._state: Optional[SearchState] = None
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, state: SearchState, key: Tuple[str, Optional[str], int]) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            if state is not self._state:
+                if self._state is not None and state.generation < self._state.generation:
+                    # 公開済みの新しい状態がある → 古い状態の結果は出さず、戻りもしない
+                    self.misses += 1
+                    return None
+                if self._state is not None and self._entries:
+                    logger.info(f"Search cache cleared ({self._state.snapshot.version} -> "
+                                f"{state.snapshot.version})")
+                self._entries.clear()
+                self._state = state
+            results = self._entries.get(key)
+            if results is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [dict(result) for result in results]
+
+    def put(self, state: SearchState, key: Tuple[str, Optional[str], int], results: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            if state is not self._state:
+                return
+            self._entries[key] = tuple(dict(result) for result in results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """/health 用の統計"""
+        with self._lock:
+            return {
+                "version": self._state.snapshot.version if self._state is not None else None,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
 class SearchEngine:
     """検索エンジン（候補提示のみ）"""
-    
-    def __init__(self):
-        self._synonyms: Dict[str, List[str]] = {}
-        self._stopwords: set = set()
+
+    # ContentSnapshot.derived のキー
+    DERIVED_KEY = "search"
+
+    def __init__(self, repo: ContentRepository = None):
+        # テナントごとに 1 インスタンス（既定は content_repo）
+        self._repo = repo or content_repo
         self._initialized = False
-    
+        # 上位 max_results 件に入りえない文書のスコア計算を省く（False で全件計算）
+        self.prune = True
+        # 同じクエリの結果を再利用（SEARCH_CACHE_SIZE=0 で無効）
+        self.cache = QueryCache(config.SEARCH_CACHE_SIZE) if config.SEARCH_CACHE_SIZE > 0 else None
+        # 読み込み・リロード時は公開前の新スナップショットに対してインデックスを構築する
+        self._repo.add_reload_hook(self.prepare)
+
     def initialize(self) -> None:
-        """検索設定を読み込み"""
-        search_config = content_repo.get_search_config()
-        self._synonyms = search_config.get("synonyms", {})
-        self._stopwords = set(search_config.get("stopwords", []))
+        """検索設定を読み込み、転置インデックスを構築"""
+        self._state()
         self._initialized = True
-    
+
     def _ensure_initialized(self) -> None:
         if not self._initialized:
             self.initialize()
-    
-    def _normalize(self, text: str) -> str:
-        """テキスト正規化"""
-        # 小文字化、空白統一
-        text = text.lower().strip()
-        text = re.sub(r"\s+", " ", text)
-        return text
-    
-    def _tokenize(self, text: str) -> List[str]:
-        """トークン分割（簡易）"""
-        text = self._normalize(text)
-        # スペースで分割 + ストップワード除去
-        tokens = [t for t in text.split() if t not in self._stopwords and len(t) >= 2]
-        return tokens
-    
-    def _expand_synonyms(self, tokens: List[str]) -> List[str]:
-        """シノニム展開"""
-        expanded = set(tokens)
+
+    def prepare(self, snapshot: ContentSnapshot) -> SearchState:
+        """スナップショット用の検索状態を構築して derived に格納（バンドル由来の構築済みはそのまま）"""
+        state = snapshot.derived.get(self.DERIVED_KEY)
+        if state is not None:
+            return state
+        state = SearchState(snapshot)
+        shared = self._repo.shared
+        if shared is not None:
+            # 正規化後のシノニム・ストップワードもテナント間で共有
+            state.synonyms = shared.share("search_synonyms", state.synonyms)
+            state.stopwords = shared.share("search_stopwords", state.stopwords)
+        snapshot.derived[self.DERIVED_KEY] = state
+        logger.info(f"Search index built: {len(state.index)} items, "
+                    f"{len(state.index.partitions)} partitions, {state.index.gram_count} grams, "
+                    f"{len(state.automaton)} synonym/stopword patterns ({state.tokenizer}, {state.ranking})")
+        return state
+
+    def _state(self) -> SearchState:
+        """公開中スナップショットの検索状態"""
+        snapshot = self._repo.snapshot
+        state = snapshot.derived.get(self.DERIVED_KEY)
+        if state is None:
+            state = self.prepare(snapshot)
+        return state
+
+    def _tokenize(self, state: SearchState, text: str) -> List[str]:
+        """トークン分割 + ストップワード除去 + シノニム展開（オートマトンで 1 回走査）"""
+        return state.automaton.expand(normalize_text(text))
+
+    def _to_terms(self, state: SearchState, tokens: List[str]) -> List[str]:
+        """検索語に変換（n-gram モードでは各トークンを n-gram に分解）"""
+        if state.tokenizer == "whitespace":
+            return tokens
+        n = TOKENIZER_GRAMS[state.tokenizer]
+        terms = set()
         for token in tokens:
-            if token in self._synonyms:
-                expanded.update(self._synonyms[token])
-        return list(expanded)
-    
-    def _score_item(self, item: Dict[str, Any], query_tokens: List[str]) -> float:
-        """アイテムのスコア計算"""
-        score = 0.0
-        
-        title = self._normalize(item.get("title", ""))
-        body = self._normalize(item.get("body", ""))
-        keywords = [self._normalize(k) for k in item.get("keywords", [])]
-        
-        for token in query_tokens:
-            # タイトル一致（高スコア）
-            if token in title:
-                score += 3.0
-            # キーワード一致（中スコア）
-            if any(token in kw or kw in token for kw in keywords):
-                score += 2.0
-            # 本文一致（低スコア）
-            if token in body:
-                score += 1.0
-        
-        # 優先度による補正
-        priority = item.get("priority", 50)
-        score += priority / 100.0
-        
-        return score
-    
+            terms.update(g for g in _grams(token, n) if g not in state.stopwords)
+        return list(terms)
+
+    def _score(
+        self,
+        state: SearchState,
+        query_terms: List[str],
+        screen_id: str = None,
+        top_k: int = None
+    ) -> Dict[int, float]:
+        """
+        posting を辿って一致した文書のみスコア計算
+
+        top_k を指定すると MaxScore 方式で枝刈りする。語を寄与の上限が大きい順に
+        処理し、残りの語の上限の合計（+ 優先度補正の最大）が暫定 top_k 位の
+        スコアに届かなくなったら、以降は新しい文書を候補に加えず、既存候補の
+        一致だけを引く。届かない候補も捨てるため、戻り値は top_k 位以内に
+        入りうる文書のみ（順位・スコアは枝刈りしない場合と同じ）。
+        """
+        index = state.index
+        match = index.match if state.tokenizer == "whitespace" else index.match_gram
+        bm25f = state.ranking == "bm25f"
+        bm25f_tf = index.bm25f_tf
+        entries = index.entries
+
+        # 画面指定ありは画面の区画 + 画面指定なしの区画だけを辿る（画面フィルタ不要）
+        parts = index.partitions_for(screen_id)
+        # IDF は辿る区画の文書数・文書頻度で計算する
+        n = sum(part.size for part in parts) if screen_id else len(index)
+
+        # (寄与の上限, 語, 区画ごとの一致文書, idf) を上限の大きい順に
+        plans = []
+        for term in query_terms:
+            if screen_id:
+                matched = [m for m in (match(term, part) for part in parts) if m]
+            else:
+                # 全区画は重複があるためまとめる
+                merged: Dict[int, int] = {}
+                for part in parts:
+                    merged.update(match(term, part))
+                matched = [merged] if merged else []
+            if not matched:
+                continue
+            if bm25f:
+                # 文書頻度は一致した文書数（n-gram 語では posting 長そのもの）
+                idf = index.idf(sum(len(m) for m in matched), n)
+                # tf / (k1 + tf) < 1
+                bound = idf * (BM25_K1 + 1.0)
+            else:
+                idf = 0.0
+                bound = WEIGHTED_MAX_SCORE
+            plans.append((bound, term, matched, idf))
+        plans.sort(key=lambda plan: plan[0], reverse=True)
+
+        remaining = sum(plan[0] for plan in plans)
+        scores: Dict[int, float] = {}
+        admit = True  # 新しい文書を候補に加えるか
+        scanned = probed = pruned = 0
+        essential = 0
+
+        for bound, term, matched, idf in plans:
+            remaining -= bound
+            if admit:
+                essential += 1
+                scanned += sum(len(m) for m in matched)
+                docs = chain.from_iterable(m.items() for m in matched)
+            else:
+                # 非必須の語: 既存候補の一致だけを引く
+                probed += len(scores)
+                docs = [(doc, m[doc]) for doc in scores for m in matched if doc in m]
+
+            for doc, mask in docs:
+                score = scores.get(doc)
+                if score is None:
+                    # 優先度による補正（一致した文書のみ）
+                    score = entries[doc].priority_boost
+                if bm25f:
+                    tf = bm25f_tf(doc, term, mask)
+                    score += idf * tf * (BM25_K1 + 1.0) / (BM25_K1 + tf)
+                else:
+                    for field_bit, weight in FIELD_WEIGHTS:
+                        if mask & field_bit:
+                            score += weight
+                scores[doc] = score
+
+            if not top_k or len(scores) < top_k or remaining <= 0.0:
+                continue
+            # 暫定 top_k 位のスコア（以降の加点で下がることはない）
+            threshold = heapq.nlargest(top_k, scores.values())[-1]
+            if admit and remaining + index.max_priority_boost < threshold:
+                admit = False
+            if not admit:
+                # 残りの語をすべて加えても届かない候補を捨てる
+                before = len(scores)
+                scores = {doc: score for doc, score in scores.items() if score + remaining >= threshold}
+                pruned += before - len(scores)
+
+        if top_k:
+            logger.debug(
+                f"Search pruning: terms={len(plans)} essential={essential} "
+                f"scanned={scanned} probed={probed} pruned={pruned} candidates={len(scores)}"
+            )
+        return scores
+
     def search(
-        self, 
-        query: str, 
+        self,
+        query: str,
         screen_id: str = None,
         max_results: int = None
     ) -> List[Dict[str, Any]]:
         """
         検索実行
-        
+
         Args:
             query: 検索クエリ
             screen_id: 絞り込み用画面ID（省略時は全画面）
             max_results: 最大結果数
-        
+
         Returns:
             スコア順のコンテンツリスト（id, title, snippet, score）
         """
         self._ensure_initialized()
-        
+
         if max_results is None:
             max_results = config.SEARCH_MAX_RESULTS
-        
+
         # クエリが短すぎる
         if len(query.strip()) < config.SEARCH_MIN_QUERY_LEN:
             return []
-        
+
+        # リクエスト中は同じスナップショットの状態を使う
+        state = self._state()
+
+        cache_key = (normalize_text(query), screen_id or None, max_results)
+        if self.cache is not None:
+            cached = self.cache.get(state, cache_key)
+            if cached is not None:
+                logger.info(f"Search '{query}' -> {len(cached)} results (cached)")
+                return cached
+
         # トークン化 & シノニム展開
-        tokens = self._tokenize(query)
-        tokens = self._expand_synonyms(tokens)
-        
-        if not tokens:
+        tokens = self._tokenize(state, query)
+        terms = self._to_terms(state, tokens)
+
+        if not terms:
             return []
-        
+
         # スコア計算
-        scored: List[Tuple[float, str, Dict[str, Any]]] = []
-        
-        for item_id, item in content_repo.get_all_contents().items():
-            # 画面フィルタ
-            item_screens = item.get("screens", [])
-            if screen_id and item_screens and screen_id not in item_screens:
-                continue
-            
-            score = self._score_item(item, tokens)
-            if score > 0:
-                scored.append((score, item_id, item))
-        
-        # スコア降順でソート
-        scored.sort(key=lambda x: x[0], reverse=True)
-        
+        index = state.index
+        scores = self._score(state, terms, screen_id, max_results if self.prune else None)
+
+        # 上位 max_results 件だけをヒープで選ぶ（スコア降順、同点は登録順）
+        top = heapq.nlargest(max_results, ((score, -doc) for doc, score in scores.items()))
+
         # 結果整形
         results = []
-        for score, item_id, item in scored[:max_results]:
-            body = item.get("body", "")
-            snippet = body[:80] + "..." if len(body) > 80 else body
+        for score, neg_doc in top:
+            entry = index.entries[-neg_doc]
             results.append({
-                "id": item_id,
-                "title": item["title"],
-                "snippet": snippet,
+                "id": entry.id,
+                "title": entry.title,
+                "snippet": entry.snippet,
                 "score": round(score, 2)
             })
-        
+
+        if self.cache is not None:
+            self.cache.put(state, cache_key, results)
         logger.info(f"Search '{query}' -> {len(results)} results")
         return results
 
@@ -1,114 +1,641 @@
 # セッション管理
-# インメモリ実装（将来Redis等に差し替え可能）
+# バックエンドは config.SESSION_BACKEND で切り替え（memory / redis / token）
 
+import base64
+import hashlib
+import heapq
+import hmac
+import json
+import logging
+import struct
 import uuid
 import time
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional
-from threading import Lock
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from threading import Event, Lock, Thread
 
 from config import config
+from states import StateTable, state_tables
+
+logger = logging.getLogger(__name__)
 
 
-@dataclass
 class Session:
-    """セッションデータ"""
-    session_id: str
-    screen_id: str
-    current_state: str
-    history: List[str] = field(default_factory=list)
-    created_at: float = field(default_factory=time.time)
-    last_activity: float = field(default_factory=time.time)
-    
+    """
+    セッションデータ
+
+    状態は StateTable の ID で持ち、ID が属する世代を table で参照する。
+    状態文字列が必要な箇所は current_state / history_states() を使う。
+    状態テーブルの世代が切り替わったら adopt() で現行世代に移し替える。
+
+    メモリを抑えるため __slots__ とし、作成・最終アクティビティ時刻と履歴を
+    1 本の array('H') に詰める:
+        [0:8]  created_at, last_activity（float64 × 2）
+        [8:]   履歴のリングバッファ（容量 config.MAX_HISTORY、_head から _size 件）
+    履歴が上限に達したら最古の位置を上書きする（リストの切り詰めによる再確保なし）。
+    """
+
+    __slots__ = ("session_id", "screen_id", "tenant_id", "table", "current_id", "_buf", "_head", "_size")
+
+    # 時刻（float64 × 2）が占める array('H') の要素数
+    _STAMPS = struct.Struct("=dd")
+    _LAST_ACTIVITY = struct.Struct("=d")
+    _RING = _STAMPS.size // array("H").itemsize
+
+    def __init__(
+        self,
+        session_id: str,
+        screen_id: str,
+        current_id: int,
+        history: Iterable[int] = (),
+        created_at: float = None,
+        last_activity: float = None,
+        tenant_id: str = None,
+        table: StateTable = None,
+    ):
+        self.session_id = session_id
+        self.screen_id = screen_id
+        # セッションを開始したテナント（/step はこのテナントのコンテンツで処理する）
+        self.tenant_id = tenant_id or config.DEFAULT_TENANT
+        # current_id・履歴の ID が属する状態テーブルの世代
+        self.table = table or state_tables.current
+        self.current_id = current_id
+        now = time.time()
+        self._buf = array("H", bytes(self._STAMPS.size + 2 * max(0, config.MAX_HISTORY)))
+        self._STAMPS.pack_into(
+            self._buf, 0,
+            now if created_at is None else created_at,
+            now if last_activity is None else last_activity,
+        )
+        self._head = 0
+        self._size = 0
+        for sid in history:
+            self._append(sid)
+
+    def __repr__(self) -> str:
+        return (f"Session(session_id={self.session_id!r}, screen_id={self.screen_id!r}, "
+                f"current_state={self.current_state!r}, history={self.history_states()!r}, "
+                f"tenant_id={self.tenant_id!r})")
+
+    # === 時刻 ===
+
+    @property
+    def created_at(self) -> float:
+        return self._STAMPS.unpack_from(self._buf)[0]
+
+    @property
+    def last_activity(self) -> float:
+        return self._LAST_ACTIVITY.unpack_from(self._buf, self._LAST_ACTIVITY.size)[0]
+
+    @last_activity.setter
+    def last_activity(self, value: float) -> None:
+        self._LAST_ACTIVITY.pack_into(self._buf, self._LAST_ACTIVITY.size, value)
+
+    # === 状態・履歴 ===
+
+    @property
+    def current_state(self) -> str:
+        return self.table.names[self.current_id]
+
+    def history_ids(self) -> List[int]:
+        """履歴（状態 ID、古い順）"""
+        buf, ring, capacity = self._buf, self._RING, len(self._buf) - self._RING
+        return [buf[ring + (self._head + i) % capacity] for i in range(self._size)]
+
+    def history_states(self) -> List[str]:
+        """履歴（状態文字列、古い順）"""
+        names = self.table.names
+        return [names[sid] for sid in self.history_ids()]
+
+    def _append(self, sid: int) -> None:
+        capacity = len(self._buf) - self._RING
+        if not capacity:
+            return
+        if self._size < capacity:
+            self._buf[self._RING + (self._head + self._size) % capacity] = sid
+            self._size += 1
+        else:
+            # 満杯 → 最古の位置を上書きして先頭を進める
+            self._buf[self._RING + self._head] = sid
+            self._head = (self._head + 1) % capacity
+
     def is_expired(self) -> bool:
         return time.time() - self.last_activity > config.SESSION_TTL
-    
+
     def touch(self) -> None:
         """アクティビティ更新"""
         self.last_activity = time.time()
-    
+
+    def push_id(self, sid: int) -> None:
+        """履歴に現在の状態を追加して遷移（状態 ID 指定）"""
+        if self.current_id:
+            # 最大履歴数を超えたら古いものから上書き
+            self._append(self.current_id)
+        self.current_id = sid
+        self.touch()
+
+    def intern_state(self, state_id: str) -> Optional[int]:
+        """
+        状態の ID（未登録なら登録）
+
+        旧世代のテーブルが満杯なら現行世代に移ってから登録する。
+        それでも登録できなければ None。
+        """
+        sid = self.table.intern(state_id)
+        if sid is None and self.table is not state_tables.current:
+            self.adopt(state_tables.current)
+            sid = self.table.intern(state_id)
+        return sid
+
+    def adopt(self, table: StateTable) -> None:
+        """
+        状態テーブルの別世代に ID を移し替える
+
+        移し先で登録できない状態は履歴から除き、現在の状態ならホームにする。
+        """
+        if table is self.table:
+            return
+        names = self.table.names
+        history = [table.resolve(names[sid]) for sid in self.history_ids()]
+        current_id = table.resolve(names[self.current_id])
+        if current_id is None:
+            current_id = table.intern(f"home:{self.screen_id}") or 0
+        self.table = table
+        self._head = 0
+        self._size = 0
+        for sid in history:
+            if sid is not None:
+                self._append(sid)
+        self.current_id = current_id
+
     def push_state(self, state_id: str) -> None:
-        """履歴に現在の状態を追加して遷移"""
-        if self.current_state:
-            self.history.append(self.current_state)
-            # 最大履歴数を超えたら古いものを削除
-            if len(self.history) > config.MAX_HISTORY:
-                self.history = self.history[-config.MAX_HISTORY:]
-        self.current_state = state_id
+        """履歴に現在の状態を追加して遷移（状態を登録できなければ遷移しない）"""
+        sid = self.intern_state(state_id)
+        if sid is None:
+            logger.warning(f"State not registered, transition dropped: {state_id}")
+            return
+        self.push_id(sid)
+
+    def pop_id(self) -> Optional[int]:
+        """履歴から1つ戻る（戻り先の状態 ID）"""
+        if not self._size:
+            return None
+        self._size -= 1
+        capacity = len(self._buf) - self._RING
+        prev = self._buf[self._RING + (self._head + self._size) % capacity]
+        self.current_id = prev
         self.touch()
-    
+        return prev
+
     def pop_state(self) -> Optional[str]:
         """履歴から1つ戻る"""
-        if self.history:
-            prev = self.history.pop()
-            self.current_state = prev
-            self.touch()
-            return prev
-        return None
-    
+        prev = self.pop_id()
+        return None if prev is None else self.table.names[prev]
+
     def reset_to_home(self) -> str:
         """ホームにリセット"""
         home_state = f"home:{self.screen_id}"
-        self.history.clear()
-        self.current_state = home_state
+        self._head = 0
+        self._size = 0
+        # 登録できなければ空の状態（ID 0。ホームの応答は screen_id から作る）
+        self.current_id = self.intern_state(home_state) or 0
         self.touch()
         return home_state
 
+    def to_dict(self) -> Dict[str, Any]:
+        """外部ストア保存用の辞書表現（状態 ID はプロセス内でのみ有効なため文字列で保存）"""
+        return {
+            "session_id": self.session_id,
+            "screen_id": self.screen_id,
+            "current_state": self.current_state,
+            "history": self.history_states(),
+            "created_at": self.created_at,
+            "last_activity": self.last_activity,
+            "tenant_id": self.tenant_id,
+        }
 
-class SessionStore:
-    """セッションストア（インメモリ実装）"""
-    
-    def __init__(self):
-        self._sessions: Dict[str, Session] = {}
-        self._lock = Lock()
-    
-    def create(self, screen_id: str) -> Session:
-        """新規セッション作成"""
-        session_id = str(uuid.uuid4())
-        initial_state = f"home:{screen_id}"
-        
-        session = Session(
+    @classmethod
+    def restore(
+        cls,
+        session_id: str,
+        screen_id: str,
+        current_state: str,
+        history: List[str],
+        created_at: float,
+        last_activity: float,
+        tenant_id: str,
+    ) -> "Session":
+        """状態文字列から復元（登録できない状態はホーム扱い・履歴から除く）"""
+        table = state_tables.current
+        current_id = table.resolve(current_state)
+        if current_id is None:
+            current_id = table.intern(f"home:{screen_id}") or 0
+        ids = []
+        for state_id in history:
+            sid = table.resolve(state_id)
+            if sid is not None:
+                ids.append(sid)
+        return cls(
             session_id=session_id,
             screen_id=screen_id,
-            current_state=initial_state,
-            history=[]
+            current_id=current_id,
+            history=ids,
+            created_at=created_at,
+            last_activity=last_activity,
+            tenant_id=tenant_id,
+            table=table,
         )
-        
-        with self._lock:
-            self._sessions[session_id] = session
-        
-        return session
-    
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Session":
+        return cls.restore(
+            session_id=data["session_id"],
+            screen_id=data["screen_id"],
+            current_state=data["current_state"],
+            history=data.get("history", []),
+            created_at=data.get("created_at", time.time()),
+            last_activity=data.get("last_activity", time.time()),
+            tenant_id=data.get("tenant_id", config.DEFAULT_TENANT),
+        )
+
+
+class SessionStore(ABC):
+    """
+    セッションストアのインターフェース
+
+    ChatEngine は get() で取得したセッションを書き換えた後、
+    必ず save() を呼ぶこと（外部ストアでは書き戻しが必要なため）。
+    """
+
+    def _new_session(self, screen_id: str, tenant_id: str = None) -> Session:
+        table = state_tables.current
+        return Session(
+            session_id=str(uuid.uuid4()),
+            screen_id=screen_id,
+            current_id=table.intern(f"home:{screen_id}") or 0,
+            tenant_id=tenant_id or config.DEFAULT_TENANT,
+            table=table,
+        )
+
+    @abstractmethod
+    def create(self, screen_id: str, tenant_id: str = None) -> Session:
+        """新規セッション作成"""
+
+    @abstractmethod
     def get(self, session_id: str) -> Optional[Session]:
-        """セッション取得"""
-        with self._lock:
-            session = self._sessions.get(session_id)
-            if session and session.is_expired():
-                del self._sessions[session_id]
+        """セッション取得（期限切れ・存在しない場合は None）"""
+
+    @abstractmethod
+    def save(self, session: Session) -> None:
+        """変更したセッションを書き戻す"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """セッション削除"""
+
+    def cleanup_expired(self) -> int:
+        """期限切れセッションを削除（ストア側で失効する場合は何もしない）"""
+        return 0
+
+    def start_sweeper(self, interval: float = None) -> None:
+        """期限切れ掃除のバックグラウンド実行を開始（不要なストアでは何もしない）"""
+
+    def stop_sweeper(self) -> None:
+        """バックグラウンド掃除を停止"""
+
+
+class _SessionShard:
+    """InMemorySessionStore の 1 区画（専用ロック・LRU・失効 heap を持つ）"""
+
+    # 追い出し・削除済みの heap 要素がこれ未満なら作り直さない（小さい区画での作り直し連発を防ぐ）
+    HEAP_COMPACT_MIN = 64
+
+    __slots__ = ("sessions", "expiry_heap", "lock", "max_sessions", "ttl")
+
+    def __init__(self, max_sessions: int, ttl: int):
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.expiry_heap: List[Tuple[float, str]] = []
+        self.lock = Lock()
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+
+    def is_expired(self, session: Session, now: float) -> bool:
+        # heap の失効予定時刻と同じ基準で判定する（再登録の無限ループ防止）
+        return session.last_activity + self.ttl <= now
+
+    def add(self, session: Session) -> None:
+        with self.lock:
+            self.sessions[session.session_id] = session
+            heapq.heappush(self.expiry_heap, (session.last_activity + self.ttl, session.session_id))
+            # 上限超過分は LRU で追い出す
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+            self._compact_heap()
+
+    def _compact_heap(self) -> None:
+        """
+        追い出し・削除で heap に残った要素が生存セッションの 2 倍を超えたら、
+        生存セッションから作り直す（lock を持って呼ぶ。償却 O(1)）
+
+        追い出したセッションの要素は失効予定時刻まで残るため、これがないと
+        heap が /start の頻度 × SESSION_TTL に比例して伸びる。
+        """
+        if len(self.expiry_heap) <= max(2 * len(self.sessions), self.HEAP_COMPACT_MIN):
+            return
+        self.expiry_heap = [
+            (session.last_activity + self.ttl, sid) for sid, session in self.sessions.items()
+        ]
+        heapq.heapify(self.expiry_heap)
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
                 return None
+            if self.is_expired(session, time.time()):
+                del self.sessions[session_id]
+                return None
+            self.sessions.move_to_end(session_id)
             return session
-    
+
+    def delete(self, session_id: str) -> bool:
+        with self.lock:
+            deleted = self.sessions.pop(session_id, None) is not None
+            self._compact_heap()
+            return deleted
+
+    def sweep(self, batch: int) -> Tuple[int, bool]:
+        """
+        失効予定時刻を過ぎた heap 先頭を最大 batch 件処理する
+
+        Returns:
+            (削除件数, 期限切れが残っていないか)
+        """
+        count = 0
+        with self.lock:
+            now = time.time()
+            processed = 0
+            heap = self.expiry_heap
+            while heap and heap[0][0] <= now and processed < batch:
+                _, sid = heapq.heappop(heap)
+                processed += 1
+                session = self.sessions.get(sid)
+                if session is None:
+                    # 削除・追い出し済み
+                    continue
+                if self.is_expired(session, now):
+                    del self.sessions[sid]
+                    count += 1
+                else:
+                    # アクセスで延長済み → 新しい失効予定で再登録
+                    heapq.heappush(heap, (session.last_activity + self.ttl, sid))
+            return count, not heap or heap[0][0] > now
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    セッションストア（インメモリ実装・単一プロセス向け）
+
+    - session_id のハッシュで shards 個の区画に分け、区画ごとにロックを持つ
+      （スレッド実行のサーバーで別セッションへの /step が互いに待たない）
+    - 期限切れは区画ごとの失効予定時刻 min-heap で管理し、掃除は期限切れ分だけ処理する
+      （touch() で延長されたセッションは取り出した時点で再登録する）
+    - 区画内のセッション数が上限（max_sessions / shards）を超えたら
+      最も古く使われたものから追い出す（LRU）
+    """
+
+    # 掃除 1 回でロックを保持したまま処理する最大件数
+    SWEEP_BATCH = 1000
+
+    def __init__(self, max_sessions: int = None, ttl: int = None, shards: int = None):
+        max_sessions = max_sessions or config.SESSION_MAX_COUNT
+        ttl = ttl or config.SESSION_TTL
+        shards = max(1, shards or config.SESSION_SHARDS)
+        per_shard = max(1, -(-max_sessions // shards))
+        self._shards = [_SessionShard(per_shard, ttl) for _ in range(shards)]
+        self._sweeper: Optional[Thread] = None
+        self._sweeper_stop = Event()
+
+    def _shard(self, session_id: str) -> _SessionShard:
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def create(self, screen_id: str, tenant_id: str = None) -> Session:
+        """新規セッション作成"""
+        session = self._new_session(screen_id, tenant_id)
+        self._shard(session.session_id).add(session)
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """セッション取得"""
+        return self._shard(session_id).get(session_id)
+
+    def save(self, session: Session) -> None:
+        """同一オブジェクトを保持しているため書き戻し不要"""
+
     def delete(self, session_id: str) -> bool:
         """セッション削除"""
-        with self._lock:
-            if session_id in self._sessions:
-                del self._sessions[session_id]
-                return True
-            return False
-    
+        return self._shard(session_id).delete(session_id)
+
+    def __len__(self) -> int:
+        return sum(len(shard.sessions) for shard in self._shards)
+
     def cleanup_expired(self) -> int:
-        """期限切れセッションを削除"""
+        """期限切れセッションを削除（区画ごとに失効予定時刻を過ぎた heap 先頭のみ確認）"""
         count = 0
-        with self._lock:
-            expired = [
-                sid for sid, s in self._sessions.items() 
-                if s.is_expired()
-            ]
-            for sid in expired:
-                del self._sessions[sid]
-                count += 1
+        for shard in self._shards:
+            while True:
+                removed, done = shard.sweep(self.SWEEP_BATCH)
+                count += removed
+                if done:
+                    break
         return count
 
+    def start_sweeper(self, interval: float = None) -> None:
+        """期限切れ掃除スレッドを開始"""
+        if self._sweeper and self._sweeper.is_alive():
+            return
+        interval = interval or config.SESSION_SWEEP_INTERVAL
+        self._sweeper_stop.clear()
+        self._sweeper = Thread(
+            target=self._sweep_loop, args=(interval,), name="session-sweeper", daemon=True
+        )
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        """掃除スレッドを停止"""
+        self._sweeper_stop.set()
+        if self._sweeper:
+            self._sweeper.join()
+            self._sweeper = None
+
+    def _sweep_loop(self, interval: float) -> None:
+        while not self._sweeper_stop.wait(interval):
+            try:
+                removed = self.cleanup_expired()
+                if removed:
+                    logger.debug(f"Expired sessions removed: {removed}")
+            except Exception:
+                logger.exception("Session sweep failed")
+
+
+class RedisSessionStore(SessionStore):
+    """
+    セッションストア（Redis 実装・複数ワーカー/複数ホスト向け）
+
+    有効期限は Redis の TTL（SESSION_TTL）に任せ、取得時に TTL を延長する。
+    """
+
+    def __init__(self, client=None, url: str = None, prefix: str = None, ttl: int = None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError(
+                    "SESSION_BACKEND=redis requires the 'redis' package (pip install redis)"
+                ) from e
+            client = redis.Redis.from_url(url or config.REDIS_URL)
+        self._client = client
+        self._prefix = prefix if prefix is not None else config.REDIS_KEY_PREFIX
+        self._ttl = ttl or config.SESSION_TTL
+
+    def _key(self, session_id: str) -> str:
+        return f"{self._prefix}{session_id}"
+
+    def _dump(self, session: Session) -> str:
+        return json.dumps(session.to_dict(), ensure_ascii=False, separators=(",", ":"))
+
+    def create(self, screen_id: str, tenant_id: str = None) -> Session:
+        """新規セッション作成"""
+        session = self._new_session(screen_id, tenant_id)
+        self._client.set(self._key(session.session_id), self._dump(session), ex=self._ttl)
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """セッション取得（GET と TTL 延長を 1 往復で行う）"""
+        key = self._key(session_id)
+        pipe = self._client.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.expire(key, self._ttl)
+        raw, _ = pipe.execute()
+        if raw is None:
+            return None
+        return Session.from_dict(json.loads(raw))
+
+    def save(self, session: Session) -> None:
+        """変更したセッションを書き戻す"""
+        self._client.set(self._key(session.session_id), self._dump(session), ex=self._ttl)
+
+    def delete(self, session_id: str) -> bool:
+        """セッション削除"""
+        return bool(self._client.delete(self._key(session_id)))
+
+
+class TokenSessionStore(SessionStore):
+    """
+    セッションストア（署名付きトークン実装・共有ストレージ不要）
+
+    セッション状態そのものを HMAC 署名付きトークンに詰めて session_id として
+    返すため、どのワーカー / Lambda インスタンスでも検証だけで復元できる。
+    save() のたびに session_id が新しいトークンに置き換わる。
+    有効期限はトークン内の最終アクティビティ時刻で判定する。
+    削除（失効）はできない。
+    """
+
+    # 2: テナント ID を追加
+    FORMAT_VERSION = 2
+    # HMAC-SHA256 を 128bit に切り詰めてトークンを短くする
+    SIGNATURE_BYTES = 16
+
+    def __init__(self, secret: str = None, ttl: int = None):
+        secret = secret if secret is not None else config.SESSION_SECRET
+        if not secret:
+            raise RuntimeError("SESSION_BACKEND=token requires SESSION_SECRET")
+        self._secret = secret.encode("utf-8")
+        self._ttl = ttl or config.SESSION_TTL
+
+    @staticmethod
+    def _b64encode(raw: bytes) -> str:
+        return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+    @staticmethod
+    def _b64decode(text: str) -> bytes:
+        return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+    def _sign(self, payload: str) -> str:
+        digest = hmac.new(self._secret, payload.encode("utf-8"), hashlib.sha256).digest()
+        return self._b64encode(digest[:self.SIGNATURE_BYTES])
+
+    def _encode(self, session: Session) -> str:
+        body = json.dumps([
+            self.FORMAT_VERSION,
+            session.screen_id,
+            session.current_state,
+            session.history_states(),
+            int(session.created_at),
+            int(session.last_activity),
+            session.tenant_id,
+        ], ensure_ascii=False, separators=(",", ":"))
+        payload = self._b64encode(body.encode("utf-8"))
+        return f"{payload}.{self._sign(payload)}"
+
+    def _decode(self, token: str) -> Optional[Session]:
+        # トークンは base64url（ASCII）のみ。それ以外は改ざんとして扱う
+        if not isinstance(token, str) or not token.isascii():
+            return None
+        payload, sep, signature = token.partition(".")
+        if not sep or not hmac.compare_digest(signature.encode("ascii"), self._sign(payload).encode("ascii")):
+            return None
+        try:
+            version, screen_id, current_state, history, created_at, last_activity, tenant_id = \
+                json.loads(self._b64decode(payload))
+        except (ValueError, TypeError):
+            return None
+        if version != self.FORMAT_VERSION:
+            return None
+        if time.time() - last_activity > self._ttl:
+            return None
+        return Session.restore(
+            session_id=token,
+            screen_id=screen_id,
+            current_state=current_state,
+            history=history,
+            created_at=float(created_at),
+            last_activity=float(last_activity),
+            tenant_id=tenant_id,
+        )
+
+    def create(self, screen_id: str, tenant_id: str = None) -> Session:
+        """新規セッション作成（session_id は状態を含むトークン）"""
+        session = self._new_session(screen_id, tenant_id)
+        session.session_id = self._encode(session)
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """トークンを検証して復元（改ざん・期限切れは None）"""
+        return self._decode(session_id)
+
+    def save(self, session: Session) -> None:
+        """現在の状態で新しいトークンを発行"""
+        session.session_id = self._encode(session)
+
+    def delete(self, session_id: str) -> bool:
+        """ステートレスのため失効できない"""
+        return False
+
+
+def create_session_store(backend: str = None) -> SessionStore:
+    """設定に応じたセッションストアを生成"""
+    backend = (backend or config.SESSION_BACKEND).lower()
+    if backend == "redis":
+        return RedisSessionStore()
+    if backend == "token":
+        return TokenSessionStore()
+    if backend == "memory":
+        return InMemorySessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+
 
 # シングルトンインスタンス
-session_store = SessionStore()
+session_store = create_session_store()
@@ -0,0 +1,228 @@
+# 状態テーブル
+# 状態文字列（home:{screen_id} など）に小さな整数 ID を振り、解析済みの記述子を持つ
+# ChatEngine は ID → 記述子の配列引きで振り分け、Session は履歴を array('H') で持つ
+# テーブルは追記のみで、埋まりそうになったらリロード時に新しい世代を作る（StateTables）
+
+import logging
+import weakref
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# === 状態の種別（ChatEngine の振り分け表の添字） ===
+KIND_UNKNOWN = 0
+KIND_HOME = 1      # home:{screen_id}
+KIND_MENU = 2      # menu:{menu_id}
+KIND_CAT = 3       # cat:{category}:{screen_id}
+KIND_ANS = 4       # ans:{content_id}
+KIND_SEARCH = 5    # search:{screen_id}
+KIND_NF = 6        # nf:{screen_id}
+KIND_COUNT = 7
+
+# array('H') に収まる ID の上限
+MAX_STATES = 1 << 16
+
+
+@dataclass(frozen=True, slots=True)
+class StateDescriptor:
+    """解析済みの状態"""
+    state_id: str
+    kind: int
+    # home / search / nf: screen_id、cat: category、ans: content_id、menu: state_id そのもの
+    arg: str = ""
+    # cat のみ
+    screen_id: str = ""
+
+
+def parse_state(state_id: str) -> StateDescriptor:
+    """状態文字列を記述子に変換（従来の startswith / split と同じ規則）"""
+    if state_id.startswith("home:"):
+        return StateDescriptor(state_id, KIND_HOME, state_id[5:])
+    if state_id.startswith("menu:"):
+        return StateDescriptor(state_id, KIND_MENU, state_id)
+    if state_id.startswith("cat:"):
+        parts = state_id.split(":")
+        if len(parts) >= 3:
+            return StateDescriptor(state_id, KIND_CAT, parts[1], parts[2])
+        return StateDescriptor(state_id, KIND_UNKNOWN)
+    if state_id.startswith("ans:"):
+        return StateDescriptor(state_id, KIND_ANS, state_id[4:])
+    if state_id.startswith("search:"):
+        return StateDescriptor(state_id, KIND_SEARCH, state_id[7:])
+    if state_id.startswith("nf:"):
+        return StateDescriptor(state_id, KIND_NF, state_id[3:])
+    return StateDescriptor(state_id, KIND_UNKNOWN)
+
+
+class StateTable:
+    """
+    状態文字列 ⇔ 整数 ID の 1 世代（テナント・リロードをまたいで共有・追記のみ）
+
+    - 世代内では ID は変わらない（セッション履歴が ID を持つため。セッションは
+      自分の ID が属する世代を Session.table で参照する）
+    - コンテンツ中の状態は StateTables.intern_snapshot() でまとめて登録する
+    - リクエスト由来の未知の状態は resolve() で登録するが、dynamic_limit 件まで
+    - 登録できない（上限超過）場合、intern() / resolve() とも例外にせず None を返す。
+      呼び出し側は不明な状態として扱う（履歴に積まない）
+    - 読み取りはロックなし（リストへの追記後に辞書へ登録するため、
+      辞書で見つかった ID は必ず引ける）
+    - ID はプロセス内でのみ有効。外部ストア・トークンには状態文字列で保存する
+    """
+
+    # リクエスト由来で登録できる状態数（コンテンツにない状態でテーブルが埋まるのを防ぐ）
+    DYNAMIC_LIMIT = 4096
+
+    def __init__(self, dynamic_limit: int = None, capacity: int = MAX_STATES):
+        self._ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.descriptors: List[StateDescriptor] = []
+        self._lock = Lock()
+        self._dynamic = 0
+        self.dynamic_limit = self.DYNAMIC_LIMIT if dynamic_limit is None else dynamic_limit
+        self.capacity = min(capacity, MAX_STATES)
+        self._full_logged = False
+        # 状態を登録済みのスナップショット（id → 弱参照。公開済みの derived には書かない）
+        self._snapshots: Dict[int, weakref.ref] = {}
+        # ID 0 は空の状態（Session.push_state で履歴に積まない）
+        self.intern("")
+
+    @property
+    def content_capacity(self) -> int:
+        """コンテンツの状態に使える件数（リクエスト由来の枠を残す）"""
+        return self.capacity - self.dynamic_limit
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def lookup(self, state_id: str) -> Optional[int]:
+        """登録済みなら ID（未登録は None）"""
+        return self._ids.get(state_id)
+
+    def intern(self, state_id: str) -> Optional[int]:
+        """ID を取得（未登録なら登録、テーブルが満杯なら None）"""
+        sid = self._ids.get(state_id)
+        if sid is None:
+            sid = self._add(state_id, dynamic=False)
+        return sid
+
+    def resolve(self, state_id: str) -> Optional[int]:
+        """リクエスト由来の状態の ID（未登録なら上限内で登録、超過時は None）"""
+        sid = self._ids.get(state_id)
+        if sid is None:
+            sid = self._add(state_id, dynamic=True)
+        return sid
+
+    def _add(self, state_id: str, dynamic: bool) -> Optional[int]:
+        with self._lock:
+            sid = self._ids.get(state_id)
+            if sid is not None:
+                return sid
+            if dynamic and self._dynamic >= self.dynamic_limit:
+                return None
+            if len(self.names) >= self.capacity:
+                if not self._full_logged:
+                    self._full_logged = True
+                    logger.error(f"State table is full ({self.capacity} states); "
+                                 f"new states are dropped until the next reload")
+                return None
+            sid = len(self.names)
+            self.descriptors.append(parse_state(state_id))
+            self.names.append(state_id)
+            self._ids[state_id] = sid
+            if dynamic:
+                self._dynamic += 1
+            return sid
+
+    def has_snapshot(self, snapshot) -> bool:
+        """スナップショットの状態を登録済みか"""
+        ref = self._snapshots.get(id(snapshot))
+        return ref is not None and ref() is snapshot
+
+    def _mark_snapshot(self, snapshot) -> None:
+        # 解放済みのスナップショットの分を除いてから記録する（テナント数 × リロード回数で増えないように）
+        self._snapshots = {k: ref for k, ref in self._snapshots.items() if ref() is not None}
+        self._snapshots[id(snapshot)] = weakref.ref(snapshot)
+
+    def name(self, sid: int) -> str:
+        return self.names[sid]
+
+    def describe(self, sid: int) -> StateDescriptor:
+        return self.descriptors[sid]
+
+
+def snapshot_states(snapshot) -> List[str]:
+    """スナップショットに現れる状態（重複なし・登録順）"""
+    states: Dict[str, None] = {}
+    for screen_id in snapshot.get_screen_ids() + ["global"]:
+        states[f"home:{screen_id}"] = None
+        states[f"search:{screen_id}"] = None
+        states[f"nf:{screen_id}"] = None
+    for menu_id, menu in snapshot.get_menus().items():
+        states[menu_id] = None
+        for opt in menu.get("options", []):
+            next_state = opt.get("next_state")
+            if next_state:
+                states[next_state] = None
+    for entry in snapshot.entries:
+        states[f"ans:{entry.id}"] = None
+    return list(states)
+
+
+class StateTables:
+    """
+    現行の StateTable（世代）
+
+    テーブルは追記のみのため、テナントの追加や状態名の変わるリロードが続くと
+    いずれ埋まる。リロードフック（intern_snapshot）で新しいスナップショットの
+    状態が現行世代に収まらなければ、そのスナップショットの状態だけで新しい世代を
+    作って切り替える。
+
+    - 旧世代は、それを参照するセッションがなくなれば解放される
+    - セッションは次の遷移時に Session.adopt() で現行世代に ID を移し替える
+    - 世代を切り替える前に登録したスナップショット（他テナントなど）は、
+      次に状態を引く際に現行世代へ登録し直される
+    """
+
+    def __init__(self, dynamic_limit: int = None, capacity: int = MAX_STATES):
+        self._dynamic_limit = dynamic_limit
+        self._capacity = capacity
+        self._lock = Lock()
+        self.generation = 0
+        self.current = StateTable(dynamic_limit, capacity)
+
+    def intern_snapshot(self, snapshot) -> StateTable:
+        """
+        スナップショットの状態をすべて現行世代に登録（リロードフック・登録済みなら何もしない）
+
+        Returns:
+            登録した世代（現行世代）
+        """
+        table = self.current
+        if table.has_snapshot(snapshot):
+            return table
+        with self._lock:
+            table = self.current
+            if table.has_snapshot(snapshot):
+                return table
+            states = snapshot_states(snapshot)
+            missing = sum(1 for state_id in states if table.lookup(state_id) is None)
+            if missing and len(table) + missing > table.content_capacity:
+                previous = len(table)
+                table = StateTable(self._dynamic_limit, self._capacity)
+                self.current = table
+                self.generation += 1
+                logger.info(f"State table rotated to generation {self.generation} "
+                            f"({previous} states -> {len(states)} live states)")
+            before = len(table)
+            intern = table.intern
+            for state_id in states:
+                intern(state_id)
+            table._mark_snapshot(snapshot)
+        logger.info(f"Interned {len(table) - before} states (total {len(table)})")
+        return table
+
+
+# シングルトンインスタンス（全テナント共通）
+state_tables = StateTables()
@@ -1,19 +1,227 @@
+import argparse
+import hashlib
 import json
+import pickle
 import sys
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
 BASE_DIR = Path(__file__).resolve().parents[1]
-sys.path.append(str(BASE_DIR))
+# バンドルの pickle はモジュール名で型を参照するため、backend 直下として import する
+sys.path.insert(0, str(BASE_DIR / "backend"))
 
-from backend.content_repo import ContentRepository  # noqa: E402
+from config import config  # noqa: E402
+from content_repo import (  # noqa: E402
+    CSV_FILES, CSV_SECTION_SOURCES, OPTIONAL_CSV_FILES,
+    ContentRepository, ContentSnapshot, ContentValidationError,
+    assemble_csv_fragments, build_csv_section, parse_csv_fragment, write_bundle,
+)
+
+OUTPUT_PATH = Path(__file__).parent / "contents.json"
+# --incremental のキャッシュ置き場
+#   index.pickle            CSV ごとのハッシュと、セクションごとの依存ハッシュ、
+#                           最後に書き出した contents.json の (サイズ, ハッシュ)
+#   <csv 名>.pickle          (ハッシュ, パース済み断片)
+#   section.<キー>.pickle    (依存ハッシュ, JSON 文字列)
+# 変更のないファイル・セクションは読み込まない
+CACHE_DIR = Path(__file__).parent / ".compile_cache"
+# 断片の構造を変えたら上げる（古いキャッシュは捨てて全件パース）
+CACHE_FORMAT = 1
+
+
+def dump_json(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, indent=4) + "\n"
+
+
+def build_bundle(repo: ContentRepository, data: dict, output: Path) -> None:
+    """
+    検証済みデータから検索インデックス込みのバンドルを生成
+
+    chat_engine は import 時にセッションストアを作る（SESSION_BACKEND=token では
+    SESSION_SECRET が要る）ため使わない。テンプレートは読み込み時に構築される。
+    """
+    from search import SearchEngine
+
+    repo._validate(data)
+    snapshot = ContentSnapshot.build(data)
+    SearchEngine(repo).prepare(snapshot)
+    size = write_bundle(snapshot, output)
+    print(f"Generated bundle: {output} ({size:,} bytes, version {snapshot.version})")
+
+
+# === 差分コンパイル ===
+
+class CompileCache:
+    """差分コンパイル用のキャッシュ（壊れていれば無視して作り直す）"""
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+        index = self._load("index.pickle")
+        if not isinstance(index, dict) or index.get("format") != CACHE_FORMAT:
+            index = {}
+        self.files: Dict[str, str] = index.get("files", {})
+        self.sections: Dict[str, Tuple] = index.get("sections", {})
+        self.output: Optional[Tuple[int, str]] = index.get("output")
+
+    def _load(self, name: str) -> Any:
+        try:
+            with open(self.cache_dir / name, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    def _store(self, name: str, value: Any) -> None:
+        self.cache_dir.mkdir(exist_ok=True)
+        path = self.cache_dir / name
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        tmp_path.replace(path)
+
+    def _load_checked(self, name: str, key: Any) -> Any:
+        # 本体にもキーを持たせ、index と食い違っていれば使わない
+        entry = self._load(name)
+        if isinstance(entry, tuple) and len(entry) == 2 and entry[0] == key:
+            return entry[1]
+        return None
+
+    def load_fragment(self, filename: str, digest: str) -> Any:
+        return self._load_checked(f"{filename}.pickle", digest)
+
+    def store_fragment(self, filename: str, digest: str, fragment: Any) -> None:
+        self._store(f"{filename}.pickle", (digest, fragment))
+
+    def load_section(self, key: str, deps: Tuple) -> Optional[str]:
+        return self._load_checked(f"section.{key}.pickle", deps)
+
+    def store_section(self, key: str, deps: Tuple, text: str) -> None:
+        self._store(f"section.{key}.pickle", (deps, text))
+
+    def save_index(
+        self, files: Dict[str, str], sections: Dict[str, Tuple], output: Tuple[int, str]
+    ) -> None:
+        self._store("index.pickle", {
+            "format": CACHE_FORMAT, "files": files, "sections": sections, "output": output,
+        })
+
+
+def dump_section(key: str, value: Any) -> str:
+    """トップレベルの 1 セクションを dump_json と同じ書式で出力"""
+    body = json.dumps(value, ensure_ascii=False, indent=4).replace("\n", "\n    ")
+    return f"    {json.dumps(key, ensure_ascii=False)}: {body}"
+
+
+class IncrementalCompiler:
+    """
+    変更された CSV だけをパースし、影響するセクションだけを JSON 化し直す
+
+    変更の判定は CSV の SHA-256。変更のない CSV の断片・セクションの JSON は
+    キャッシュから読み、必要になるまで読み込まない。出力先がキャッシュに記録した
+    最後の出力と異なる場合（全件コンパイル・手での編集）は、CSV に変更がなくても書き直す。
+    """
+
+    def __init__(self, csv_dir: Path, cache_dir: Path):
+        if not csv_dir.exists():
+            raise ContentValidationError(f"CSV directory not found: {csv_dir}")
+        self.csv_dir = csv_dir
+        self.cache = CompileCache(cache_dir)
+        self._raw: Dict[str, bytes] = {}
+        self._fragments: Dict[str, Any] = {}
+        self.digests: Dict[str, str] = {}
+        for filename in CSV_FILES:
+            path = csv_dir / filename
+            if not path.exists():
+                if filename in OPTIONAL_CSV_FILES:
+                    continue
+                raise ContentValidationError(f"CSV file not found: {path}")
+            raw = path.read_bytes()
+            self._raw[filename] = raw
+            self.digests[filename] = hashlib.sha256(raw).hexdigest()
+        self.changed: List[str] = [
+            name for name in CSV_FILES if self.digests.get(name) != self.cache.files.get(name)
+        ]
+        self.rebuilt: List[str] = []
+        self._sections: Dict[str, Tuple] = {}
+
+    def fragment(self, filename: str) -> Any:
+        """断片を取得（変更がなければキャッシュ、あればパースして保存）"""
+        if filename not in self._fragments:
+            digest = self.digests[filename]
+            fragment = None
+            if filename not in self.changed:
+                fragment = self.cache.load_fragment(filename, digest)
+            if fragment is None:
+                fragment = parse_csv_fragment(filename, self._raw[filename])
+                self.cache.store_fragment(filename, digest, fragment)
+            self._fragments[filename] = fragment
+        return self._fragments[filename]
+
+    def _fragments_for(self, sources: Tuple[str, ...]) -> Dict[str, Any]:
+        return {name: self.fragment(name) for name in sources if name in self.digests}
+
+    def data(self) -> Dict[str, Any]:
+        """コンテンツデータ全体（バンドル生成用。全断片を読む）"""
+        return assemble_csv_fragments(self._fragments_for(CSV_FILES))
+
+    def render(self) -> str:
+        """contents.json の文字列（依存 CSV が変わったセクションだけ作り直す）"""
+        sections: Dict[str, Tuple] = {}
+        texts = []
+        for key, sources in CSV_SECTION_SOURCES.items():
+            deps = tuple(self.digests.get(name) for name in sources)
+            text = None
+            if self.cache.sections.get(key) == deps:
+                text = self.cache.load_section(key, deps)
+            if text is None:
+                text = dump_section(key, build_csv_section(key, self._fragments_for(sources)))
+                self.cache.store_section(key, deps, text)
+                self.rebuilt.append(key)
+            sections[key] = deps
+            texts.append(text)
+        self._sections = sections
+        return "{\n" + ",\n".join(texts) + "\n}\n"
+
+    def is_up_to_date(self, output: Path) -> bool:
+        """CSV に変更がなく、出力先が最後に書き出した内容のままか"""
+        if self.changed or self.cache.output is None:
+            return False
+        try:
+            raw = output.read_bytes()
+        except OSError:
+            return False
+        return (len(raw), hashlib.sha256(raw).hexdigest()) == tuple(self.cache.output)
+
+    def write(self, output: Path) -> None:
+        """contents.json を書き出し、キャッシュの索引に出力の (サイズ, ハッシュ) も記録"""
+        output.write_text(self.render(), encoding="utf-8")
+        raw = output.read_bytes()
+        self.cache.save_index(self.digests, self._sections, (len(raw), hashlib.sha256(raw).hexdigest()))
 
 
 def main():
+    parser = argparse.ArgumentParser(description="CSV から contents.json（とバンドル）を生成")
+    parser.add_argument("--bundle", nargs="?", const=config.CONTENT_BUNDLE_PATH, default=None,
+                        help="バイナリバンドルも生成する（CONTENT_SOURCE=bundle で使用）")
+    parser.add_argument("--incremental", action="store_true",
+                        help="変更された CSV だけを処理し直す（キャッシュ: contents/.compile_cache/）")
+    args = parser.parse_args()
+
     repo = ContentRepository()
-    data = repo._load_from_csv()
-    output = Path(__file__).parent / "contents.json"
-    output.write_text(json.dumps(data, ensure_ascii=False, indent=4) + "\n", encoding="utf-8")
-    print(f"Generated JSON: {output}")
+    if args.incremental:
+        compiler = IncrementalCompiler(Path(config.CONTENT_CSV_DIR), CACHE_DIR)
+        if compiler.is_up_to_date(OUTPUT_PATH):
+            print(f"Up to date: {OUTPUT_PATH}")
+        else:
+            compiler.write(OUTPUT_PATH)
+            print(f"Generated JSON: {OUTPUT_PATH} (changed: {', '.join(compiler.changed) or '-'}; "
+                  f"rebuilt: {', '.join(compiler.rebuilt) or '-'})")
+        data = compiler.data() if args.bundle else None
+    else:
+        data = repo._load_from_csv()
+        OUTPUT_PATH.write_text(dump_json(data), encoding="utf-8")
+        print(f"Generated JSON: {OUTPUT_PATH}")
+
+    if args.bundle:
+        build_bundle(repo, data, Path(args.bundle))
 
 
 if __name__ == "__main__":
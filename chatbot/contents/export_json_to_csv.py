@@ -1,19 +1,117 @@
 import csv
 import json
+from contextlib import ExitStack
 from pathlib import Path
+from typing import Any, Iterator, Optional, TextIO
 
 
 BASE_DIR = Path(__file__).parent
 CONTENT_JSON = BASE_DIR / "contents.json"
 OUTPUT_DIR = BASE_DIR / "csv"
 
-
-def write_csv(path: Path, fieldnames, rows):
+# JSON を読み進める単位（文字数）
+CHUNK_SIZE = 1 << 16
+
+ITEM_FIELDS = ["id", "title", "body", "category", "screens", "keywords", "priority"]
+LINK_FIELDS = ["content_id", "label", "url", "order"]
+RELATED_FIELDS = ["content_id", "related_id", "order"]
+
+
+class JsonStreamReader:
+    """
+    JSON を先頭から少しずつ読むプルパーサ（全体をメモリに載せない）
+
+    オブジェクトは iter_members() でキーを 1 つずつ取り出し、値は呼び出し側が
+    read_value()（値全体をデコード）か iter_members()（さらに潜る）で読み進める。
+    値のデコードは json.JSONDecoder.raw_decode に任せる。
+    """
+
+    _WHITESPACE = " \t\n\r"
+
+    def __init__(self, f: TextIO, chunk_size: int = CHUNK_SIZE):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self, size: int = None) -> bool:
+        """バッファに読み足す（読み終えた部分は捨てる）。EOF なら False"""
+        if self._eof:
+            return False
+        chunk = self._f.read(size or self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """空白を読み飛ばして次の 1 文字を返す（消費しない）"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in self._WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON")
+
+    def _expect(self, char: str) -> None:
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found!r} at offset {self._pos}")
+        self._pos += 1
+
+    def read_value(self) -> Any:
+        """次の値を 1 つデコードする"""
+        self._peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                # 値がバッファ末尾で切れている → 読み足して最初からデコードし直す
+                if not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # 数値などは途中で切れていてもデコードできてしまうため、末尾ちょうどなら読み足して確認
+            if end == len(self._buf) and self._fill(size):
+                continue
+            self._pos = end
+            return value
+
+    def iter_members(self) -> Iterator[str]:
+        """オブジェクトのキーを順に返す（値は呼び出し側が読む）"""
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self._expect(":")
+            yield key
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("}")
+            return
+
+
+def open_csv(stack: ExitStack, path: Path, fieldnames) -> csv.DictWriter:
     path.parent.mkdir(parents=True, exist_ok=True)
     # Excel対策: UTF-8 with BOM
-    with open(path, "w", encoding="utf-8-sig", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
+    f = stack.enter_context(open(path, "w", encoding="utf-8-sig", newline=""))
+    writer = csv.DictWriter(f, fieldnames=fieldnames)
+    writer.writeheader()
+    return writer
+
+
+def write_csv(path: Path, fieldnames, rows):
+    with ExitStack() as stack:
+        writer = open_csv(stack, path, fieldnames)
         for row in rows:
             writer.writerow(row)
 
@@ -24,99 +122,119 @@ def join_list(values):
     return "|".join(values)
 
 
-def main():
-    data = json.loads(CONTENT_JSON.read_text(encoding="utf-8"))
+def meta_rows(meta):
+    return ({"key": k, "value": v} for k, v in meta.items())
+
 
-    # meta
-    meta_rows = [{"key": k, "value": v} for k, v in data.get("meta", {}).items()]
-    write_csv(OUTPUT_DIR / "meta.csv", ["key", "value"], meta_rows)
+def system_message_rows(messages):
+    return ({"key": k, "value": v} for k, v in messages.items())
 
-    # system_messages
-    sys_rows = [{"key": k, "value": v} for k, v in data.get("system_messages", {}).items()]
-    write_csv(OUTPUT_DIR / "system_messages.csv", ["key", "value"], sys_rows)
 
-    # screens
-    screen_rows = []
-    for screen_id, screen in data.get("screen_registry", {}).items():
-        screen_rows.append({
+def screen_rows(screen_registry):
+    for screen_id, screen in screen_registry.items():
+        yield {
             "screen_id": screen_id,
             "name": screen.get("name", ""),
             "routes": join_list(screen.get("routes", [])),
             "group": screen.get("group", "")
-        })
-    write_csv(OUTPUT_DIR / "screens.csv", ["screen_id", "name", "routes", "group"], screen_rows)
+        }
 
-    # menus
-    menu_rows = []
-    for menu_id, menu in data.get("menus", {}).items():
+
+def menu_rows(menus):
+    for menu_id, menu in menus.items():
         options = menu.get("options", [])
         if not options:
-            menu_rows.append({
+            yield {
                 "menu_id": menu_id,
                 "message": menu.get("message", ""),
                 "option_label": "",
                 "option_next_state": "",
                 "option_order": ""
-            })
+            }
             continue
         for idx, opt in enumerate(options, 1):
-            menu_rows.append({
+            yield {
                 "menu_id": menu_id,
                 "message": menu.get("message", "") if idx == 1 else "",
                 "option_label": opt.get("label", ""),
                 "option_next_state": opt.get("next_state", ""),
                 "option_order": idx
-            })
-    write_csv(
-        OUTPUT_DIR / "menus.csv",
+            }
+
+
+# 小さいセクション: 値ごと読んで書き出す
+SECTIONS = {
+    "meta": ("meta.csv", ["key", "value"], meta_rows),
+    "system_messages": ("system_messages.csv", ["key", "value"], system_message_rows),
+    "screen_registry": ("screens.csv", ["screen_id", "name", "routes", "group"], screen_rows),
+    "menus": (
+        "menus.csv",
         ["menu_id", "message", "option_label", "option_next_state", "option_order"],
         menu_rows
-    )
-
-    # content_items
-    item_rows = []
-    link_rows = []
-    related_rows = []
-    for item_id, item in data.get("content_items", {}).items():
-        item_rows.append({
-            "id": item_id,
-            "title": item.get("title", ""),
-            "body": item.get("body", ""),
-            "category": item.get("category", ""),
-            "screens": join_list(item.get("screens", [])),
-            "keywords": join_list(item.get("keywords", [])),
-            "priority": item.get("priority", 0)
-        })
-        for idx, link in enumerate(item.get("links", []), 1):
-            link_rows.append({
-                "content_id": item_id,
-                "label": link.get("label", ""),
-                "url": link.get("url", ""),
-                "order": idx
-            })
-        for idx, related_id in enumerate(item.get("related", []), 1):
-            related_rows.append({
-                "content_id": item_id,
-                "related_id": related_id,
-                "order": idx
+    ),
+}
+
+
+def export_content_items(reader: Optional[JsonStreamReader], output_dir: Path) -> None:
+    """content_items を 1 件ずつ読み、3 つの CSV に 1 回の走査で書き出す（reader が None ならヘッダのみ）"""
+    with ExitStack() as stack:
+        items = open_csv(stack, output_dir / "content_items.csv", ITEM_FIELDS)
+        links = open_csv(stack, output_dir / "content_links.csv", LINK_FIELDS)
+        related = open_csv(stack, output_dir / "content_related.csv", RELATED_FIELDS)
+        if reader is None:
+            return
+        for item_id in reader.iter_members():
+            item = reader.read_value()
+            items.writerow({
+                "id": item_id,
+                "title": item.get("title", ""),
+                "body": item.get("body", ""),
+                "category": item.get("category", ""),
+                "screens": join_list(item.get("screens", [])),
+                "keywords": join_list(item.get("keywords", [])),
+                "priority": item.get("priority", 0)
             })
+            for idx, link in enumerate(item.get("links", []), 1):
+                links.writerow({
+                    "content_id": item_id,
+                    "label": link.get("label", ""),
+                    "url": link.get("url", ""),
+                    "order": idx
+                })
+            for idx, related_id in enumerate(item.get("related", []), 1):
+                related.writerow({
+                    "content_id": item_id,
+                    "related_id": related_id,
+                    "order": idx
+                })
+
+
+def export(content_json: Path = CONTENT_JSON, output_dir: Path = OUTPUT_DIR) -> None:
+    pending = set(SECTIONS) | {"content_items"}
+    with open(content_json, "r", encoding="utf-8") as f:
+        reader = JsonStreamReader(f)
+        for key in reader.iter_members():
+            if key == "content_items":
+                export_content_items(reader, output_dir)
+            elif key in SECTIONS:
+                filename, fieldnames, rows = SECTIONS[key]
+                write_csv(output_dir / filename, fieldnames, rows(reader.read_value()))
+            else:
+                # search_config など CSV にしないセクション
+                reader.read_value()
+            pending.discard(key)
+
+    # JSON にないセクションもヘッダだけの CSV を出力する
+    for key in pending:
+        if key == "content_items":
+            export_content_items(None, output_dir)
+        else:
+            filename, fieldnames, rows = SECTIONS[key]
+            write_csv(output_dir / filename, fieldnames, rows({}))
 
-    write_csv(
-        OUTPUT_DIR / "content_items.csv",
-        ["id", "title", "body", "category", "screens", "keywords", "priority"],
-        item_rows
-    )
-    write_csv(
-        OUTPUT_DIR / "content_links.csv",
-        ["content_id", "label", "url", "order"],
-        link_rows
-    )
-    write_csv(
-        OUTPUT_DIR / "content_related.csv",
-        ["content_id", "related_id", "order"],
-        related_rows
-    )
 
+def main():
+    export()
     print(f"Exported CSV to: {OUTPUT_DIR}")
 
 
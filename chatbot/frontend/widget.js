@@ -1,6 +1,8 @@
 /**
  * ヘルプチャットボット ウィジェット JavaScript
  * 最小実装: open/close, /start, /step fetch, messages/buttons描画, free_text制御
+ * 静的な遷移（メニュー・コンテンツ表示）は /graph を使ってローカルで処理し、
+ * サーバーには検索などグラフにない操作だけを送る（溜めたローカル遷移は /step/batch で再生）
  * 
  * 使い方:
  *   1. widget.html と widget.css を読み込み
@@ -14,6 +16,8 @@
     // === 設定 ===
     const DEFAULT_CONFIG = {
         apiBase: 'http://127.0.0.1:5001/api/v1/helpchat',
+        // テナント（製品）ID。null なら既定テナント
+        tenantId: null,
         screenResolvers: {
             // パス -> screen_id のマッピング
             '/teleapo': 'teleapo',
@@ -41,6 +45,10 @@
     let currentScreenId = null;
     let isOpen = false;
     let isFreeTextEnabled = false;
+    // 画面内の遷移グラフ（/graph。null ならすべてサーバーで処理）
+    let graph = null;
+    // ローカルで処理し、まだサーバーに送っていないアクション
+    let pendingActions = [];
     let triggerPos = { x: null, y: null };
     let dragState = null;
     let resizeState = null;
@@ -422,6 +430,8 @@
         sessionId = null;
         currentState = null;
         currentScreenId = screenId;
+        graph = null;
+        pendingActions = [];
         if (elements.messages) elements.messages.innerHTML = '';
         if (elements.options) elements.options.innerHTML = '';
         if (elements.input) elements.input.value = '';
@@ -450,7 +460,9 @@
             const res = await fetch(`${config.apiBase}/start`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ screen_id: screenId })
+                body: JSON.stringify(config.tenantId
+                    ? { screen_id: screenId, tenant_id: config.tenantId }
+                    : { screen_id: screenId })
             });
 
             const data = await res.json();
@@ -459,9 +471,11 @@
             if (data.success) {
                 sessionId = data.session_id;
                 currentState = data.state;
+                pendingActions = [];
                 renderMessage(data.message, 'bot');
                 renderOptions(data.options);
                 updateInputMode(data.input_mode);
+                loadGraph(screenId);
             } else {
                 renderMessage(data.error?.message || 'エラーが発生しました', 'bot');
             }
@@ -472,41 +486,101 @@
         }
     }
 
+    async function loadGraph(screenId) {
+        // Cache-Control / ETag によりブラウザのキャッシュから返ることが多い
+        const params = new URLSearchParams({ screen_id: screenId });
+        if (config.tenantId) params.set('tenant_id', config.tenantId);
+        try {
+            const res = await fetch(`${config.apiBase}/graph?${params}`);
+            if (!res.ok) return;
+            const data = await res.json();
+            // 取得中に画面が変わった場合は捨てる
+            if (screenId === currentScreenId) {
+                graph = data;
+            }
+        } catch (err) {
+            console.warn('[HelpChat] Graph load error:', err);
+        }
+    }
+
+    // グラフで処理できる遷移ならローカルで描画して true（サーバーの状態遷移と同じ規則）
+    function tryLocalStep(action, target) {
+        if (!graph || !currentState) return false;
+        // /step/batch の上限に達する前にサーバーへ送る
+        if (pendingActions.length >= graph.max_actions - 1) return false;
+
+        let stateId = currentState.state_id;
+        let history = currentState.history.slice();
+        let node = null;
+
+        if (action === 'navigate' || action === 'show_content') {
+            const next = action === 'show_content' && !target.startsWith('ans:') ? `ans:${target}` : target;
+            node = graph.states[next];
+            if (!node) return false;
+            if (stateId) {
+                history.push(stateId);
+                if (history.length > graph.max_history) {
+                    history.splice(0, history.length - graph.max_history);
+                }
+            }
+            stateId = next;
+        } else if (action === 'back') {
+            if (history.length === 0) {
+                // 履歴がない場合はホームを表示（状態は変わらない）
+                node = graph.states[graph.home];
+            } else {
+                node = graph.states[history[history.length - 1]];
+                if (node) stateId = history.pop();
+            }
+        } else if (action === 'reset') {
+            node = graph.states[graph.home];
+            stateId = graph.home;
+            history = [];
+        }
+        if (!node) return false;
+
+        pendingActions.push({ action: action, target: target });
+        currentState = { state_id: stateId, history: history };
+        renderResponse({ ...node, input_mode: { free_text: false, placeholder: '' } });
+        return true;
+    }
+
     async function step(action, target = '', query = '') {
         if (!sessionId) {
             await startSession();
             return;
         }
 
+        if (tryLocalStep(action, target)) return;
+
         showLoading();
 
         try {
-            const res = await fetch(`${config.apiBase}/step`, {
+            const current = { action: action, target: target, query: query };
+            // ローカル遷移が溜まっていれば一緒に送り、サーバーのセッションを追いつかせる
+            const batch = pendingActions.length > 0;
+            const res = await fetch(`${config.apiBase}/${batch ? 'step/batch' : 'step'}`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    session_id: sessionId,
-                    action: action,
-                    target: target,
-                    query: query
-                })
+                body: JSON.stringify(batch
+                    ? { session_id: sessionId, actions: [...pendingActions, current], final_only: true }
+                    : { session_id: sessionId, ...current })
             });
 
-            const data = await res.json();
+            let data = await res.json();
             hideLoading();
+            if (res.ok) {
+                pendingActions = [];
+            }
+            if (batch && data.responses) {
+                data = data.responses[data.responses.length - 1];
+            }
 
             if (data.success) {
+                // token セッションでは遷移ごとに session_id が更新される
+                sessionId = data.session_id || sessionId;
                 currentState = data.state;
-
-                // コンテンツ表示の場合
-                if (data.content) {
-                    renderContent(data.content);
-                } else if (data.message) {
-                    renderMessage(data.message, 'bot');
-                }
-
-                renderOptions(data.options);
-                updateInputMode(data.input_mode);
+                renderResponse(data);
             } else {
                 // セッション切れ
                 if (res.status === 410) {
@@ -565,6 +639,18 @@
     }
 
     // === 描画 ===
+    function renderResponse(data) {
+        // コンテンツ表示の場合
+        if (data.content) {
+            renderContent(data.content);
+        } else if (data.message) {
+            renderMessage(data.message, 'bot');
+        }
+
+        renderOptions(data.options);
+        updateInputMode(data.input_mode);
+    }
+
     function renderMessage(text, type) {
         if (!text) return;
 
@@ -0,0 +1,179 @@
+# 検索の適合性・レイテンシのベンチマーク
+# 実行: python chatbot/scripts/bench_search.py [--docs 10000] [--queries 500] [--tokenizer whitespace]
+#
+# 合成コーパス（トピックごとの語彙を持つ記事）を生成し、ランキング方式
+# （search_config.ranking）ごとに適合性（P@5 / MRR / nDCG@5）とクエリあたりの
+# レイテンシを比較する。正解は「クエリ語を選んだトピックの記事」。
+# 本文は長さがまちまちで、他トピックの語もノイズとして混ざる。
+# 各ランキングは枝刈りあり（既定）と全件計算（/full）の両方で測り、
+# 上位 5 件が一致することも確認する（diff 列: 結果が異なったクエリ数）。
+
+import argparse
+import itertools
+import math
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parents[1] / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from content_repo import ContentRepository, ContentSnapshot  # noqa: E402
+from search import RANKINGS, TOKENIZER_GRAMS, SearchEngine  # noqa: E402
+
+SCREENS = [f"screen_{i:02d}" for i in range(11)]
+KANA = "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン"
+KANJI = "表示設定画面出力集計期間登録変更削除検索管理権限通知履歴更新候補企業採用面接選考率数値帳票"
+
+TOP_K = 5
+
+
+def _word(rnd: random.Random, used: Set[str]) -> str:
+    while True:
+        pool = KANA if rnd.random() < 0.5 else KANJI
+        word = "".join(rnd.choice(pool) for _ in range(rnd.randint(2, 4)))
+        if word not in used:
+            used.add(word)
+            return word
+
+
+def build_corpus(docs: int, topics: int, seed: int) -> Tuple[Dict[str, Any], Dict[int, List[str]], List[int]]:
+    """
+    合成コーパスを生成
+
+    Returns:
+        (コンテンツデータ, トピック → 語彙, 記事ごとのトピック)
+    """
+    rnd = random.Random(seed)
+    used: Set[str] = set()
+    topic_words = {t: [_word(rnd, used) for _ in range(8)] for t in range(topics)}
+    common = [_word(rnd, used) for _ in range(2000)]
+    # 一般語は Zipf 風に偏らせる
+    common_cum = list(itertools.accumulate(1.0 / (i + 1) for i in range(len(common))))
+
+    items: Dict[str, Any] = {}
+    doc_topics: List[int] = []
+    for i in range(docs):
+        topic = rnd.randrange(topics)
+        words = topic_words[topic]
+        length = int(rnd.lognormvariate(4.5, 0.8)) + 10
+        body_words = rnd.choices(common, cum_weights=common_cum, k=length)
+        for j in range(length):
+            r = rnd.random()
+            if r < 0.04:
+                body_words[j] = rnd.choice(words)
+            elif r < 0.08:
+                # 他トピックの語（長い本文ほど多く混ざるノイズ）
+                body_words[j] = rnd.choice(topic_words[rnd.randrange(topics)])
+        body = "。".join(
+            "".join(body_words[j:j + 8]) for j in range(0, len(body_words), 8)
+        ) + "。"
+        screens = [] if rnd.random() < 0.1 else rnd.sample(SCREENS, rnd.randint(1, 2))
+        items[f"item_{i:05d}"] = {
+            "title": "".join(rnd.sample(words, 2)) + "の" + rnd.choice(common[:200]),
+            "body": body,
+            "category": f"cat_{topic % 20}",
+            "screens": screens,
+            "keywords": rnd.sample(words, 2),
+            "priority": rnd.randint(30, 70),
+        }
+        doc_topics.append(topic)
+
+    data = {
+        "meta": {"version": f"bench-{seed}"},
+        "screen_registry": {s: {"name": s, "routes": [], "group": "bench"} for s in SCREENS},
+        "menus": {},
+        "content_items": items,
+        "system_messages": {},
+        "search_config": {"synonyms": {}, "stopwords": []},
+    }
+    return data, topic_words, doc_topics
+
+
+def make_queries(topic_words: Dict[int, List[str]], count: int, seed: int) -> List[Tuple[str, int]]:
+    """(クエリ, 正解トピック) の並び。1〜2 語"""
+    rnd = random.Random(seed + 1)
+    queries = []
+    for _ in range(count):
+        topic = rnd.randrange(len(topic_words))
+        words = rnd.sample(topic_words[topic], rnd.randint(1, 2))
+        queries.append((" ".join(words), topic))
+    return queries
+
+
+def make_engine(data: Dict[str, Any], tokenizer: str, ranking: str) -> SearchEngine:
+    data = dict(data, search_config=dict(data["search_config"], tokenizer=tokenizer, ranking=ranking))
+    repo = ContentRepository()
+    repo._publish(ContentSnapshot.build(data), None)
+    engine = SearchEngine(repo)
+    # 同じクエリを繰り返し測るため結果キャッシュは使わない
+    engine.cache = None
+    engine.initialize()
+    return engine
+
+
+def evaluate(engine: SearchEngine, queries, doc_topics: List[int], screen: bool) -> Dict[str, Any]:
+    precision, rr, ndcg, latencies, ranked = [], [], [], [], []
+    ideal = sum(1.0 / math.log2(i + 2) for i in range(TOP_K))
+    for query, topic in queries:
+        screen_id = SCREENS[sum(map(ord, query)) % len(SCREENS)] if screen else None
+        started = time.perf_counter()
+        results = engine.search(query, screen_id, TOP_K)
+        latencies.append(time.perf_counter() - started)
+        ranked.append([(r["id"], r["score"]) for r in results])
+        hits = [doc_topics[int(r["id"][5:])] == topic for r in results]
+        precision.append(sum(hits) / TOP_K)
+        rr.append(next((1.0 / (i + 1) for i, hit in enumerate(hits) if hit), 0.0))
+        ndcg.append(sum(1.0 / math.log2(i + 2) for i, hit in enumerate(hits) if hit) / ideal)
+    latencies.sort()
+    return {
+        "p@5": statistics.fmean(precision),
+        "mrr": statistics.fmean(rr),
+        "ndcg@5": statistics.fmean(ndcg),
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "ranked": ranked,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="検索の適合性・レイテンシのベンチマーク")
+    parser.add_argument("--docs", type=int, default=10_000)
+    parser.add_argument("--topics", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--tokenizer", default="whitespace", choices=list(TOKENIZER_GRAMS))
+    parser.add_argument("--rankings", default=",".join(RANKINGS))
+    parser.add_argument("--screen", action="store_true", help="クエリごとに画面で絞り込む")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data, topic_words, doc_topics = build_corpus(args.docs, args.topics, args.seed)
+    queries = make_queries(topic_words, args.queries, args.seed)
+
+    print(f"docs={args.docs} topics={args.topics} queries={args.queries} "
+          f"tokenizer={args.tokenizer} screen={args.screen}")
+    print(f"{'ranking':<14} {'build':>7} {'P@5':>6} {'MRR':>6} {'nDCG@5':>7} "
+          f"{'mean':>8} {'p95':>8} {'diff':>5}  (ms)")
+    for ranking in args.rankings.split(","):
+        started = time.perf_counter()
+        engine = make_engine(data, args.tokenizer, ranking)
+        build = time.perf_counter() - started
+        # 初回の遅延初期化を計測から外す
+        engine.search(queries[0][0])
+        baseline = None
+        for prune in (True, False):
+            engine.prune = prune
+            result = evaluate(engine, queries, doc_topics, args.screen)
+            if baseline is None:
+                baseline = result["ranked"]
+            diff = sum(a != b for a, b in zip(baseline, result["ranked"]))
+            label = ranking if prune else f"{ranking}/full"
+            print(f"{label:<14} {build:>6.1f}s {result['p@5']:>6.3f} {result['mrr']:>6.3f} "
+                  f"{result['ndcg@5']:>7.3f} {result['mean_ms']:>8.2f} {result['p95_ms']:>8.2f} {diff:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# レスポンスシリアライズのベンチマーク
+# 実行: python chatbot/scripts/bench_serialize.py [--iterations N]
+#
+# 典型的な /start・/step レスポンスについて、
+# 旧方式（dataclasses.asdict + jsonify 相当の json.dumps）と
+# 手書き to_dict + json / orjson を bytes/sec で比較する。
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1] / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import models  # noqa: E402
+from chat_engine import chat_engine  # noqa: E402
+
+
+def legacy_to_dict(response: models.ChatResponse) -> dict:
+    """変更前の ChatResponse.to_dict（asdict で再帰コピー）"""
+    result = {
+        "success": response.success,
+        "session_id": response.session_id,
+        "state": asdict(response.state),
+        "message": response.message,
+        "options": [asdict(o) for o in response.options],
+        "input_mode": asdict(response.input_mode),
+    }
+    if response.content:
+        result["content"] = asdict(response.content)
+    if response.screen_info:
+        result["screen_info"] = response.screen_info
+    return result
+
+
+def sample_responses():
+    """典型的なレスポンス（ホーム・カテゴリ・コンテンツ・検索結果）"""
+    start = chat_engine.start_session("yield_personal")
+    sid = start.session_id
+    return {
+        "home": start,
+        "category": chat_engine.step(sid, "navigate", "cat:faq:yield_personal"),
+        "content": chat_engine.step(sid, "show_content", "ans:item_001"),
+        "search": chat_engine.step(sid, "search", query="歩留まり"),
+    }
+
+
+def measure(encode, response, iterations: int):
+    size = len(encode(response))
+    started = time.perf_counter()
+    for _ in range(iterations):
+        encode(response)
+    elapsed = time.perf_counter() - started
+    return size, size * iterations / elapsed, iterations / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="レスポンスシリアライズのベンチマーク")
+    parser.add_argument("--iterations", type=int, default=20_000)
+    args = parser.parse_args()
+
+    encoders = {
+        "asdict+json": lambda r: json.dumps(legacy_to_dict(r)).encode("utf-8"),
+        "to_dict+json": lambda r: json.dumps(
+            r.to_dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+    }
+    if models.orjson is not None:
+        encoders["to_dict+orjson"] = lambda r: models.orjson.dumps(r.to_dict())
+
+    print(f"{'response':<10} {'encoder':<16} {'bytes':>7} {'MB/s':>9} {'resp/s':>10}")
+    for name, response in sample_responses().items():
+        for label, encode in encoders.items():
+            size, bps, rps = measure(encode, response, args.iterations)
+            print(f"{name:<10} {label:<16} {size:>7} {bps / 1e6:>9.1f} {rps:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
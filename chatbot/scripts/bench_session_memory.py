@@ -0,0 +1,89 @@
+# セッションのメモリ使用量ベンチマーク
+# 実行: python chatbot/scripts/bench_session_memory.py [--sessions 100000,1000000] [--steps 12]
+#
+# InMemorySessionStore に N 件のセッションを作り、各セッションで steps 回遷移させた
+# （履歴が MAX_HISTORY まで埋まった）状態で、1 セッションあたりのバイト数を表示する。
+#   session: Session オブジェクト本体（時刻・履歴バッファ・session_id 文字列を含む）
+#   store:   ストア全体の増分（区画の辞書・失効 heap を含む）
+# tracemalloc で計測するため、1M 件では数分かかる。
+# 計測前に、LRU 追い出しが続いても失効 heap が上限付近に収まることを確認する。
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1] / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from config import config  # noqa: E402
+from session_store import InMemorySessionStore, Session  # noqa: E402
+
+# 遷移先（状態 ID はプロセス内で共有されるため、種類数はメモリに影響しない）
+STATES = ["menu:bench_a", "menu:bench_b", "cat:faq:bench", "ans:bench_001"]
+
+
+def session_bytes(session: Session) -> int:
+    """Session 1 件が専有するバイト数（共有される状態 ID・画面 ID 等は除く）"""
+    return sys.getsizeof(session) + sys.getsizeof(session._buf) + sys.getsizeof(session.session_id)
+
+
+def check_eviction_heap(creates: int = 200_000, max_sessions: int = 100, shards: int = 4) -> int:
+    """上限を大きく超えて作成した後の失効 heap の要素数（生存セッション数に比例すること）"""
+    store = InMemorySessionStore(max_sessions=max_sessions, ttl=1800, shards=shards)
+    for _ in range(creates):
+        store.create("bench")
+    heap_size = sum(len(shard.expiry_heap) for shard in store._shards)
+    limit = sum(max(2 * len(shard.sessions), shard.HEAP_COMPACT_MIN) for shard in store._shards)
+    assert len(store) <= max_sessions, len(store)
+    assert heap_size <= limit, (heap_size, limit)
+    return heap_size
+
+
+def measure(count: int, steps: int) -> dict:
+    # 区画ごとの上限で追い出されないよう余裕を持たせる
+    store = InMemorySessionStore(max_sessions=count * 2, ttl=config.SESSION_TTL)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    sample = None
+    for i in range(count):
+        session = store.create("bench")
+        for step in range(steps):
+            session.push_state(STATES[(i + step) % len(STATES)])
+        if sample is None:
+            sample = session
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(store) == count
+    return {
+        "store": (after - before) / count,
+        "session": session_bytes(sample),
+        "history": len(sample.history_ids()),
+        "seconds": elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="セッションのメモリ使用量ベンチマーク")
+    parser.add_argument("--sessions", default="100000,1000000", help="カンマ区切りのセッション数")
+    parser.add_argument("--steps", type=int, default=12, help="1 セッションあたりの遷移回数")
+    args = parser.parse_args()
+
+    heap_size = check_eviction_heap()
+    print(f"eviction: 200,000 creates into max_sessions=100 -> heap entries {heap_size:,}")
+    print(f"steps={args.steps} MAX_HISTORY={config.MAX_HISTORY}")
+    print(f"{'sessions':>10} {'session':>9} {'store':>9} {'history':>8} {'build':>8}  (bytes/session)")
+    for count in (int(v) for v in args.sessions.split(",")):
+        result = measure(count, args.steps)
+        print(f"{count:>10,} {result['session']:>9,} {result['store']:>9,.0f} "
+              f"{result['history']:>8} {result['seconds']:>7.1f}s")
+
+
+if __name__ == "__main__":
+    main()
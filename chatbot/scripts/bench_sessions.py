@@ -0,0 +1,82 @@
+# セッションストアの並行ベンチマーク
+# 実行: python chatbot/scripts/bench_sessions.py [--sessions N] [--ops N] [--shards 1,16]
+#
+# /step 相当（get → push_state）を複数スレッドから実行し、
+# 区画数（ロック数）ごとのスループットを比較する。
+
+import argparse
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1] / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from session_store import InMemorySessionStore  # noqa: E402
+
+
+def run(store: InMemorySessionStore, session_ids, threads: int, ops: int) -> float:
+    """threads 本で合計 ops 回の get + push_state を実行し ops/sec を返す"""
+    per_thread = ops // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(seed: int) -> None:
+        rnd = random.Random(seed)
+        ids = [rnd.choice(session_ids) for _ in range(per_thread)]
+        barrier.wait()
+        for sid in ids:
+            session = store.get(sid)
+            if session is not None:
+                session.push_state("menu:bench")
+                store.save(session)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    return per_thread * threads / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="セッションストアの並行ベンチマーク")
+    parser.add_argument("--sessions", type=int, default=50_000)
+    parser.add_argument("--ops", type=int, default=400_000)
+    parser.add_argument("--shards", default="1,16")
+    parser.add_argument("--threads", default="1,2,4,8,16")
+    parser.add_argument("--sweep", action="store_true",
+                        help="計測中に期限切れ掃除を連続実行する")
+    args = parser.parse_args()
+
+    shard_counts = [int(v) for v in args.shards.split(",")]
+    thread_counts = [int(v) for v in args.threads.split(",")]
+
+    print(f"sessions={args.sessions} ops={args.ops} sweep={args.sweep}")
+    print("shards  " + "  ".join(f"{t:>4} thr" for t in thread_counts) + "   (ops/sec)")
+    for shards in shard_counts:
+        store = InMemorySessionStore(max_sessions=args.sessions * 2, shards=shards)
+        session_ids = [store.create("global").session_id for _ in range(args.sessions)]
+
+        stop = threading.Event()
+        sweeper = None
+        if args.sweep:
+            def sweep_loop():
+                while not stop.is_set():
+                    store.cleanup_expired()
+            sweeper = threading.Thread(target=sweep_loop, daemon=True)
+            sweeper.start()
+
+        row = [run(store, session_ids, t, args.ops) for t in thread_counts]
+        stop.set()
+        if sweeper:
+            sweeper.join()
+        print(f"{shards:>6}  " + "  ".join(f"{v:>8,.0f}" for v in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# 状態テーブルの世代切り替えのチェック
+# 実行: python chatbot/scripts/check_state_tables.py
+#
+# 小さな容量の StateTables に状態名の変わるスナップショットを繰り返し登録し、
+# - 例外にならず世代が切り替わること
+# - 旧世代のセッションが adopt() で現行世代に移ること（引けない履歴は捨てる）
+# - 満杯の世代への登録が None になり、push_state が遷移を諦めるだけであること
+# を確認する。
+
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1] / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from session_store import Session  # noqa: E402
+from states import StateTable, StateTables, state_tables  # noqa: E402
+
+CAPACITY = 64
+DYNAMIC_LIMIT = 8
+
+
+class FakeSnapshot:
+    """メニュー ID に版を含むスナップショットもどき（状態の列挙に使う属性だけ持つ）"""
+
+    def __init__(self, version: int, menus: int = 10):
+        self.menu_ids = [f"menu_v{version}_{i}" for i in range(menus)]
+        self.entries = []
+
+    def get_screen_ids(self):
+        return ["top"]
+
+    def get_menus(self):
+        return {menu_id: {"options": []} for menu_id in self.menu_ids}
+
+
+def check_rotation() -> None:
+    tables = StateTables(dynamic_limit=DYNAMIC_LIMIT, capacity=CAPACITY)
+    first = tables.intern_snapshot(FakeSnapshot(0))
+    session = Session("s", "top", first.intern("home:top"), table=first)
+    session.push_state("menu_v0_1")
+    session.push_state("menu_v0_2")
+
+    for version in range(1, 50):
+        snapshot = FakeSnapshot(version)
+        table = tables.intern_snapshot(snapshot)
+        assert len(table) <= table.content_capacity, (version, len(table))
+        # 登録済みのスナップショットは引き直さない（derived を持たないもどきで書き込みがないことも確かめる）
+        size = len(table)
+        assert tables.intern_snapshot(snapshot) is table and len(table) == size
+    assert tables.generation > 0, "世代が切り替わっていない"
+    assert tables.current is not first
+
+    # 旧世代の状態はリクエスト由来の枠で引き継ぐ
+    session.adopt(tables.current)
+    assert session.table is tables.current
+    assert session.current_state == "menu_v0_2", session.current_state
+    assert session.history_states() == ["home:top", "menu_v0_1"], session.history_states()
+
+    # 枠を使い切ると引けない履歴は捨て、現在の状態はホームに戻す
+    stale = Session("t", "top", first.intern("home:top"), table=first)
+    for i in range(DYNAMIC_LIMIT + 2):
+        first.intern(f"stale_{i}")
+        stale.push_state(f"stale_{i}")
+    stale.adopt(tables.current)
+    assert stale.current_state == "home:top", stale.current_state
+    assert len(stale.history_states()) < DYNAMIC_LIMIT + 2
+    print(f"ok: {tables.generation} rotations, {len(tables.current)} states in current table")
+
+
+def check_full_table() -> None:
+    # 現行世代が満杯（移る先がない）場合
+    table = StateTable(dynamic_limit=2, capacity=8)
+    state_tables.current = table
+    session = Session("s", "top", table.intern("home:top"), table=table)
+    for i in range(10):
+        session.push_state(f"menu_{i}")
+    assert len(table) == 8
+    assert table.intern("menu_overflow") is None
+    assert table.resolve("menu_overflow") is None
+    # 満杯以降の遷移は捨てられ、最後に登録できた状態に留まる
+    assert session.current_state == "menu_5", session.current_state
+    print(f"ok: full table returns None ({len(table)} states)")
+
+
+def main() -> None:
+    check_rotation()
+    check_full_table()
+
+
+if __name__ == "__main__":
+    main()
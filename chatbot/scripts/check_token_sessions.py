@@ -0,0 +1,53 @@
+# 署名付きトークンセッションの検証チェック
+# 実行: python chatbot/scripts/check_token_sessions.py
+#
+# 改ざん・非 ASCII・形式不正のトークンが 500 にならず、
+# 期限切れと同じ扱い（TokenSessionStore.get が None、/step が期限切れの応答）になることを確認する。
+
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1] / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("SESSION_BACKEND", "token")
+os.environ.setdefault("SESSION_SECRET", "check-token-sessions")
+
+import handlers  # noqa: E402
+from session_store import TokenSessionStore, session_store  # noqa: E402
+
+
+def main() -> None:
+    handlers.initialize()
+    assert isinstance(session_store, TokenSessionStore), "SESSION_BACKEND=token で実行すること"
+
+    valid = session_store.create("global").session_id
+    payload, _, signature = valid.partition(".")
+    forged = [
+        "a.é",
+        f"{payload}.é",
+        f"{payload}.{signature[:-1]}é",
+        f"{payload}é.{signature}",
+        f"{payload}.{'A' * len(signature)}",
+        f"{payload}.",
+        payload,
+        "\ud800.\ud800",
+        "",
+        12345,
+    ]
+    assert session_store.get(valid) is not None
+    # 期限切れの応答（session_id 以外は同じになる）
+    expired, expired_status = handlers.handle_step({"session_id": "expired", "action": "reset"})
+    assert not expired["success"]
+    for token in forged:
+        assert session_store.get(token) is None, token
+        if token:
+            body, status = handlers.handle_step({"session_id": token, "action": "reset"})
+            assert status == expired_status and dict(body, session_id="expired") == expired, \
+                (token, status, body)
+    print(f"ok: {len(forged)} forged tokens rejected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# ヘルプチャット API の負荷試験
+# 実行例:
+#   python app.py                                # Flask（:5001）
+#   uvicorn asgi:app --port 8000                 # ASGI
+#   python chatbot/scripts/loadtest.py \
+#       --target flask=http://127.0.0.1:5001 --target asgi=http://127.0.0.1:8000 \
+#       --connections 1000 --steps 10
+#
+# 各仮想ユーザーは keep-alive 接続を 1 本保持し、/start の後に /step を繰り返す
+# （ウィジェットの操作を模擬）。asyncio で多数の同時接続を張るため外部依存なし。
+# レスポンスは Content-Length 付きのみ対応（chunked は非対応）。
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+API_PREFIX = "/api/v1/helpchat"
+
+# ウィジェット操作の模擬シナリオ（target / query は画面 yield_personal 前提）
+STEP_SCENARIO = [
+    {"action": "navigate", "target": "cat:faq:yield_personal"},
+    {"action": "show_content", "target": "ans:item_001"},
+    {"action": "back"},
+    {"action": "navigate", "target": "search:yield_personal"},
+    {"action": "search", "query": "歩留まり"},
+    {"action": "reset"},
+]
+
+
+class Connection:
+    """最小限の HTTP/1.1 keep-alive クライアント"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def open(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self) -> None:
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def post(self, path: str, payload: dict) -> Tuple[int, dict]:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode("ascii")
+        self.writer.write(head + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed")
+        status = int(status_line.split()[1])
+        length = None
+        close = False
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value.strip())
+            elif name == "connection" and value.strip().lower() == "close":
+                close = True
+            elif name == "transfer-encoding":
+                raise ValueError("chunked responses are not supported")
+        if length is None:
+            raise ValueError("response without Content-Length")
+        data = json.loads(await self.reader.readexactly(length))
+        if close:
+            # サーバーが keep-alive しない場合（Flask 開発サーバー等）は張り直す
+            await self.close()
+            await self.open()
+        return status, data
+
+
+async def virtual_user(host: str, port: int, steps: int, latencies: List[float],
+                       errors: List[str], rnd: random.Random) -> None:
+    conn = Connection(host, port)
+    try:
+        await conn.open()
+        started = time.perf_counter()
+        status, data = await conn.post(f"{API_PREFIX}/start", {"screen_id": "yield_personal"})
+        latencies.append(time.perf_counter() - started)
+        if status != 200:
+            errors.append(f"start {status}")
+            return
+        session_id = data["session_id"]
+        offset = rnd.randrange(len(STEP_SCENARIO))
+        for i in range(steps):
+            req = dict(STEP_SCENARIO[(offset + i) % len(STEP_SCENARIO)], session_id=session_id)
+            started = time.perf_counter()
+            status, data = await conn.post(f"{API_PREFIX}/step", req)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(f"step {status}")
+                return
+            # token セッションでは遷移ごとに session_id が変わる
+            session_id = data.get("session_id", session_id)
+    except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+        errors.append(type(e).__name__)
+    finally:
+        await conn.close()
+
+
+async def run_target(url: str, connections: int, steps: int, ramp: float) -> dict:
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    latencies: List[float] = []
+    errors: List[str] = []
+    rnd = random.Random(0)
+
+    async def delayed(i: int):
+        # 接続開始を ramp 秒に分散させる
+        await asyncio.sleep(ramp * i / max(connections, 1))
+        await virtual_user(host, port, steps, latencies, errors, rnd)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(delayed(i) for i in range(connections)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        if not latencies:
+            return float("nan")
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else float("nan"),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ヘルプチャット API の負荷試験")
+    parser.add_argument("--target", action="append", required=True,
+                        help="name=http://host:port（複数指定で比較）")
+    parser.add_argument("--connections", type=int, default=200, help="同時仮想ユーザー数")
+    parser.add_argument("--steps", type=int, default=10, help="1 ユーザーあたりの /step 回数")
+    parser.add_argument("--ramp", type=float, default=1.0, help="接続開始を分散させる秒数")
+    args = parser.parse_args()
+
+    print(f"connections={args.connections} steps={args.steps}")
+    print(f"{'target':<10} {'requests':>9} {'errors':>7} {'req/s':>9} "
+          f"{'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)")
+    for spec in args.target:
+        name, _, url = spec.partition("=")
+        result = asyncio.run(run_target(url or name, args.connections, args.steps, args.ramp))
+        print(f"{name:<10} {result['requests']:>9} {result['errors']:>7} {result['rps']:>9,.0f} "
+              f"{result['mean_ms']:>8.1f} {result['p50_ms']:>8.1f} "
+              f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()